@@ -0,0 +1,282 @@
+import shutil
+import sys
+import tempfile
+import time
+from anytree import PreOrderIter
+from dotmvw import dotmvw as dm
+from tests.support import Session
+
+# ------------------------------------------------------------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------------------------------------------------------------
+
+
+def build_session(num_pages, nodeclass=dm.SessionNode):
+    return Session(nodeclass).add_pages(num_pages, parts=4, note='Note').pages_root
+
+
+def node_bytes(node):
+    if isinstance(node, dm.StoreNode):
+        return node.store.nbytes() / len(node.store)
+    size = sys.getsizeof(node)
+    if hasattr(node, '__dict__'):
+        size = size + sys.getsizeof(node.__dict__)
+    for name in ('_children', '_NodeMixin__children'):
+        children = getattr(node, name, None)
+        if isinstance(children, list):
+            size = size + sys.getsizeof(children)
+    return size
+
+
+if __name__ == '__main__':
+    # ------------------------------------------------------------------------------------------------------------------
+    # Node memory and construction time: anytree.AnyNode vs SessionNode vs StoreNode (struct-of-arrays)
+    # ------------------------------------------------------------------------------------------------------------------
+
+    for nodeclass in (dm.AnyNode, dm.SessionNode, dm.StoreNode):
+        a = time.time()
+        session = build_session(200, nodeclass)
+        b = time.time()
+        nodes = list(PreOrderIter(session.root))
+        print('%-12s %7d nodes  build %.3f s  %4d bytes/node' % (nodeclass.__name__, len(nodes), b - a,
+                                                                 sum(node_bytes(node) for node in nodes) / len(nodes)))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Building a 300-page session vs loading it from a snapshot
+    # ------------------------------------------------------------------------------------------------------------------
+
+    snapshotdir = tempfile.mkdtemp()
+    for nodeclass in (dm.AnyNode, dm.SessionNode, dm.StoreNode):
+        a = time.time()
+        session = build_session(300, nodeclass)
+        b = time.time()
+        dm.save_snapshot(session, snapshotdir + '/session.snapshot')
+        c = time.time()
+        dm.load_snapshot(snapshotdir + '/session.snapshot', nodeclass)
+        d = time.time()
+        print('%-12s build %.3f s  save %.3f s  load %.3f s' % (nodeclass.__name__, b - a, c - b, d - c))
+    shutil.rmtree(snapshotdir)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Reading a written 3000-page session back with read_mvw
+    # ------------------------------------------------------------------------------------------------------------------
+
+    readdir = tempfile.mkdtemp()
+    size = dm.Write(build_session(3000, dm.StoreNode)).mvw('read.mvw', readdir)['bytes']
+    for nodeclass in (dm.AnyNode, dm.SessionNode, dm.StoreNode):
+        a = time.time()
+        dm.read_mvw(readdir + '/read.mvw', nodeclass)
+        b = time.time()
+        print('read_mvw     %-12s %.1f MB  %.3f s  %.1f MB/s' % (nodeclass.__name__, size / 1e6, b - a,
+                                                                 size / 1e6 / (b - a)))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # One page of the same session: full read_mvw vs page offset index and seek
+    # ------------------------------------------------------------------------------------------------------------------
+
+    a = time.time()
+    dm.index_mvw(readdir + '/read.mvw')
+    b = time.time()
+    index = dm.load_index(readdir + '/read.mvw')
+    c = time.time()
+    dm.read_page(readdir + '/read.mvw', 2121, index)
+    d = time.time()
+    print('index_mvw    %.3f s  load_index %.3f s  read_page %.6f s' % (b - a, c - b, d - c))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Merging the pages of written sessions with merge_mvw, without building trees
+    # ------------------------------------------------------------------------------------------------------------------
+
+    a = time.time()
+    status = dm.merge_mvw([readdir + '/read.mvw'] * 3, 'merged.mvw', readdir)
+    b = time.time()
+    print('merge_mvw    %5d pages  %.1f MB  %.3f s' % (status['pages'], status['bytes'] / 1e6, b - a))
+    shutil.rmtree(readdir)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Per-node emit time of the block registry
+    # ------------------------------------------------------------------------------------------------------------------
+
+    nodes = list(PreOrderIter(build_session(200).root))
+    a = time.time()
+    for node in nodes:
+        dm._get_block(node)
+    b = time.time()
+    print('_get_block   %7d nodes  %.0f ns/node' % (len(nodes), (b - a) / len(nodes) * 1e9))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Write.mvw wall time: quiet and buffered (default) vs one write per line
+    # ------------------------------------------------------------------------------------------------------------------
+
+    writedir = tempfile.mkdtemp()
+    lines_per_page = dm.Write(build_session(1)).mvw('bench.mvw', writedir)['lines']
+    for num_lines in (10000, 100000, 1000000):
+        session = build_session(num_lines // lines_per_page)
+        for buffersize in (1, 65536):
+            a = time.time()
+            status = dm.Write(session).mvw('bench.mvw', writedir, buffersize=buffersize)
+            b = time.time()
+            print('mvw          %7d lines  buffersize %5d  %.3f s' % (status['lines'], buffersize, b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Write.mvw wall time: pages rendered in this process vs in a pool of worker processes
+    # ------------------------------------------------------------------------------------------------------------------
+
+    session = build_session(1000000 // lines_per_page)
+    for workers in (1, 2, 4):
+        a = time.time()
+        status = dm.Write(session).mvw('bench.mvw', writedir, workers=workers)
+        b = time.time()
+        print('mvw          %7d lines  workers %d  %.3f s' % (status['lines'], workers, b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Write.mvw wall time: full render vs re-render of the one page edited since the last write
+    # ------------------------------------------------------------------------------------------------------------------
+
+    writer = dm.Write(session)
+    writer.mvw('bench.mvw', writedir)
+    legends = [node for node in PreOrderIter(session.root) if node.type == 'legendmaxthreshold']
+    for edit in ('full', 'incremental'):
+        if edit == 'full':
+            writer = dm.Write(session)
+        dm._global_callback('legendmaxthreshold', (legends[0], '1.0'))
+        a = time.time()
+        status = writer.mvw('bench.mvw', writedir)
+        b = time.time()
+        print('mvw          %7d lines  %-11s %5d pages rendered  %.3f s' % (status['lines'], edit, status['pages'],
+                                                                          b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Write.mvw wall time: every subtree formatted vs identical subtrees memoized by the RenderCache
+    # ------------------------------------------------------------------------------------------------------------------
+
+    for cache in (0, 4096):
+        writer = dm.Write(session, cache=cache)
+        a = time.time()
+        status = writer.mvw('bench.mvw', writedir)
+        b = time.time()
+        counts = (writer.cache.hits, writer.cache.misses) if writer.cache is not None else (0, 0)
+        print('mvw          %7d lines  cache %4d  %6d hits %6d misses  %.3f s' % ((status['lines'], cache) + counts +
+                                                                                (b - a,)))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Write.mvw wall time: streamed through a buffer vs preallocated and written through an mmap
+    # ------------------------------------------------------------------------------------------------------------------
+
+    for mmap, workers in ((False, 1), (True, 1), (True, 4)):
+        a = time.time()
+        status = dm.Write(session, cache=0).mvw('bench.mvw', writedir, mmap=mmap, workers=workers)
+        b = time.time()
+        print('mvw          %7d lines  mmap %-5s workers %d  %.3f s' % (status['lines'], mmap, workers, b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # One value edited after the write: full Write.mvw vs patch_mvw, same length and longer
+    # ------------------------------------------------------------------------------------------------------------------
+
+    dm._global_callback('legendmaxthreshold', (legends[0], '1.0'))
+    a = time.time()
+    status = dm.Write(session, cache=0).mvw('bench.mvw', writedir, offsets=True)
+    b = time.time()
+    print('mvw          %7d lines  offsets     %.3f s' % (status['lines'], b - a))
+    for value in ('2.0', '2.00001'):  # same length as '1.0', then longer
+        a = time.time()
+        dm.patch_mvw(status['path'], status['offsets'], [(legends[0], value)])
+        b = time.time()
+        print('patch_mvw    %7d lines  %-11s %.4f s' % (status['lines'], value, b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Batch of sessions: Write.mvw in a loop vs Write.mvw_many (render pool and I/O threads)
+    # ------------------------------------------------------------------------------------------------------------------
+
+    sessions = [build_session(20) for _ in range(200)]
+    a = time.time()
+    for i, session in enumerate(sessions):
+        dm.Write(session).mvw('batch%d.mvw' % i, writedir)
+    b = time.time()
+    print('mvw loop     %7d sessions  %.3f s' % (len(sessions), b - a))
+    a = time.time()
+    reports = dm.Write.mvw_many([(session, 'batch%d.mvw' % i, writedir) for i, session in enumerate(sessions)])
+    b = time.time()
+    print('mvw_many     %7d sessions  %.3f s  %d failed' % (len(sessions), b - a,
+                                                             sum(1 for r in reports if r['error'])))
+    shutil.rmtree(writedir)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # 10 edits to each of 1000 legends: one dispatch per edit vs collapsed in a State batch
+    # ------------------------------------------------------------------------------------------------------------------
+
+    legends_state = dm.LegendState()
+    legends_root = dm.Legend(legends_state)
+    contours_root = dm.Contour(dm.ContourState())
+    models = [node for node in PreOrderIter(build_session(1000).root) if node.type == 'model']
+    handles = [legends_root.add_legend(1, contours_root.add_contour(1, model)[0].Root)[0] for model in models]
+    for batch in (False, True):
+        a = time.time()
+        if batch:
+            with legends_state.batch():
+                for i in range(10):
+                    for legend in handles:
+                        legends_state.numcols = (legend.NumCols, str(i))
+        else:
+            for i in range(10):
+                for legend in handles:
+                    legends_state.numcols = (legend.NumCols, str(i))
+        b = time.time()
+        print('numcols      %7d edits  batch %-5s  %.3f s' % (10 * len(handles), batch, b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # DataComponent on 2000 contours: one setter call per node vs one bulk assignment
+    # ------------------------------------------------------------------------------------------------------------------
+
+    for nodeclass in (dm.SessionNode, dm.StoreNode):
+        contours_state = dm.ContourState()
+        contours_root = dm.Contour(contours_state)
+        models = [node for node in PreOrderIter(build_session(2000, nodeclass).root) if node.type == 'model']
+        nodes = [contours_root.add_contour(1, model)[0].DataComponent for model in models]
+        a = time.time()
+        for node in nodes:
+            contours_state.datacomponent = (node, 'Y')
+        b = time.time()
+        contours_state.datacomponent = (nodes, 'Y')
+        c = time.time()
+        print('datacomponent %-12s %5d nodes  loop %.4f s  bulk %.4f s' % (nodeclass.__name__, len(nodes), b - a,
+                                                                             c - b))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # One path in a 2000-page session: full tree walk vs select (first lookup indexes, then repeated)
+    # ------------------------------------------------------------------------------------------------------------------
+
+    session = build_session(2000)
+    a = time.time()
+    found = [node for node in PreOrderIter(session.root) if node.type == 'legend' and
+             node.parent.parent.parent.parent.parent.id == 'page1500']
+    b = time.time()
+    session.select('page[1500]/window[*]/graphic/model/contour[0]/legend')
+    c = time.time()
+    session.select('page[1500]/window[*]/graphic/model/contour[0]/legend')
+    d = time.time()
+    print('select       %7d found  walk %.4f s  first %.6f s  again %.6f s' % (len(found), b - a, c - b, d - c))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # One legend edit after 1000 Legend builders were made against its State: callbacks kept and edit time
+    # ------------------------------------------------------------------------------------------------------------------
+
+    legends_state = dm.LegendState()
+    builders = [dm.Legend(legends_state) for _ in range(1000)]
+    legend = builders[0].add_legend(1, dm.Contour(dm.ContourState()).add_contour(1, models[0])[0].Root)[0]
+    a = time.time()
+    legends_state.numcols = (legend.NumCols, '5')
+    b = time.time()
+    print('numcols      %7d builders  %d callbacks  %.6f s' % (len(builders), len(legends_state._observers_numcols),
+                                                               b - a))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # State objects: construction time and bytes per State
+    # ------------------------------------------------------------------------------------------------------------------
+
+    for stateclass in (dm.WindowState, dm.ContourState, dm.LegendState, dm.NoteState):
+        a = time.time()
+        states = [stateclass() for _ in range(10000)]
+        b = time.time()
+        print('%-12s %7d states  %.3f s  %4d bytes/state' % (stateclass.__name__, len(states), b - a,
+                                                             sys.getsizeof(states[0]) + sys.getsizeof(vars(states[0]))))
@@ -1,366 +1,761 @@
+import binascii
+import bz2
+import gzip
+import itertools
+import marshal
+import mmap
+import multiprocessing
+import os
 import re
+import shutil
+import sys
+import threading
 import time
-from anytree import AnyNode, RenderTree, PreOrderIter
-
-
-def _is_rightest_child(node):
-    if len(node.siblings) > 0:
-        for sibling in node.siblings:
-            rightest = 1
-            if sibling.N > node.N:
-                rightest = 0
-    elif len(node.siblings) == 0 and node.id != 'root':
-        rightest = 1
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
+from string import Formatter
+from anytree import AnyNode, RenderTree
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+try:
+    import lzma
+except ImportError:  # Python 2 has no lzma in the stdlib
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+_COMPRESSIONS = ('gz', 'bz2', 'xz')
+
+
+def _attach(node, root):
+    # stamp a freshly parented node with its level and the next session order index. The level follows from the
+    # parent's and siblings are ordered by N.
+    parent = node.parent
+    if parent.parent is None:
+        node.level = 0
     else:
-        rightest = 0
-
-    return rightest
-
+        node.level = parent.level + 1
+    root.order = root.order + 1
+    node.N = root.order
+    _touch(node)
+    index = _node_index(root, build=False)
+    if index is not None:
+        index.add(node, parent)
 
-def _has_children(node):
-    return bool(len(node.children))
 
+def _touch(node):
+    # bump the revision of the page that holds node, so a Write renders that page again and reuses the text it kept
+    # for all the others. Nodes outside pages (title, file table, palette) are rendered on every write anyway. Called
+    # by the setters and builders; a node changed behind their back goes unnoticed.
+    while node is not None and node.type != 'page':
+        node = node.parent
+    if node is not None:
+        node.rev = getattr(node, 'rev', 0) + 1
 
-def _get_tabs(level):
-    key = {0: '',
-           1: '\t',
-           2: '\t\t',
-           3: '\t\t\t',
-           4: '\t\t\t\t',
-           5: '\t\t\t\t\t',
-           6: '\t\t\t\t\t\t',
-           7: '\t\t\t\t\t\t\t',
-           8: '\t\t\t\t\t\t\t\t',
-           9: '\t\t\t\t\t\t\t\t\t'}
 
-    return key[level]
+_TABS = tuple('\t' * level for level in range(32))
 
 
 def _get_parent(child, parent_type):
-    for node in child.ancestors:
-        if parent_type.lower() in node.id:
+    node = child.parent
+    parent_type = parent_type.lower()
+    while node is not None:
+        if node.type == parent_type:
             return node
+        node = node.parent
+
+
+_STEP = re.compile(r'([a-z_]+|\*)(?:\[(\d+|\*)\])?$')
+
+
+class NodeIndex(object):
+    # The children of nodes by type and by entity number (the number in their id), so select finds a path in a few
+    # dict lookups per step. A node's children are indexed the first time it is looked up, and kept up to date from
+    # then on by _attach as builders add nodes, so only the parts of the tree that are queried are indexed.
+    def __init__(self):
+        self.children = {}  # parent -> {type: its children of that type, in order}
+        self.numbered = {}  # parent -> {(type, entity number): its children of that type and number}
+
+    def add(self, node, parent):
+        types = self.children.get(parent)
+        if types is None:  # not looked up yet
+            return
+        type = node.type
+        types.setdefault(type, []).append(node)
+        num = _entity_num(node.id, type)
+        if num is not None and num >= 0:
+            self.numbered[parent].setdefault((type, num), []).append(node)
+
+    def find(self, parent, type, num=None):
+        # children of parent of that type, only those numbered num if given
+        if parent not in self.children:
+            self.children[parent] = {}
+            self.numbered[parent] = {}
+            for child in parent.children:
+                self.add(child, parent)
+        if num is None:
+            return self.children[parent].get(type, [])
+        return self.numbered[parent].get((type, num), [])
+
+    def select(self, start, path):
+        nodes = [start]
+        for step in path.strip('/').split('/'):
+            found = _STEP.match(step)
+            if found is None:
+                raise ValueError('%r in %r is not type, type[n] or type[*]' % (step, path))
+            type, num = found.groups()
+            num = None if num in (None, '*') else int(num)
+            selected = []
+            for node in nodes:
+                if type != '*':
+                    selected.extend(self.find(node, type, num))
+                elif num is None:
+                    selected.extend(node.children)
+                else:
+                    selected.extend(child for child in node.children if _entity_num(child.id, child.type) == num)
+            nodes = selected
+        return nodes
+
+
+def _node_index(root, build=True):
+    # the NodeIndex of the tree under root, kept on the root (on the SessionStore for StoreNode). Made if there is
+    # none yet and build is True, else None.
+    holder = root.store if root.__class__ is StoreNode else root
+    index = getattr(holder, '_nodeindex', None)
+    if index is None and build:
+        index = holder._nodeindex = NodeIndex()
+    return index
+
+
+def select(start, path):
+    # Nodes below start (a session root, or any node) matching path, a '/'-separated list of steps: type for every
+    # child of that type, type[n] for the ones numbered n in their id (page[3] is page3, the fourth page) and
+    # type[*] or * for all of them, e.g. 'page[3]/window[*]/graphic/model/contour[0]/legend'. Each step is a lookup
+    # in the NodeIndex of the session, which stays up to date as nodes are added. The builders number the entities
+    # of every add_* call from 0, so after two calls under the same parent type[n] finds one node from each.
+    root = start
+    while root.parent is not None:
+        root = root.parent
+    return _node_index(root).select(start, path)
+
+
+_BLOCKS = {}
+_KEYS = {}
+_SIZES = {}
+_PARSERS = {}  # line key -> [(type, block, fields, match)], see read_mvw
+
+
+def _field_getter(field):
+    name, _, index = field.partition('[')
+    if index:
+        return lambda node, name=name, index=int(index[:-1]): getattr(node, name)[index]
+    return attrgetter(name)
+
+
+def _compile_line(template):
+    # '*Layout({data})' -> function(node) returning '*Layout(' + data + ')'. Fields are node attributes, optionally
+    # indexed ({data[0]}); literal braces are doubled as in str.format.
+    fmt = []
+    getters = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        fmt.append(literal.replace('%', '%%'))
+        if field is not None:
+            fmt.append('%s')
+            getters.append(_field_getter(field))
+    fmt = ''.join(fmt)
+
+    if not getters:
+        line = fmt % ()
+        return lambda node: line
+    elif len(getters) == 1:
+        getter = getters[0]
+        return lambda node: fmt % (getter(node),)
+    else:
+        return lambda node: fmt % tuple(getter(node) for getter in getters)
+
+
+def _compile_size(template):
+    # '*Layout({data})' -> function(node) returning the length of the line _compile_line renders, from the lengths of
+    # the literal text and of the fields
+    length = 0
+    getters = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        length = length + len(literal)
+        if field is not None:
+            getters.append(_field_getter(field))
+
+    if not getters:
+        return lambda node: length
+    elif len(getters) == 1:
+        getter = getters[0]
+        return lambda node: length + len(str(getter(node)))
+    else:
+        return lambda node: length + sum(len(str(getter(node))) for getter in getters)
+
+
+def _line_key(line):
+    # what read_mvw looks a line up by: a command up to its opening parenthesis, else the first character
+    if line[:1] == '*':
+        return line[:line.find('(') + 1]
+    return line[:1]
+
+
+def _compile_match(template):
+    # '*Layout({data})' -> function(line) returning the field values a line was rendered from ('2' for '*Layout(2)'),
+    # a list of them for templates with several fields, or None if the line was not rendered from the template
+    parts = list(Formatter().parse(template))
+    fields = [field for _, field, _, _ in parts if field is not None]
+    if not fields:
+        text = ''.join(literal for literal, _, _, _ in parts)
+        return lambda line: [] if line == text else None
+    if len(fields) == 1 and '[' not in fields[0]:
+        split = [field for _, field, _, _ in parts].index(fields[0]) + 1  # escaped braces are parts of their own
+        prefix = ''.join(literal for literal, _, _, _ in parts[:split])
+        suffix = ''.join(literal for literal, _, _, _ in parts[split:])
+        start = len(prefix)
+        end = len(suffix)
+
+        def match(line):
+            if line.startswith(prefix) and line.endswith(suffix) and len(line) >= start + end:
+                return line[start:len(line) - end]
+        return match
+
+    regex = re.compile(''.join(re.escape(literal) + ('(.*)' if field is not None else '')
+                               for literal, field, _, _ in parts) + '$')
+
+    def match(line):
+        found = regex.match(line)
+        if found is not None:
+            return list(found.groups())
+    return match
+
+
+def _template_fields(template):
+    # node attributes a line template reads: '*Name("{data} {page_num}")' -> ['data', 'page_num']
+    return [field.partition('[')[0] for _, field, _, _ in Formatter().parse(template) if field is not None]
+
+
+def _field_key(value):
+    # what a template field adds to a RenderCache key. Strings are used as they are; anything else is keyed by its
+    # class and repr, since values that compare equal (1, 1.0 and True, or tuples of them) render differently.
+    if value.__class__ is str:
+        return value
+    return value.__class__, repr(value)
+
+
+def _key_function(type, fields):
+    # function(node) returning what the lines of a node depend on, for RenderCache: type, level and the template
+    # fields, see _field_key
+    fields = sorted(set(fields))
+    if len(fields) == 1:
+        getter = attrgetter(fields[0])
+
+        def key(node):
+            value = getter(node)
+            return type, node.level, value if value.__class__ is str else _field_key(value)
+        return key
+
+    getters = [attrgetter(field) for field in fields]
+
+    def key(node):
+        values = [type, node.level]
+        for getter in getters:
+            value = getter(node)
+            values.append(value if value.__class__ is str else _field_key(value))
+        return tuple(values)
+    return key
+
+
+def register_block(type, opening, closing=None, indent=True, fields=()):
+    # Register how nodes of a type are written: opening (and, for blocks, closing) line templates, indented by the
+    # node level unless indent is False. opening may also be a function(node) returning the list of lines, in which
+    # case fields names the node attributes it reads.
+    if callable(opening):
+        _BLOCKS[type] = opening
+        _KEYS[type] = _key_function(type, fields)
+        _SIZES[type] = lambda node: sum(len(line) + 1 for line in opening(node))
+        return
 
+    _KEYS[type] = _key_function(type, _template_fields(opening) + _template_fields(closing or ''))
+    key = _line_key(next(Formatter().parse(opening))[0])  # from the literal start of the rendered line
+    if key and '\n' not in opening:
+        fields = [field for _, field, _, _ in Formatter().parse(opening) if field is not None]  # data[0], ...
+        _PARSERS.setdefault(key, []).append((type, closing is not None, fields, _compile_match(opening)))
 
-def _get_block(node):
-    if node.type == 'page':
-        block = ['*BeginPage() // Page ' + node.page_num, '*EndPage()']
-
-    elif node.type == 'sessiontitle':
-        block = [_get_tabs(node.level) + '# Session Title : ' + node.data]
-
-    elif node.type == 'graphics_files':
-        block = ['{ GRAPHIC_FILE_' + str(node.instance) + ' = "' + node.data[node.instance] + '"}']
-
-    elif node.type == 'results_files':
-        block = ['{ RESULT_FILE_' + str(node.instance) + ' = "' + node.data[node.instance] + '"}']
-
-    elif node.type == 'active':
-        block = [_get_tabs(node.level) + '*IsActive()']
-
-    elif node.type == 'name':
-        block = [_get_tabs(node.level) + '*Name("' + node.data + ' ' + node.page_num + '")']
-
-    elif node.type == 'title':
-        block = [_get_tabs(node.level) + '*Title("' + node.data + '", On)']
-
-    elif node.type == 'titlefont':
-        font = node.data
-        block = [_get_tabs(node.level) + '*TitleFont("' + str(font[0]) + \
-                 '", ' + str(font[1]) + ', ' + str(font[2]) + ', ' + str(font[3]) + ')']
-
-    elif node.type == 'layout':
-        block = [_get_tabs(node.level) + '*Layout(' + node.data + ')']
-
-    elif node.type == 'root':
-        block = ['{ safe_quotes_on }' + '\n' + '*Id("' + node.gui + '", "' + str(node.version) + '.*")', '']
-
-    elif node.type == 'palette':
-        block = ['*BeginPalette()', '*EndPalette()']
-
-    elif node.type == 'animator':
-        block = [_get_tabs(node.level) + '*BeginAnimator(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndAnimator()']
-
-    elif node.type == 'window':
-        block = [_get_tabs(node.level) + '*BeginWindow(Animation)         // Window ' + str(node.window_num),
-                 _get_tabs(node.level) + '*EndWindow()']
-
-    elif node.type == 'exportformat':
-        block = [_get_tabs(node.level) + '*ExportFormat("' + node.data + '")']
-
-    elif node.type == 'graphic':
-        block = [_get_tabs(node.level) + '*BeginGraphic()',
-                 _get_tabs(node.level) + '*EndGraphic()']
-
-    elif node.type == 'lightinfo':
-        block = [_get_tabs(node.level) + '*LightInfo(' + node.data + ')']
-
-    elif node.type == 'rotationangle':
-        block = [_get_tabs(node.level) + '*RotationAngle(' + node.data + ')']
-
-    elif node.type == 'model':
-        block = [_get_tabs(node.level) + '*BeginModel({GRAPHIC_FILE_' + str(node.data) + '})',
-                 _get_tabs(node.level) + '*EndModel()']
-
-    elif node.type == 'savedview':
-        block = [_get_tabs(node.level) + '*BeginSavedView("' + str(node.data) + '")',
-                 _get_tabs(node.level) + '*EndSavedView()']
-
-    elif node.type == 'projectiontype':
-        block = [_get_tabs(node.level) + '*ProjectionType("' + node.data + '")']
-
-    elif node.type == 'view':
-        block = [_get_tabs(node.level) + '*View("' + node.data + '")']
-
-    elif node.type == 'clippingregion':
-        block = [_get_tabs(node.level) + '*ClippingRegion("' + node.data + '")']
-
-    elif node.type == 'result':
-        block = [_get_tabs(node.level) + '*BeginResult({RESULT_FILE_' + str(node.data) + '})',
-                 _get_tabs(node.level) + '*EndResult()']
-
-    elif node.type == 'currentposition':
-        block = [_get_tabs(node.level) + '*CurrentPosition(' + node.data + ')']
-
-    elif node.type == 'numbersteps':
-        block = [_get_tabs(node.level) + '*NumberOfSteps(' + node.data + ')']
-
-    elif node.type == 'increment':
-        block = [_get_tabs(node.level) + '*Increment(' + node.data + ')']
-
-    elif node.type == 'colorby':
-        block = [_get_tabs(node.level) + '*ColorBy("' + node.data + '")']
-
-    elif node.type == 'color':
-        block = [_get_tabs(node.level) + '*Color("' + node.data + '")']
-
-    elif node.type == 'gradientcolor':
-        block = [_get_tabs(node.level) + '*GradientColor("' + node.data + '")']
-
-    elif node.type == 'smalldeformation':
-        block = [_get_tabs(node.level) + '*SmallDeformation("' + node.data + '")']
-
-    elif node.type == 'currentsubcase':
-        block = [_get_tabs(node.level) + '*CurrentSubcase(' + node.data + ')']
-
-    elif node.type == 'part':
-        block = [_get_tabs(node.level) + '*BeginPart(' + node.data + ')', _get_tabs(node.level) + '*EndPart()']
-
-    elif node.type == 'attribute':
-        block = [_get_tabs(node.level) + '*Attribute(' + node.data + ')']
-
-    elif node.type == 'contour':
-        block = [_get_tabs(node.level) + '*BeginContour(' + node.data + ')', _get_tabs(node.level) + '*EndContour()']
-
-    elif node.type == 'displayoptions':
-        block = [_get_tabs(node.level) + '*DisplayOptions(' + node.data + ')']
-
-    elif node.type == 'contourselection':
-        block = [_get_tabs(node.level) + '*BeginSelection(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndSelection()']
-
-    elif node.type == 'contourselectionadd':
-        block = [_get_tabs(node.level) + '*Add("' + node.data + '")']
-
-    elif node.type == 'group':
-        block = [_get_tabs(node.level) + '*BeginGroup(' + node.data + ')', _get_tabs(node.level) + '*EndGroup()']
-
-    elif node.type == 'groupselection':
-        block = [_get_tabs(node.level) + '*BeginSelection(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndSelection()']
-
-    elif node.type == 'dimension':
-        block = [_get_tabs(node.level) + '*Add("dimension == ' + node.data + '")']
-
-    elif node.type == 'selection':
-        block = [_get_tabs(node.level) + '*BeginSelection(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndSelection()']
-
-    elif node.type == 'groupselectionadd':
-        block = [_get_tabs(node.level) + '*Add("' + node.data + '")']
-
-    elif node.type == 'resulttype':
-        block = [_get_tabs(node.level) + '*ResultType("' + node.data + '")']
-
-    elif node.type == 'datacomponent':
-        block = [_get_tabs(node.level) + '*DataComponent("' + node.data + '")']
-
-    elif node.type == 'multiplelayers':
-        block = [_get_tabs(node.level) + '*MultipleLayers("' + node.data + '")']
-
-    elif node.type == 'layer':
-        block = [_get_tabs(node.level) + '*Layer("' + node.data + '")']
-
-    elif node.type == 'layerfilter':
-        block = [_get_tabs(node.level) + '*LayerFilter(' + node.data + ')']
-
-    elif node.type == 'complexfilter':
-        block = [_get_tabs(node.level) + '*ComplexFilter("' + node.data + '")']
-
-    elif node.type == 'resolvedinsystem':
-        block = [_get_tabs(node.level) + '*ResolvedInSystem(' + node.data + ')']
-
-    elif node.type == 'averagingmethod':
-        block = [_get_tabs(node.level) + '*AveragingMethod(' + node.data + ')']
-
-    elif node.type == 'averageacrossparts':
-        block = [
-            _get_tabs(node.level) + '*AverageAcrossParts(' + node.data + ')']
-
-    elif node.type == 'showmidsidenoderesults':
-        block = [_get_tabs(node.level) + '*ShowMidsideNodeResults(' + node.data + ')']
-
-    elif node.type == 'featureangleaverage':
-        block = [
-            _get_tabs(node.level) + '*FeatureAngleAverage(' + node.data + ')']
-
-    elif node.type == 'averagecolor':
-        block = [_get_tabs(node.level) + '*AverageColor(' + node.data + ')']
-
-    elif node.type == 'discretecolor':
-        block = [_get_tabs(node.level) + '*DiscreteColor(' + node.data + ')']
-
-    elif node.type == 'legendminthreshold':
-        block = [_get_tabs(node.level) + '*LegendMinThreshold(' + str(node.data) + ')']
-
-    elif node.type == 'legendmaxthreshold':
-        block = [_get_tabs(node.level) + '*LegendMaxThreshold(' + str(node.data) + ')']
-
-    elif node.type == 'legend':
-        block = [_get_tabs(node.level) + '*BeginLegend(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndLegend()']
-
-    elif node.type == 'legendtype':
-        block = [_get_tabs(node.level) + '*LegendType("' + node.data + '")']
-
-    elif node.type == 'numcols':
-        block = [_get_tabs(node.level) + '*NumCols(' + node.data + ')']
-    
-    elif node.type == 'colorrgb':
-        block = [_get_tabs(node.level) + '*ColorRGB(' + node.data + ')']
-
-    elif node.type == 'noresultcolor':
-        block = [_get_tabs(node.level) + '*NoResultColor("' + node.data + '")']
-    
-    elif node.type == 'numbers':
-        block = [_get_tabs(node.level) + '*Numbers(' + node.data + ')']
-    
-    elif node.type == 'showmax':
-        block = [_get_tabs(node.level) + '*ShowMax("' + node.data + '")']
-    
-    elif node.type == 'showmaxlocal':
-        block = [_get_tabs(node.level) + '*ShowMaxLocal("' + node.data + '")']
-
-    elif node.type == 'showmin':
-        block = [_get_tabs(node.level) + '*ShowMin("' + node.data + '")']
-
-    elif node.type == 'showminlocal':
-        block = [_get_tabs(node.level) + '*ShowMinLocal("' + node.data + '")']
-    
-    elif node.type == 'entitylabel':
-        block = [_get_tabs(node.level) + '*EntityLabel("' + node.data + '")']
-    
-    elif node.type == 'showbymodel':
-        block = [_get_tabs(node.level) + '*ShowByModel("' + node.data + '")']
-    
-    elif node.type == 'legendposition':
-        block = [_get_tabs(node.level) + '*LegendPosition("' + node.data + '")']
-        
-    elif node.type == 'backgroundcolor':
-        block = [_get_tabs(node.level) + '*BackGroundColor("' + node.data + '")']
-    
-    elif node.type == 'transparency':
-        block = [_get_tabs(node.level) + '*Transparency("' + node.data + '")']
-    
-    elif node.type == 'filter':
-        block = [_get_tabs(node.level) + '*Filter("' + node.data + '")']
-
-    elif node.type == 'note':
-        block = [_get_tabs(node.level) + '*BeginNote(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndNote()']
-    
-    elif node.type == 'transparent':
-        block = [_get_tabs(node.level) + '*Transparent("' + node.data + '")']
-
-    elif node.type == 'autohide':
-        block = [_get_tabs(node.level) + '*AutoHide("' + node.data + '")']
-    
-    elif node.type == 'anchortoscreen':
-        block = [_get_tabs(node.level) + '*AnchorToScreen("' + node.data + '")']
-    
-    elif node.type == 'fillcolor':
-        block = [_get_tabs(node.level) + '*FillColor(' + node.data + ')']
-    
-    elif node.type == 'textcolor':
-        block = [_get_tabs(node.level) + '*FillColor(' + node.data + ')']
-    
-    elif node.type == 'attach':
-        block = [_get_tabs(node.level) + '*Attach("' + node.data + '")']
-    
-    elif node.type == 'position':
-        block = [_get_tabs(node.level) + '*Position(' + node.data + ')']
-    
-    elif node.type == 'text':
-        block = [_get_tabs(node.level) + '*Text("' + node.data + '")']
-    
-    elif node.type == 'font':
-        block = [_get_tabs(node.level) + '*Font(' + node.data + ')']
-    
-    elif node.type == 'color':
-        block = [_get_tabs(node.level) + '*Color(' + node.data + ')']
-    
-    elif node.type == 'borderwidth':
-        block = [_get_tabs(node.level) + '*BorderWidth(' + node.data + ')']
-    
-    elif node.type == 'shape':
-        block = [_get_tabs(node.level) + '*Shape("' + node.data + '")']
-    
-    elif node.type == 'notealignment':
-        block = [_get_tabs(node.level) + '*NoteAlignment("' + node.data + '")']
-    
-    elif node.type == 'noteanchor':
-        block = [_get_tabs(node.level) + '*NoteAnchor(' + node.data + ')']
-    
-    elif node.type == 'titleflag':
-        block = [_get_tabs(node.level) + '*TitleFlag("' + node.data + '")']
-
-    elif node.type == 'deformed':
-        block = [_get_tabs(node.level) + '*BeginDeformed(' + node.data + ')',
-                 _get_tabs(node.level) + '*EndDeformed()']
-    
-    elif node.type == 'scalemode':
-        block = [_get_tabs(node.level) + '*ScaleMode("' + node.data + '")']
+    open_size = _compile_size(opening)
+    if closing is None:
+        lines = 1
+        size = open_size
+    else:
+        lines = 2
+        close_size = _compile_size(closing)
+        size = lambda node: open_size(node) + close_size(node)
+    if indent:  # every line of the block is followed by a newline
+        _SIZES[type] = lambda node: size(node) + lines * (node.level + 1)
+    else:
+        _SIZES[type] = lambda node: size(node) + lines
 
-    elif node.type == 'scale':
-        block = [_get_tabs(node.level) + '*Scale("' + node.data + '")']
+    open_line = _compile_line(opening)
+    if closing is None:
+        if indent:
+            block = lambda node: [_TABS[node.level] + open_line(node)]
+        else:
+            block = lambda node: [open_line(node)]
+    else:
+        close_line = _compile_line(closing)
+        if indent:
+            block = lambda node: [_TABS[node.level] + open_line(node), _TABS[node.level] + close_line(node)]
+        else:
+            block = lambda node: [open_line(node), close_line(node)]
+    _BLOCKS[type] = block
 
-    elif node.type == 'resolvedinsystem':
-        block = [_get_tabs(node.level) + '*ResolvedInSystem(' + node.data + ')']
 
-    elif node.type == 'undeformedmode':
-        block = [_get_tabs(node.level) + '*UndeformedMode("' + node.data + '")']
+def _file_block(label):
+    def block(node):
+        return ['{ %s_FILE_%s = "%s"}' % (label, node.instance, node.data[node.instance])]
+    return block
 
-    elif node.type == 'undeformedcolor':
-        block = [_get_tabs(node.level) + '*UndeformedColor("' + node.data + '")']
 
-    elif node.type == 'undeformedtracking':
-        block = [_get_tabs(node.level) + '*UndeformedTracking("' + node.data + '")']
-        
+def _get_block(node):
+    return _BLOCKS[node.type](node)
+
+
+def _subtree_size(node):
+    # characters the subtree under node adds to the session text: the lines of every block and a newline after each
+    size = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        size = size + _SIZES[node.type](node)
+        stack.extend(node.children)
+    return size
+
+
+register_block('root', '{{ safe_quotes_on }}\n*Id("{gui}", "{version}.*")', '', indent=False)
+register_block('graphics_files', _file_block('GRAPHIC'), fields=('instance', 'data'))
+register_block('results_files', _file_block('RESULT'), fields=('instance', 'data'))
+register_block('palette', '*BeginPalette()', '*EndPalette()', indent=False)
+register_block('page', '*BeginPage() // Page {page_num}', '*EndPage()', indent=False)
+register_block('sessiontitle', '# Session Title : {data}')
+register_block('active', '*IsActive()')
+register_block('name', '*Name("{data} {page_num}")')
+register_block('title', '*Title("{data}", On)')
+register_block('titlefont', '*TitleFont("{data[0]}", {data[1]}, {data[2]}, {data[3]})')
+register_block('layout', '*Layout({data})')
+register_block('animator', '*BeginAnimator({data})', '*EndAnimator()')
+register_block('currentposition', '*CurrentPosition({data})')
+register_block('numbersteps', '*NumberOfSteps({data})')
+register_block('increment', '*Increment({data})')
+
+register_block('window', '*BeginWindow(Animation)         // Window {window_num}', '*EndWindow()')
+register_block('exportformat', '*ExportFormat("{data}")')
+
+register_block('graphic', '*BeginGraphic()', '*EndGraphic()')
+register_block('lightinfo', '*LightInfo({data})')
+register_block('rotationangle', '*RotationAngle({data})')
+register_block('savedview', '*BeginSavedView("{data}")', '*EndSavedView()')
+register_block('projectiontype', '*ProjectionType("{data}")')
+register_block('view', '*View("{data}")')
+register_block('clippingregion', '*ClippingRegion("{data}")')
+
+register_block('model', '*BeginModel({{GRAPHIC_FILE_{data}}})', '*EndModel()')
+register_block('colorby', '*ColorBy("{data}")')
+register_block('color', '*Color("{data}")')  # model and note colors alike
+register_block('gradientcolor', '*GradientColor("{data}")')
+register_block('smalldeformation', '*SmallDeformation("{data}")')
+register_block('deformed', '*BeginDeformed({data})', '*EndDeformed()')
+register_block('scalemode', '*ScaleMode("{data}")')
+register_block('scale', '*Scale("{data}")')
+register_block('resolvedinsystem', '*ResolvedInSystem({data})')
+register_block('undeformedmode', '*UndeformedMode("{data}")')
+register_block('undeformedcolor', '*UndeformedColor("{data}")')
+register_block('undeformedtracking', '*UndeformedTracking("{data}")')
+
+register_block('result', '*BeginResult({{RESULT_FILE_{data}}})', '*EndResult()')
+register_block('currentsubcase', '*CurrentSubcase({data})')
+
+register_block('part', '*BeginPart({data})', '*EndPart()')
+register_block('attribute', '*Attribute({data})')
+
+register_block('group', '*BeginGroup({data})', '*EndGroup()')
+register_block('groupselection', '*BeginSelection({data})', '*EndSelection()')
+register_block('groupselectionadd', '*Add("{data}")')
+register_block('selection', '*BeginSelection({data})', '*EndSelection()')
+register_block('dimension', '*Add("dimension == {data}")')
+
+register_block('contour', '*BeginContour({data})', '*EndContour()')
+register_block('displayoptions', '*DisplayOptions({data})')
+register_block('contourselection', '*BeginSelection({data})', '*EndSelection()')
+register_block('contourselectionadd', '*Add("{data}")')
+register_block('resulttype', '*ResultType("{data}")')
+register_block('datacomponent', '*DataComponent("{data}")')
+register_block('multiplelayers', '*MultipleLayers("{data}")')
+register_block('layer', '*Layer("{data}")')
+register_block('layerfilter', '*LayerFilter({data})')
+register_block('complexfilter', '*ComplexFilter("{data}")')
+register_block('averagingmethod', '*AveragingMethod({data})')
+register_block('averageacrossparts', '*AverageAcrossParts({data})')
+register_block('showmidsidenoderesults', '*ShowMidsideNodeResults({data})')
+register_block('featureangleaverage', '*FeatureAngleAverage({data})')
+register_block('averagecolor', '*AverageColor({data})')
+register_block('discretecolor', '*DiscreteColor({data})')
+
+register_block('legendminthreshold', '*LegendMinThreshold({data})')
+register_block('legendmaxthreshold', '*LegendMaxThreshold({data})')
+register_block('legend', '*BeginLegend({data})', '*EndLegend()')
+register_block('legendtype', '*LegendType("{data}")')
+register_block('numcols', '*NumCols({data})')
+register_block('colorrgb', '*ColorRGB({data})')
+register_block('noresultcolor', '*NoResultColor("{data}")')
+register_block('numbers', '*Numbers({data})')
+register_block('showmax', '*ShowMax("{data}")')
+register_block('showmaxlocal', '*ShowMaxLocal("{data}")')
+register_block('showmin', '*ShowMin("{data}")')
+register_block('showminlocal', '*ShowMinLocal("{data}")')
+register_block('entitylabel', '*EntityLabel("{data}")')
+register_block('showbymodel', '*ShowByModel("{data}")')
+register_block('legendposition', '*LegendPosition("{data}")')
+register_block('backgroundcolor', '*BackGroundColor("{data}")')
+register_block('transparency', '*Transparency("{data}")')
+register_block('filter', '*Filter("{data}")')
+
+register_block('note', '*BeginNote({data})', '*EndNote()')
+register_block('transparent', '*Transparent("{data}")')
+register_block('autohide', '*AutoHide("{data}")')
+register_block('anchortoscreen', '*AnchorToScreen("{data}")')
+register_block('fillcolor', '*FillColor({data})')
+register_block('textcolor', '*FillColor({data})')
+register_block('attach', '*Attach("{data}")')
+register_block('position', '*Position({data})')
+register_block('text', '*Text("{data}")')
+register_block('font', '*Font({data})')
+register_block('borderwidth', '*BorderWidth({data})')
+register_block('shape', '*Shape("{data}")')
+register_block('notealignment', '*NoteAlignment("{data}")')
+register_block('noteanchor', '*NoteAnchor({data})')
+register_block('titleflag', '*TitleFlag("{data}")')
+
+register_block('raw', '{data}', indent=False)  # lines read_mvw did not recognise, kept as they were
+register_block('rawblock', '{data[0]}', '{data[1]}', indent=False)
+
+
+def _iter_lines(root):
+    # yield the session lines in document order. The stack holds the closing line and the remaining children of
+    # every open block, so each *Begin/*End pair is written exactly once in a single pass.
+    block = _get_block(root)
+    children = root.children
+    if not children:
+        for line in block:
+            yield line
+        return
+    yield block[0]
+    stack = [(block[1], iter(children))]
+    while stack:
+        closing, children = stack[-1]
+        for child in children:
+            block = _get_block(child)
+            grandchildren = child.children
+            if grandchildren:
+                yield block[0]
+                stack.append((block[1], iter(grandchildren)))
+                break
+            for line in block:
+                yield line
+        else:
+            stack.pop()
+            yield closing
+
+
+def _subtree_lines(node):
+    # lines of the subtree under node in document order, straight from the arrays when node lives in a SessionStore
+    if isinstance(node, StoreNode):
+        return node.store.lines(node.index)
+    return _iter_lines(node)
+
+
+class RenderCache(object):
+    # Bounded memo of rendered subtrees. A subtree is keyed by its structure, the type, level and template fields of
+    # every node in it, so identical subtrees at the same depth (default legends, notes, deformed blocks, ...) are
+    # formatted once and their text is reused. Each distinct structure is interned as a small int id, so keys stay
+    # shallow however deep the subtree. The least recently used texts are dropped beyond maxsize; hits and misses
+    # count the lookups.
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._texts = OrderedDict()  # id -> text
+        self._ids = {}  # (node key, child ids) -> id
+        self._child_ids = {}  # id -> child ids
+        self._next_id = itertools.count()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def clear(self):
+        self._texts.clear()
+        self._ids.clear()
+        self._child_ids.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, node):
+        # '\n'.join of the lines of the subtree under node; node itself is formatted, its descendants go through the
+        # cache
+        if len(self._ids) > 16 * self.maxsize:  # forget structures no longer seen, between renders only
+            self._ids.clear()
+            self._child_ids.clear()
+        block = _get_block(node)
+        children = node.children
+        if not children:
+            return '\n'.join(block)
+        texts = [block[0]]
+        for child in children:
+            texts.append(self._text(child, self._id(child)))
+        texts.append(block[1])
+        return '\n'.join(texts)
+
+    def _id(self, node):
+        children = node.children
+        if children:
+            child_ids = tuple([self._id(child) for child in children])
+        else:
+            child_ids = ()
+        key = (_KEYS[node.type](node), child_ids)
+        ids = self._ids
+        key_id = ids.get(key)
+        if key_id is None:
+            key_id = ids[key] = next(self._next_id)
+            self._child_ids[key_id] = child_ids
+        return key_id
+
+    def _text(self, node, key_id):
+        child_ids = self._child_ids[key_id]
+        if not child_ids:  # leaves are cheaper to format than to look up
+            return '\n'.join(_get_block(node))
+        texts = self._texts
+        text = texts.pop(key_id, None)
+        if text is not None:
+            self.hits = self.hits + 1
+            texts[key_id] = text
+            return text
+        self.misses = self.misses + 1
+        block = _get_block(node)
+        lines = [block[0]]
+        for child, child_id in zip(node.children, child_ids):
+            lines.append(self._text(child, child_id))
+        lines.append(block[1])
+        text = '\n'.join(lines)
+        texts[key_id] = text
+        if len(texts) > self.maxsize:
+            texts.popitem(last=False)
+        return text
+
+
+_RENDER_JOBS = {}
+_RENDER_THREADS = os.name == 'nt'
+_render_tokens = itertools.count()
+
+
+def _render_page(job):
+    # (text, cache hits, cache misses) of one page. Each worker process memoizes into its own copy of the cache and
+    # reports the counts, so the writer can add them up.
+    token, index = job
+    pages, cache = _RENDER_JOBS[token]
+    if cache is None:
+        return '\n'.join(_subtree_lines(pages[index])), 0, 0
+    hits = cache.hits
+    misses = cache.misses
+    text = cache.render(pages[index])
+    return text, cache.hits - hits, cache.misses - misses
+
+
+def _render_session(job):
+    # (text, seconds, error) of one session of a Write.mvw_many batch. Sessions rendered by the same worker share
+    # its copy of the cache.
+    token, index = job
+    jobs, cache, buffersize = _RENDER_JOBS[token]
+    session = jobs[index][0]
+    start = time.time()
+    try:
+        if cache is None or isinstance(session.root, StoreNode):
+            writer = Write(session, cache=0)
+        else:
+            writer = Write(session, cache=cache)
+        text = ''.join(writer.iter_chunks(buffersize))
+    except Exception as error:
+        return None, time.time() - start, _describe_error(error)
+    return text, time.time() - start, None
+
+
+def _fit(page, text, size):
+    if len(text) != size:
+        raise RuntimeError('page %s rendered to %d characters where %d were reserved' % (page.id, len(text), size))
+    return text
+
+
+def _render_into(job):
+    # render one page of a Write.mvw(mmap=True) straight into its region of the shared mapping. Returns (lines,
+    # cache hits, cache misses).
+    token, index = job
+    jobs, cache, mapped = _RENDER_JOBS[token]
+    page, offset, size = jobs[index]
+    if cache is None:
+        text = '\n'.join(_subtree_lines(page))
+        hits = misses = 0
     else:
-        pass
-
-    return block
+        hits = cache.hits
+        misses = cache.misses
+        text = cache.render(page)
+        hits = cache.hits - hits
+        misses = cache.misses - misses
+    text = _fit(page, text + '\n', size)
+    mapped[offset:offset + size] = text
+    return text.count('\n'), hits, misses
+
+
+def _render_pool(workers):
+    # worker processes are forked so that they inherit the session tree instead of unpickling it. Without fork
+    # (Windows) threads are used instead; they keep the page order but share one interpreter lock. Callers register
+    # their jobs in _RENDER_JOBS before the pool forks, so the workers see them; each process memoizes into its own
+    # copy of the RenderCache, but threads would all share one, so they render without it.
+    if _RENDER_THREADS:
+        return ThreadPool(workers)
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork').Pool(workers)
+    return multiprocessing.Pool(workers)
+
+
+def _open_session(path, mode, compress=None, compresslevel=6, name=None):
+    # open a session file for 'r' or 'w', plain or through one of the stdlib codecs in _COMPRESSIONS. name is the
+    # path the file ends up at when path is a temp file, for the file name a gzip header records.
+    if compress is None:
+        return open(path, mode)
+    elif compress == 'gz':
+        if mode == 'w' and name is not None:
+            session = gzip.GzipFile(name, 'wb', compresslevel, open(path, 'wb'))
+            session.myfileobj = session.fileobj  # closed with the GzipFile, as when it opens the file itself
+            return session
+        return gzip.open(path, mode + 'b', compresslevel)
+    elif compress == 'bz2':
+        return bz2.BZ2File(path, mode + 'b', compresslevel=max(compresslevel, 1))
+    elif compress == 'xz':
+        if lzma is None:
+            raise ValueError('xz compression needs the lzma module (backports.lzma on Python 2)')
+        if mode == 'w':
+            return lzma.LZMAFile(path, 'wb', preset=compresslevel)
+        return lzma.LZMAFile(path, 'rb')
+    raise ValueError('unknown compression ' + repr(compress) + ', expected one of ' + ', '.join(_COMPRESSIONS))
+
+
+def decompress_mvw(path, writedir=None):
+    # write a .mvw.gz/.mvw.bz2/.mvw.xz session back out as a plain .mvw that HyperView can open, streaming it in
+    # 1 MiB blocks. Returns the path of the plain session, next to the compressed one unless writedir is given.
+    plain, ext = os.path.splitext(path)
+    if writedir is not None:
+        plain = os.path.join(writedir, os.path.basename(plain))
+    compressed = _open_session(path, 'r', ext[1:])
+
+    def write(temp):
+        session = open(temp, 'wb')
+        try:
+            shutil.copyfileobj(compressed, session, 1 << 20)
+        finally:
+            session.close()
+
+    try:
+        _replace_atomic(plain, write)
+    finally:
+        compressed.close()
+    return plain
+
+
+def _temp_path(path):
+    # hidden, unique sibling of path for writing before the rename into place
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.%s.%d.%s.tmp' % (tail, os.getpid(), binascii.hexlify(os.urandom(4))))
+
+
+def _commit_session(temp, path, fsync='none'):
+    # move a finished temp file over path in one atomic rename. fsync is 'none' (leave flushing to the OS), 'file'
+    # (flush the file contents first) or 'dir' (also flush the directory entry after the rename).
+    if fsync in ('file', 'dir'):
+        fd = os.open(temp, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    if hasattr(os, 'replace'):
+        os.replace(temp, path)
+    else:
+        try:
+            os.rename(temp, path)
+        except OSError:
+            if os.name != 'nt' or not os.path.exists(path):
+                raise
+            os.remove(path)  # Python 2 on Windows cannot rename over an existing file
+            os.rename(temp, path)
+
+    if fsync == 'dir' and os.name != 'nt':
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _replace_atomic(path, write, fsync='none'):
+    # call write(temp) for a temp file next to path and rename it into place, so readers never see a partial
+    # session. Returns what write returned.
+    temp = _temp_path(path)
+    try:
+        result = write(temp)
+        _commit_session(temp, path, fsync)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return result
+
+
+def _write_atomic(path, chunks, compress=None, compresslevel=6, fsync='none'):
+    # write chunks to path through _replace_atomic. Returns the size of the file on disk.
+    def write(temp):
+        session = _open_session(temp, 'w', compress, compresslevel, path)
+        try:
+            for chunk in chunks:
+                session.write(chunk)
+        finally:
+            session.close()
+
+    _replace_atomic(path, write, fsync)
+    return os.path.getsize(path)
+
+
+def _describe_error(error):
+    return '%s: %s' % (error.__class__.__name__, error)
 
 
 def _update_layout(page, configuration):
     temp = re.findall(r'\d+', page.id)  # get integers from id
     page_num = ''.join(temp)  # make a number out of all found integers. Works only when id = name + i
 
-    for node in page.children:
+    for node in _node_index(page.parent).find(page, 'layout'):
 
         if 'layout' + page_num in node.id:
             node.data = str(configuration)
+    _touch(page)
 
     return page
 
@@ -421,12 +816,80 @@ def _is_valid_contour(resulttype, datacomponent):
         return False
 
 
+class PerNode(object):
+    # one value per node in a bulk setter value: state.x = (nodes, PerNode(values)) sets values[i] on nodes[i]
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __repr__(self):
+        return 'PerNode(%r)' % (self.values,)
+
+
+def _node_edits(mod):
+    # the (node, value) pairs of a bulk setter value: (nodes, value) sets value on every node of a list or tuple,
+    # (nodes, PerNode(values)) one value per node, and a {node: value} mapping each node its own. None for anything
+    # else, including a single (node, value) pair. (nodes, [...]) could mean either of the first two, so it is
+    # refused; a list value for every node goes in a mapping, e.g. dict.fromkeys(nodes, value).
+    if isinstance(mod, dict):
+        return list(mod.items())
+    if mod.__class__ is tuple and len(mod) == 2 and isinstance(mod[0], (list, tuple)):
+        nodes, value = mod
+        if value.__class__ is PerNode:
+            if len(value.values) != len(nodes):
+                raise ValueError('%d values for %d nodes' % (len(value.values), len(nodes)))
+            return list(zip(nodes, value.values))
+        if isinstance(value, list):
+            raise ValueError('(nodes, %r) is ambiguous: use (nodes, PerNode(values)) for one value per node, or '
+                             'dict.fromkeys(nodes, value) to set the list on every node' % (value,))
+        return [(node, value) for node in nodes]
+    return None
+
+
+def _set_data(edits):
+    # set the data of many nodes in one pass: every node is checked first, so a bad one changes nothing, and each
+    # page holding an edited node has its revision bumped once (see _touch). Nodes of a SessionStore are set through
+    # its arrays.
+    stores = {}  # id(store) -> (store, indices, values)
+    nodes = []
+    for node, data in edits:
+        if node.__class__ is StoreNode:
+            store = stores.setdefault(id(node.store), (node.store, [], []))
+            store[1].append(node.index)
+            store[2].append(data)
+        elif isinstance(node, _NODE_CLASSES):
+            nodes.append((node, data))
+        else:
+            raise ValueError('%r is not a session node' % (node,))
+    for store, indices, values in stores.values():
+        store.set_data(indices, values)
+
+    touched = set()  # pages, None for nodes outside pages
+    for node, data in nodes:
+        node.data = data
+        while node is not None and node.type != 'page':
+            node = node.parent
+        touched.add(node)
+    for page in touched:
+        if page is not None:
+            page.rev = getattr(page, 'rev', 0) + 1
+
+
 def _global_callback(name, mod):
-    
-    if isinstance(mod[0], AnyNode):
+    # apply a setter value to the tree: a (node, value) pair, or one of the bulk values of _node_edits
+    if not isinstance(mod, dict) and isinstance(mod[0], _NODE_CLASSES):
         node = mod[0]
         data = mod[1]
+        if data.__class__ is PerNode:
+            raise ValueError('PerNode values are for a list of nodes, not %r' % (node,))
         node.data = data
+        _touch(node)
+        return
+
+    edits = _node_edits(mod)
+    if edits is not None:
+        _set_data(edits)
 
     # elif str(mod[0]).isdigit():
     #     contour_num = str(mod[0])
@@ -436,136 +899,702 @@ def _global_callback(name, mod):
     #             node.data = data
     #             break
     else:
-        print('\n:: Error :: ' + mod[0] + ' is not a valid input.')
-        quit()
+        raise ValueError('%s: %r is not a (node, value) pair or a bulk value of nodes' % (name, mod))
         
     return
 
 
-class PageState(object):
+class SessionNode(object):
+    # Compact stand-in for anytree.AnyNode. Every field the builders set or _get_block reads has a fixed slot, so a
+    # node carries no per-instance __dict__ and leaves share one empty children tuple until they get a child.
+    __slots__ = ('id', 'type', 'oc', 'level', 'N', 'data', 'gui', 'version', 'instance', 'order',
+                 'page_num', 'window_num', 'graphic_num', 'model_num', 'result_num', 'part_num', 'group_num',
+                 'contour_num', 'legend_num', 'note_num', 'rev', '_parent', '_children', '_nodeindex')
+
+    def __init__(self, id=None, type=None, parent=None, oc=None, level=None, N=None, data=None, gui=None,
+                 version=None, instance=None, order=None, page_num=None, window_num=None, graphic_num=None,
+                 model_num=None, result_num=None, part_num=None, group_num=None, contour_num=None, legend_num=None,
+                 note_num=None):
+        self.id = id
+        self.type = type
+        self.oc = oc
+        self.level = level
+        self.N = N
+        self.data = data
+        self.gui = gui
+        self.version = version
+        self.instance = instance
+        self.order = order
+        self.page_num = page_num
+        self.window_num = window_num
+        self.graphic_num = graphic_num
+        self.model_num = model_num
+        self.result_num = result_num
+        self.part_num = part_num
+        self.group_num = group_num
+        self.contour_num = contour_num
+        self.legend_num = legend_num
+        self.note_num = note_num
+        self.rev = 0
+        self._parent = None
+        self._children = ()
+        if parent is not None:
+            self.parent = parent
+
+    def __repr__(self):
+        return 'SessionNode(id=%r, type=%r)' % (self.id, self.type)
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent):
+        if self._parent is not None:
+            self._parent._children.remove(self)
+        if parent is not None:
+            if not parent._children:
+                parent._children = []
+            parent._children.append(self)
+        self._parent = parent
+
+    @property
+    def children(self):
+        return tuple(self._children)
+
+    @property
+    def ancestors(self):
+        ancestors = []
+        node = self._parent
+        while node is not None:
+            ancestors.append(node)
+            node = node._parent
+        ancestors.reverse()
+        return tuple(ancestors)
+
+    @property
+    def root(self):
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    @property
+    def siblings(self):
+        if self._parent is None:
+            return ()
+        return tuple(node for node in self._parent._children if node is not self)
+
+    @property
+    def is_leaf(self):
+        return not self._children
+
+    @property
+    def is_root(self):
+        return self._parent is None
+
+
+def _entity_num(id, type):
+    # the entity number of an id of the form type + number, -1 for an id equal to its type or missing, None for any
+    # other id
+    if id is None or id == type:
+        return -1
+    suffix = id[len(type):]
+    if id.startswith(type) and suffix.isdigit():
+        return int(suffix)
+    return None
+
+
+class SessionStore(object):
+    # Struct-of-arrays session tree. Node type, parent, first/last child, next sibling, level, order and entity
+    # number live in typed arrays indexed by node, data in a parallel list of references, so a node costs a few
+    # dozen bytes instead of a Python object. Build it through Page(state, nodeclass=StoreNode).
+    def __init__(self, gui=None, version=None):
+        self.gui = gui
+        self.version = version
+        self.order = 0
+        self.typenames = []
+        self.typecodes = {}
+        self.types = array('B')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.last_child = array('i')
+        self.next_sibling = array('i')
+        self.levels = array('b')
+        self.orders = array('i')
+        self.nums = array('i')
+        self.data = []
+        self.ids = {}  # only ids that are not type + entity number
+        self.revs = {}  # page revisions, see _touch
+        self._nodeindex = None  # see select
+
+    @classmethod
+    def from_columns(cls, gui, version, ids, types, data, **columns):
+        # a store filled in one go from per-node columns in document order, as load_snapshot reads them: ids, types
+        # and data as lists, and the int arrays of the store (parents, first_child, last_child, next_sibling, levels,
+        # orders, nums; -1 for None) as keyword arguments
+        store = cls(gui, version)
+        typecodes = store.typecodes
+        for type in types:
+            if type not in typecodes:
+                typecodes[type] = len(store.typenames)
+                store.typenames.append(type)
+        store.types = array('B', map(typecodes.__getitem__, types))
+        for name, column in columns.items():
+            setattr(store, name, array(getattr(store, name).typecode, column))
+        store.data = list(data)
+        for index, num in enumerate(store.nums):
+            if num < 0 and ids[index] is not None and ids[index] != types[index]:
+                store.ids[index] = ids[index]
+        return store
+
+    def __len__(self):
+        return len(self.types)
+
+    def nbytes(self):
+        arrays = (self.types, self.parents, self.first_child, self.last_child, self.next_sibling, self.levels,
+                  self.orders, self.nums)
+        return sum(len(a) * a.itemsize for a in arrays) + sys.getsizeof(self.data)
+
+    def append(self, id, type, parent, level, N, data):
+        index = len(self.types)
+        code = self.typecodes.get(type)
+        if code is None:
+            code = self.typecodes[type] = len(self.typenames)
+            self.typenames.append(type)
+
+        num = _entity_num(id, type)
+        if num is None:
+            num = -1
+            self.ids[index] = id
+
+        self.types.append(code)
+        self.parents.append(parent)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        self.levels.append(-1 if level is None else level)
+        self.orders.append(-1 if N is None else N)
+        self.nums.append(num)
+        self.data.append(data)
+
+        if parent >= 0:
+            if self.last_child[parent] < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+
+        return index
+
+    def set_data(self, indices, values):
+        # the data of many nodes at once, by index. The revision of every page holding one of them is bumped once.
+        data = self.data
+        parents = self.parents
+        types = self.types
+        page = self.typecodes.get('page')
+        touched = set()  # page indices, -1 for nodes outside pages
+        for index, value in zip(indices, values):
+            data[index] = value
+            while index >= 0 and types[index] != page:
+                index = parents[index]
+            touched.add(index)
+        for index in touched:
+            if index >= 0:
+                self.revs[index] = self.revs.get(index, 0) + 1
+
+    def lines(self, top=0):
+        # document order by one walk over the child/sibling arrays, for the subtree under node index top. Every node
+        # is visited once on the way down and closed at most once on the way up.
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        parents = self.parents
+        node = StoreNode.handle(self, top)  # reused as a cursor for _get_block
+        i = top
+        while True:
+            node.index = i
+            block = _get_block(node)
+            if first_child[i] >= 0:
+                yield block[0]
+                i = first_child[i]
+                continue
+            for line in block:
+                yield line
+            while i != top and next_sibling[i] < 0:
+                i = parents[i]
+                node.index = i
+                yield _get_block(node)[1]
+            if i == top:
+                return
+            i = next_sibling[i]
+
+    def spans(self, top=0):
+        # (orders, starts, lengths) of the opening line of every node under top, in the document order of lines and
+        # with offsets counted from its first line. See Write.offsets.
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        parents = self.parents
+        orders = []
+        starts = array('l')
+        lengths = array('l')
+        offset = 0
+        node = StoreNode.handle(self, top)
+        i = top
+        while True:
+            node.index = i
+            block = _get_block(node)
+            orders.append(self.orders[i])
+            starts.append(offset)
+            lengths.append(len(block[0]))
+            offset = offset + len(block[0]) + 1
+            if first_child[i] >= 0:
+                i = first_child[i]
+                continue
+            if len(block) > 1:
+                offset = offset + len(block[1]) + 1
+            while i != top and next_sibling[i] < 0:
+                i = parents[i]
+                node.index = i
+                offset = offset + len(_get_block(node)[1]) + 1
+            if i == top:
+                return orders, starts, lengths
+            i = next_sibling[i]
+
+
+class StoreNode(object):
+    # Handle onto one node of a SessionStore. Constructing a StoreNode appends a node to the store of its parent (or
+    # starts a new store for a root); handles for existing nodes are made on demand and hold only store and index.
+    __slots__ = ('store', 'index')
+
+    def __init__(self, id=None, type=None, parent=None, level=None, N=None, data=None, gui=None, version=None,
+                 **kwargs):
+        if parent is None:
+            self.store = SessionStore(gui, version)
+            self.index = self.store.append(id, type, -1, level, N, data)
+        else:
+            self.store = parent.store
+            self.index = self.store.append(id, type, parent.index, level, N, data)
+
+    @classmethod
+    def handle(cls, store, index):
+        node = cls.__new__(cls)
+        node.store = store
+        node.index = index
+        return node
+
+    def __eq__(self, other):
+        return isinstance(other, StoreNode) and self.store is other.store and self.index == other.index
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __repr__(self):
+        return 'StoreNode(id=%r, type=%r)' % (self.id, self.type)
+
+    @property
+    def id(self):
+        if self.index in self.store.ids:
+            return self.store.ids[self.index]
+        num = self.store.nums[self.index]
+        return self.type if num < 0 else self.type + str(num)
+
+    @property
+    def type(self):
+        return self.store.typenames[self.store.types[self.index]]
+
+    @property
+    def level(self):
+        level = self.store.levels[self.index]
+        return None if level < 0 else level
+
+    @level.setter
+    def level(self, level):
+        self.store.levels[self.index] = level
+
+    @property
+    def N(self):
+        return self.store.orders[self.index]
+
+    @N.setter
+    def N(self, N):
+        self.store.orders[self.index] = N
+
+    @property
+    def data(self):
+        return self.store.data[self.index]
+
+    @data.setter
+    def data(self, data):
+        self.store.data[self.index] = data
+
+    @property
+    def rev(self):
+        return self.store.revs.get(self.index, 0)
+
+    @rev.setter
+    def rev(self, rev):
+        self.store.revs[self.index] = rev
+
+    @property
+    def gui(self):
+        return self.store.gui
+
+    @property
+    def version(self):
+        return self.store.version
+
+    @property
+    def order(self):
+        return self.store.order
+
+    @order.setter
+    def order(self, order):
+        self.store.order = order
+
+    @property
+    def instance(self):
+        num = self.store.nums[self.index]
+        return None if num < 0 else num
+
+    @property
+    def page_num(self):
+        num = self.store.nums[self.index]
+        return None if num < 0 else str(num)
+
+    window_num = graphic_num = model_num = result_num = part_num = group_num = contour_num = legend_num = \
+        note_num = page_num
+
+    @property
+    def parent(self):
+        parent = self.store.parents[self.index]
+        return None if parent < 0 else StoreNode.handle(self.store, parent)
+
+    @property
+    def children(self):
+        children = []
+        child = self.store.first_child[self.index]
+        while child >= 0:
+            children.append(StoreNode.handle(self.store, child))
+            child = self.store.next_sibling[child]
+        return tuple(children)
+
+    @property
+    def ancestors(self):
+        ancestors = []
+        parent = self.store.parents[self.index]
+        while parent >= 0:
+            ancestors.append(StoreNode.handle(self.store, parent))
+            parent = self.store.parents[parent]
+        ancestors.reverse()
+        return tuple(ancestors)
+
+    @property
+    def root(self):
+        return StoreNode.handle(self.store, 0)
+
+    @property
+    def siblings(self):
+        parent = self.parent
+        if parent is None:
+            return ()
+        return tuple(node for node in parent.children if node.index != self.index)
+
+    @property
+    def is_leaf(self):
+        return self.store.first_child[self.index] < 0
+
+    @property
+    def is_root(self):
+        return self.store.parents[self.index] < 0
+
+
+_NODE_CLASSES = (AnyNode, SessionNode, StoreNode)
+
+
+def _stateless(method):
+    # mark a builder's modify_x method that does not use its builder (it only hands the value to _global_callback),
+    # so a State calls it once however many builders bind it; see _Observers
+    method.stateless = True
+    return method
+
+
+class _WeakMethod(object):
+    # a bound method that does not keep its object alive; calling it after the object is gone does nothing
+    __slots__ = ('ref', 'func')
+
+    def __init__(self, method, callback):
+        self.ref = weakref.ref(method.__self__, callback)
+        self.func = method.__func__
+
+    def __call__(self, data):
+        obj = self.ref()
+        if obj is not None:
+            self.func(obj, data)
+
+
+class _Observers(list):
+    # The callbacks of one State attribute, called in order by its setter. Binding the same handler twice keeps one:
+    # a _stateless method is kept once per State whatever builder it was bound from, and is called without one; any
+    # other bound method is held through a weak reference and drops out once its object is collected, so the States
+    # keep no builder alive. Plain functions and partials are kept as they are; the builders bind the handlers that
+    # need their tree as partials over its root (see Page), so edits reach the tree as long as it lives.
+    def __init__(self):
+        list.__init__(self)
+        self.keys = {}  # handler key -> its callback in the list
+        self.dead = False  # some weakly held builder was collected
+
+    def _collected(self, ref):
+        self.dead = True
+
+    def append(self, callback):
+        if self.dead:
+            self.dead = False
+            self[:] = [entry for entry in self if entry.__class__ is not _WeakMethod or entry.ref() is not None]
+            live = set(map(id, self))
+            self.keys = dict((key, entry) for key, entry in self.keys.items() if id(entry) in live)
+        func = getattr(callback, '__func__', None)
+        obj = getattr(callback, '__self__', None)
+        if func is None and obj is not None:  # a builtin method, e.g. the append of a list; it keeps its object
+            key = (id(obj), callback.__name__)
+        elif func is None or obj is None:  # a function or a partial
+            key = callback
+            try:
+                hash(key)
+            except TypeError:  # an unhashable callable object, kept once per object
+                key = id(callback)
+        elif getattr(func, 'stateless', False):
+            key = func
+            callback = partial(func, None)
+        else:
+            key = (id(obj), func)
+            callback = _WeakMethod(callback, self._collected)
+        if key not in self.keys:
+            self.keys[key] = callback
+            list.append(self, callback)
+
+    def extend(self, callbacks):
+        for callback in callbacks:
+            self.append(callback)
+
+
+class _Observable(object):
+    # observed attribute x of a State: reads _x, and setting it stores _x and calls the callbacks in _observers_x. If
+    # a callback raises, e.g. on a value that is not a (node, value) pair, _x goes back to its previous value.
+    __slots__ = ('value', 'observers')
+
+    def __init__(self, name):
+        self.value = '_' + name
+        self.observers = '_observers_' + name
+
+    def __get__(self, state, owner):
+        if state is None:
+            return self
+        return getattr(state, self.value)
+
+    def __set__(self, state, data):
+        previous = getattr(state, self.value)
+        setattr(state, self.value, data)
+        try:
+            for callback in getattr(state, self.observers):
+                callback(data)
+        except BaseException:
+            setattr(state, self.value, previous)
+            raise
+
+
+def _binder(name):
+    # bind_to_x of a State: add a callback for attribute x, making the State its own _Observers on the first one
+    key = '_observers_' + name
+
+    def bind(self, callback):  # Bind property to Template method
+        if self._queue is not None:  # inside a batch, bound at its end
+            self._bound.append((name, callback))
+            return
+        observers = self.__dict__.get(key)
+        if observers is None:
+            observers = self.__dict__[key] = _Observers()
+        observers.append(callback)
+
+    bind.__name__ = 'bind_to_' + name
+    return bind
+
+
+class _StateType(type):
+    # Makes the observed attributes of a State class from its _fields table of (name, default) pairs: the x
+    # property, the _x default and an empty _observers_x on the class, and bind_to_x. A State instance only stores
+    # the values set and the callbacks bound on it.
+    def __new__(cls, name, bases, namespace):
+        for field, default in namespace.get('_fields', ()):
+            namespace.setdefault(field, _Observable(field))
+            namespace['_' + field] = default
+            namespace['_observers_' + field] = ()
+            namespace['bind_to_' + field] = _binder(field)
+        return type.__new__(cls, name, bases, namespace)
+
+
+class ObservableState(_StateType('_State', (object,), {})):
+    # Base of the State classes. Every observed attribute x has a _x value, a setter that calls the callbacks in
+    # _observers_x with the new value, and bind_to_x to add one, all made from the class's _fields table. Most
+    # values are (node, value) pairs, as the builders' modify_x methods take them; the attributes named in _plain
+    # take plain values instead.
+    _fields = ()
+    _plain = ()
+    _queue = None  # the edits of the open batch
+    _bound = None  # the callbacks bound in it
+
+    def __init__(self, **kwargs):
+        pass
+
+    @contextmanager
+    def batch(self):
+        # with state.batch(): queue the edits made through the setters in the with block and apply them in one pass
+        # at its end, one bulk value per attribute. Edits of the same node collapse into the last one. If any edit is
+        # invalid (a (node, value) pair without a session node) or the block raises, nothing is applied: the
+        # attributes go back to their values before the batch and the error is raised. Callbacks bound in the block
+        # are bound at its end, so they see the applied edits and not the queued ones. A batch inside a batch joins
+        # the outer one.
+        if self._queue is not None:
+            yield self
+            return
+        names = [name for name, default in self._fields]
+        observers = dict((name, getattr(self, '_observers_' + name)) for name in names)
+        values = dict((name, getattr(self, '_' + name)) for name in names)
+        queue = self._queue = OrderedDict()  # node (or a running number for plain values) -> (name, edit)
+        bound = self._bound = []  # (name, callback) bound in the block
+
+        def queued(name):
+            def callback(edit):
+                if name in self._plain:
+                    queue[len(queue)] = (name, edit)
+                    return
+                edits = _node_edits(edit)
+                if edits is None:
+                    edits = [edit]
+                for edit in edits:
+                    node = edit[0] if edit.__class__ is tuple and len(edit) == 2 else None
+                    queue[node if isinstance(node, _NODE_CLASSES) else len(queue)] = (name, edit)
+            return callback
+
+        for name in names:
+            setattr(self, '_observers_' + name, [queued(name)])
+        try:
+            yield self
+            edits = queue.values()
+            for name, edit in edits:
+                if name not in self._plain and not (edit.__class__ is tuple and len(edit) == 2 and
+                                                    isinstance(edit[0], _NODE_CLASSES)):
+                    raise ValueError('%s.%s: %r is not a (node, value) pair' % (self.__class__.__name__, name, edit))
+        except BaseException:
+            for name in names:
+                setattr(self, '_' + name, values[name])
+            raise
+        finally:
+            for name in names:
+                del self.__dict__['_observers_' + name]
+                if observers[name]:
+                    self.__dict__['_observers_' + name] = observers[name]
+            self._queue = self._bound = None
+            for name, callback in bound:
+                getattr(self, 'bind_to_' + name)(callback)
+
+        grouped = OrderedDict()  # name -> ([nodes], [values]) of its node edits
+        applied = []  # (node, data before the batch)
+        try:
+            for name, edit in edits:
+                if name in self._plain:
+                    for callback in getattr(self, '_observers_' + name):
+                        callback(edit)
+                else:
+                    nodes, data = grouped.setdefault(name, ([], []))
+                    nodes.append(edit[0])
+                    data.append(edit[1])
+                    applied.append((edit[0], edit[0].data))
+            for name, (nodes, data) in grouped.items():
+                for callback in getattr(self, '_observers_' + name):
+                    callback((nodes, PerNode(data)))
+        except BaseException:
+            for node, data in reversed(applied):
+                node.data = data
+            for name in names:
+                setattr(self, '_' + name, values[name])
+            raise
+
+
+class PageState(ObservableState):
+    _fields = (('gui', None),
+               ('version', None),
+               ('graphics', None),
+               ('results', None),
+               ('name', 'Template'),
+               ('sessiontitle', 'AutoSession 1'),
+               ('title', 'Untitled'),
+               ('animator', 'Static'),
+               ('titlefont', ('Arial', 1, 0, 12)))
+    _plain = ('gui', 'version', 'graphics', 'results', 'name', 'sessiontitle')
 
     def __init__(self, gui, version, graphics, results, **kwargs):
         self._gui = gui
         self._version = version
         self._graphics = graphics
         self._results = results
-        self._name = 'Template'
-        self._sessiontitle = 'AutoSession 1'
-        self._title = 'Untitled'
-        self._animator = 'Static'
-        self._titlefont = ('Arial', 1, 0, 12)
-
-        self._observers_gui = []
-        self._observers_version = []
-        self._observers_graphics = []
-        self._observers_results = []
-        self._observers_name = []
-        self._observers_sessiontitle = []
-        self._observers_title = []
-        self._observers_animator = []
-        self._observers_titlefont = []
-
-    @property  # getter for sessiontitle State attribute
-    def sessiontitle(self):  # new getter property for every variable that is observed
-        return self._sessiontitle
-
-    @sessiontitle.setter  # setter for sessiontitle State attribute
-    def sessiontitle(self, data):
-        self._sessiontitle = data
-        for callback in self._observers_sessiontitle:
-            callback(self._sessiontitle)
-
-    @property  # getter for sessiontitle State attribute
-    def title(self):  # new getter property for every variable that is observed
-        return self._sessiontitle
-
-    @title.setter  # setter for sessiontitle State attribute
-    def title(self, data):
-        self._title = data
-        for callback in self._observers_title:
-            callback(self._title)
-
-    @property  # getter for sessiontitle State attribute
-    def titlefont(self):  # new getter property for every variable that is observed
-        return self._sessiontitle
-
-    @titlefont.setter  # setter for sessiontitle State attribute
-    def titlefont(self, data):
-        self._titlefont = data
-        for callback in self._observers_titlefont:
-            callback(self._titlefont)
-
-    @property  # getter for sessiontitle State attribute
-    def animator(self):  # new getter property for every variable that is observed
-        return self._animator
-
-    @animator.setter  # setter for sessiontitle State attribute
-    def animator(self, data):
-        self._animator = data
-        for callback in self._observers_animator:
-            callback(self._animator)
-
-    @property  # getter for sessiontitle State attribute
-    def graphics(self):  # new getter property for every variable that is observed
-        return self._graphics
-
-    @graphics.setter  # setter for sessiontitle State attribute
-    def graphics(self, data):
-        self._graphics = data
-        for callback in self._observers_graphics:
-            callback(self._graphics)
-
-    @property  # getter for sessiontitle State attribute
-    def results(self):  # new getter property for every variable that is observed
-        return self._results
-
-    @results.setter  # setter for sessiontitle State attribute
-    def results(self, data):
-        self._results = data
-        for callback in self._observers_results:
-            callback(self._results)
-
-    def bind_to_gui(self, callback):  # Bind property to Template method
-        self._observers_gui.append(callback)
-
-    def bind_to_version(self, callback):  # Bind property to Template method
-        self._observers_version.append(callback)
-
-    def bind_to_graphics(self, callback):  # Bind property to Template method
-        self._observers_graphics.append(callback)
-
-    def bind_to_results(self, callback):  # Bind property to Template method
-        self._observers_results.append(callback)
-
-    def bind_to_name(self, callback):  # Bind property to Template method
-        self._observers_name.append(callback)
-
-    def bind_to_sessiontitle(self, callback):  # Bind property to Template method
-        self._observers_sessiontitle.append(callback)
-
-    def bind_to_title(self, callback):  # Bind property to Template method
-        self._observers_title.append(callback)
-
-    def bind_to_animator(self, callback):  # Bind property to Template method
-        self._observers_animator.append(callback)
-
-    def bind_to_titlefont(self, callback):  # Bind property to Template method
-        self._observers_titlefont.append(callback)
+
+
+class PageAttributes(object):
+    Root = AnyNode(id=None, type=None, parent=None, level=None, page_num=None, N=None)
+    Active = AnyNode(id=None, type=None, oc=None, parent=None, level=None, page_num=None, N=None)
+    Name = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+    Title = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+    TitleFont = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+    Layout = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+    Animator = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+    CurrentPosition = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None,
+                              N=None)
+    NumberSteps = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None,
+                          N=None)
+    Increment = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
+
+
+def _modify_results(root, results):
+    instance = 0
+    for node in _node_index(root).find(root, 'results_files'):
+        if 'results_files' in node.id:
+            node.data = [results[instance]]
+            instance = instance + 1
+
+
+def _modify_graphics(root, graphics):
+    for node in _node_index(root).find(root, 'graphics_files'):
+        if node.id == 'graphics_files':
+            node.data = graphics
+            break
+
+
+def _modify_sessiontitle(root, sessiontitle):
+    for node in _node_index(root).find(root, 'sessiontitle'):
+        if node.id == 'sessiontitle':
+            node.data = sessiontitle
+            break
 
 
 class Page(object):
 
     def __init__(self, data, **kwargs):
         self.data = data
-        self.data.bind_to_sessiontitle(self.modify_sessiontitle)
+        self.nodeclass = kwargs.get('nodeclass', AnyNode)  # SessionNode or StoreNode for a lighter tree
+        self.root = self.nodeclass(id='root', type='root', oc=1, level=0, gui=data._gui, version=data._version,
+                                   page_num=str(0), N=0, order=0, parent=None)  # add header
+
+        # bound to the root rather than to this builder, so these edits still reach the tree once it is gone
+        self.data.bind_to_sessiontitle(partial(_modify_sessiontitle, self.root))
         self.data.bind_to_title(self.modify_title)
-        self.data.bind_to_graphics(self.modify_graphics)
-        self.data.bind_to_results(self.modify_results)
+        self.data.bind_to_graphics(partial(_modify_graphics, self.root))
+        self.data.bind_to_results(partial(_modify_results, self.root))
         self.data.bind_to_animator(self.modify_animator)
         self.data.bind_to_titlefont(self.modify_titlefont)
 
-        self.root = AnyNode(id='root', type='root', oc=1, level=0, gui=data._gui, version=data._version,
-                            page_num=str(0), N=0, parent=None)  # add header
         self.treevisual = RenderTree(self.root)
         self.pagename = 'Page'
         self.layout = '1'
@@ -585,57 +1614,39 @@ class Page(object):
     def add_sessiontitle(self, sessiontitle):
         type = 'sessiontitle'
         name = type
-        node = AnyNode(id=name, type=type, oc=1, parent=self.root, data=sessiontitle,
-                       level=None, page_num=str(0), N=None, position=None)
-        node.level = len(node.ancestors) - 1
-        node.N = len(self.root.leaves)
+        node = self.nodeclass(id=name, type=type, oc=1, parent=self.root, data=sessiontitle,
+                              level=None, page_num=str(0), N=None)
+        _attach(node, self.root)
 
     def add_graphics(self, graphics):
         for i in range(len(graphics)):  # add graphics files
             type = 'graphics_files'
             name = type + str(i)
-            node = AnyNode(id=name, type=type, oc=1, parent=self.root, data=graphics,
-                           level=None, N=None, position=None, instance=i)
-            node.level = len(node.ancestors) - 1
-            node.N = len(self.root.leaves)
+            node = self.nodeclass(id=name, type=type, oc=1, parent=self.root, data=graphics,
+                                  level=None, N=None, instance=i)
+            _attach(node, self.root)
 
     def add_results(self, results):
         for i in range(len(results)):  # add result files. can be any solver output database
             type = 'results_files'
             name = type + str(i)
-            node = AnyNode(id=name, type=type, oc=1, parent=self.root, data=results,
-                           level=None, N=None, position=None, instance=i)
-            node.level = len(node.ancestors) - 1
-            node.N = len(self.root.leaves)
+            node = self.nodeclass(id=name, type=type, oc=1, parent=self.root, data=results,
+                                  level=None, N=None, instance=i)
+            _attach(node, self.root)
 
     def add_palette(self):
 
         type = 'palette'
         name = type  # add palette. not sure what this does in HV
-        node = AnyNode(id=name, type=type, parent=self.root, level=None,
-                       N=None, position=None)
-        node.level = len(node.ancestors) - 1
-        node.N = len(self.root.leaves)
+        node = self.nodeclass(id=name, type=type, parent=self.root, level=None,
+                              N=None)
+        _attach(node, self.root)
 
     def add_pages(self, num_pages, **kwargs):
 
         allowed_keys = {'title', 'pagename', 'titlefont', 'animator'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class PageAttributes(object):
-            Root = AnyNode(id=None, type=None, parent=None, level=None, page_num=None, N=None)
-            Active = AnyNode(id=None, type=None, oc=None, parent=None, level=None, page_num=None, N=None)
-            Name = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-            Title = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-            TitleFont = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-            Layout = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-            Animator = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-            CurrentPosition = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None,
-                                      N=None)
-            NumberSteps = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None,
-                                  N=None)
-            Increment = AnyNode(id=None, type=None, oc=None, parent=None, level=None, data=None, page_num=None, N=None)
-
         Page = [PageAttributes() for i in range(num_pages)]
 
         for i in range(num_pages):  # add all pages
@@ -643,82 +1654,72 @@ class Page(object):
 
             type = 'page'
             name = type + page_i
-            Page[i].Root = AnyNode(id=name, type=type, parent=self.root,
-                                   level=None, page_num=page_i, N=None)
-            Page[i].Root.level = len(Page[i].Root.ancestors) - 1
-            Page[i].Root.N = len(self.root.leaves)
+            Page[i].Root = self.nodeclass(id=name, type=type, parent=self.root,
+                                          level=None, page_num=page_i, N=None)
+            _attach(Page[i].Root, self.root)
 
             type = 'active'
             name = type + page_i
-            Page[i].Active = AnyNode(id=name, type=type, oc=1, parent=Page[i].Root,
-                                     level=None, page_num=page_i, N=None)
-            Page[i].Active.level = len(Page[i].Root.ancestors)
-            Page[i].Active.N = len(self.root.leaves)
+            Page[i].Active = self.nodeclass(id=name, type=type, oc=1, parent=Page[i].Root,
+                                            level=None, page_num=page_i, N=None)
+            _attach(Page[i].Active, self.root)
 
             type = 'name'
             name = type + page_i
-            level = len(Page[i].Root.ancestors)
-            Page[i].Name = AnyNode(id=name, type=type, oc=1, parent=Page[i].Root,
-                                   level=level, data=self.pagename, page_num=page_i, N=None)
-            Page[i].Name.N = len(self.root.leaves)
+            Page[i].Name = self.nodeclass(id=name, type=type, oc=1, parent=Page[i].Root,
+                                          level=None, data=self.pagename, page_num=page_i, N=None)
+            _attach(Page[i].Name, self.root)
 
             type = 'title'
             name = type + page_i
-            Page[i].Title = AnyNode(id=name, type=type, oc=1, parent=Page[i].Root,
-                                    level=None, data=self.title, page_num=page_i, N=None)
-            Page[i].Title.level = len(Page[i].Root.ancestors)
-            Page[i].Title.N = len(self.root.leaves)
+            Page[i].Title = self.nodeclass(id=name, type=type, oc=1, parent=Page[i].Root,
+                                           level=None, data=self.title, page_num=page_i, N=None)
+            _attach(Page[i].Title, self.root)
 
             type = 'titlefont'
             name = type + page_i
-            Page[i].TitleFont = AnyNode(id=name, type=type, oc=1,
-                                        parent=Page[i].Root,
-                                        level=None,
-                                        data=self.titlefont, page_num=page_i, N=None)
-            Page[i].TitleFont.level = len(Page[i].Root.ancestors)
-            Page[i].TitleFont.N = len(self.root.leaves)
+            Page[i].TitleFont = self.nodeclass(id=name, type=type, oc=1,
+                                               parent=Page[i].Root,
+                                               level=None,
+                                               data=self.titlefont, page_num=page_i, N=None)
+            _attach(Page[i].TitleFont, self.root)
 
             type = 'layout'
             name = type + page_i
-            Page[i].Layout = AnyNode(id=name, type=type, oc=1, parent=Page[i].Root,
-                                     level=None, data=self.layout, page_num=page_i, N=None)
-            Page[i].Layout.level = len(Page[i].Root.ancestors)
-            Page[i].Layout.N = len(self.root.leaves)
+            Page[i].Layout = self.nodeclass(id=name, type=type, oc=1, parent=Page[i].Root,
+                                            level=None, data=self.layout, page_num=page_i, N=None)
+            _attach(Page[i].Layout, self.root)
 
             type = 'animator'
             name = type + page_i
-            Page[i].Animator = AnyNode(id=name, type=type,
-                                       parent=Page[i].Root,
-                                       level=None, data=self.animator, page_num=page_i, N=None)
-            Page[i].Animator.level = len(Page[i].Root.ancestors)
-            Page[i].Animator.N = len(self.root.leaves)
+            Page[i].Animator = self.nodeclass(id=name, type=type,
+                                              parent=Page[i].Root,
+                                              level=None, data=self.animator, page_num=page_i, N=None)
+            _attach(Page[i].Animator, self.root)
 
             type = 'currentposition'
             name = type + page_i
-            Page[i].CurrentPosition = AnyNode(id=name, type=type,
-                                              parent=Page[i].Animator,
-                                              level=None, data=self.currentposition,
-                                              page_num=page_i, N=None)
-            Page[i].CurrentPosition.level = len(Page[i].Animator.ancestors)
-            Page[i].CurrentPosition.N = len(self.root.leaves)
+            Page[i].CurrentPosition = self.nodeclass(id=name, type=type,
+                                                     parent=Page[i].Animator,
+                                                     level=None, data=self.currentposition,
+                                                     page_num=page_i, N=None)
+            _attach(Page[i].CurrentPosition, self.root)
 
             type = 'numbersteps'
             name = type + page_i
-            Page[i].NumberSteps = AnyNode(id=name, type=type,
-                                          parent=Page[i].Animator,
-                                          level=None, data=self.numbersteps,
-                                          page_num=page_i, N=None)
-            Page[i].NumberSteps.level = len(Page[i].Animator.ancestors)
-            Page[i].NumberSteps.N = len(self.root.leaves)
+            Page[i].NumberSteps = self.nodeclass(id=name, type=type,
+                                                 parent=Page[i].Animator,
+                                                 level=None, data=self.numbersteps,
+                                                 page_num=page_i, N=None)
+            _attach(Page[i].NumberSteps, self.root)
 
             type = 'increment'
             name = type + page_i
-            Page[i].Increment = AnyNode(id=name, type=type,
-                                        parent=Page[i].Animator,
-                                        level=None, data=self.increment,
-                                        page_num=page_i, N=None)
-            Page[i].Increment.level = len(Page[i].Animator.ancestors)
-            Page[i].Increment.N = len(self.root.leaves)
+            Page[i].Increment = self.nodeclass(id=name, type=type,
+                                               parent=Page[i].Animator,
+                                               level=None, data=self.increment,
+                                               page_num=page_i, N=None)
+            _attach(Page[i].Increment, self.root)
 
         return Page
 
@@ -727,57 +1728,42 @@ class Page(object):
         pass
 
     def modify_results(self, results):#xxx
-        instance = 0
-        for node in PreOrderIter(self.root):
-            if 'results_files' in node.id:
-                node.data = [results[instance]]
-                instance = instance + 1
+        _modify_results(self.root, results)
 
     def modify_graphics(self, graphics):#xxx
-
-        for node in PreOrderIter(self.root):
-            if node.id == 'graphics_files':
-                node.data = graphics
-                break
+        _modify_graphics(self.root, graphics)
 
     def modify_sessiontitle(self, sessiontitle):#xxx
+        _modify_sessiontitle(self.root, sessiontitle)
 
-        for node in PreOrderIter(self.root):
-            if node.id == 'sessiontitle':
-                node.data = sessiontitle
-                break
+    def select(self, path):
+        # nodes of the session matching path, see select
+        return select(self.root, path)
 
+    @_stateless
     def modify_title(self, page_mod):
         _global_callback('title', page_mod)
 
+    @_stateless
     def modify_animator(self, page_mod):
         _global_callback('animator', page_mod)
 
+    @_stateless
     def modify_titlefont(self, page_mod):
         _global_callback('titlefont', page_mod)
 
         return
 
 
-class WindowState(object):
-
-    def __init__(self, **kwargs):
-        self._exportformat = 'PNG'
+class WindowState(ObservableState):
+    _fields = (('exportformat', 'PNG'),)
 
-        self._observers_exportformat = []
 
-    @property  # getter for sessiontitle State attribute
-    def exportformat(self):  # new getter property for every variable that is observed
-        return self._exportformat
-
-    @exportformat.setter  # setter for sessiontitle State attribute
-    def exportformat(self, data):
-        self._exportformat = data
-        for callback in self._observers_exportformat:
-            callback(self._exportformat)
-
-    def bind_to_exportformat(self, callback):  # Bind property to Template method
-        self._observers_exportformat.append(callback)
+class WindowAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None)]
+    Active = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ExportFormat = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AnimationNote = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Window(object):
@@ -791,6 +1777,7 @@ class Window(object):
     def add_windows(self, num_windows, page, configuration, **kwargs):
         self.Page_i = page
         self.root = page.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'exportformat'}
         if _is_valid_window_configuration(num_windows, configuration):
             self.Page_i = _update_layout(self.Page_i, configuration)
@@ -798,12 +1785,6 @@ class Window(object):
             print '***ERROR: INVALID NUMBER OF WINDOWS AND/OR CONFIGURATION.\n'
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class WindowAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None)]
-            Active = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ExportFormat = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AnimationNote = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Window = [WindowAttributes() for i in range(num_windows)]
 
         for i in range(num_windows):  # add all pages
@@ -811,127 +1792,48 @@ class Window(object):
 
             type = 'window'
             name = type + window_i
-            Window[i].Root = AnyNode(id=name, type=type, parent=self.Page_i,
-                                     level=None, window_num=window_i)
-            Window[i].Root.level = len(Window[i].Root.ancestors) - 1
-            Window[i].Root.N = len(self.root.leaves)
+            Window[i].Root = self.nodeclass(id=name, type=type, parent=self.Page_i,
+                                            level=None, window_num=window_i)
+            _attach(Window[i].Root, self.root)
 
             type = 'active'
             name = type + window_i
-            Window[i].Active = AnyNode(id=name, type=type, oc=1, parent=Window[i].Root,
-                                       level=None, window_num=window_i, N=None)
-            Window[i].Active.level = len(Window[i].Root.ancestors)
-            Window[i].Active.N = len(self.root.leaves)
+            Window[i].Active = self.nodeclass(id=name, type=type, oc=1, parent=Window[i].Root,
+                                              level=None, window_num=window_i, N=None)
+            _attach(Window[i].Active, self.root)
 
             type = 'exportformat'
             name = type + window_i
-            Window[i].ExportFormat = AnyNode(id=name, type=type, oc=1, parent=Window[i].Root,
-                                             level=None, window_num=window_i, N=None, data=self.exportformat)
-            Window[i].ExportFormat.level = len(Window[i].Root.ancestors)
-            Window[i].ExportFormat.N = len(self.root.leaves)
+            Window[i].ExportFormat = self.nodeclass(id=name, type=type, oc=1, parent=Window[i].Root,
+                                                    level=None, window_num=window_i, N=None, data=self.exportformat)
+            _attach(Window[i].ExportFormat, self.root)
 
         return Window
 
+    @_stateless
     def modify_exportformat(self, window_mod):
         _global_callback('exportformat', window_mod)
 
 
-class GraphicState(object):
+class GraphicState(ObservableState):
+    _fields = (('lightinfo', '0, 0, 1, 0, 0, 0, 64'),
+               ('rotationangle', '15'),
+               ('savedview', 'Current View'),
+               ('projectiontype', 'Orthographic'),
+               ('view', '0.707107 0.353553 -0.612372 0.000000 -0.707107 0.353553 -0.612372 0.000000 0.000000 0.866025 0.500000 0.000000 0.000000 0.000000 0.000000 1.000000'),
+               ('clippingregion', '-5.585992 6.464380 -2.172861 9.613941 -6.588268 2.100116'))
+    # xxx Write function to get good defaulf view
+    # xxx Write function to get good clipping region
 
-    def __init__(self, **kwargs):
-        self._lightinfo = '0, 0, 1, 0, 0, 0, 64'
-        self._rotationangle = '15'
-        self._savedview = 'Current View'
-        self._projectiontype = 'Orthographic'
-        self._view = '0.707107 0.353553 -0.612372 0.000000 -0.707107 0.353553 -0.612372 0.000000 0.000000 0.866025 0.500000 0.000000 0.000000 0.000000 0.000000 1.000000'
-        self._clippingregion = '-5.585992 6.464380 -2.172861 9.613941 -6.588268 2.100116'
-        # xxx Write function to get good defaulf view
-        # xxx Write function to get good clipping region
-
-        self._observers_lightinfo = []
-        self._observers_rotationangle = []
-        self._observers_savedview = []
-        self._observers_projectiontype = []
-        self._observers_view = []
-        self._observers_clippingregion = []
-
-    @property  # getter for sessiontitle State attribute
-    def lightinfo(self):  # new getter property for every variable that is observed
-        return self._lightinfo
-
-    @lightinfo.setter  # setter for sessiontitle State attribute
-    def lightinfo(self, data):
-        self._lightinfo = data
-        for callback in self._observers_lightinfo:
-            callback(self._lightinfo)
-
-    @property  # getter for sessiontitle State attribute
-    def rotationangle(self):  # new getter property for every variable that is observed
-        return self._rotationangle
-
-    @rotationangle.setter  # setter for sessiontitle State attribute
-    def rotationangle(self, data):
-        self._rotationangle = data
-        for callback in self._observers_rotationangle:
-            callback(self._rotationangle)
-
-    @property  # getter for sessiontitle State attribute
-    def savedview(self):  # new getter property for every variable that is observed
-        return self._savedview
-
-    @savedview.setter  # setter for sessiontitle State attribute
-    def savedview(self, data):
-        self._savedview = data
-        for callback in self._observers_savedview:
-            callback(self._savedview)
-
-    @property  # getter for sessiontitle State attribute
-    def projectiontype(self):  # new getter property for every variable that is observed
-        return self._projectiontype
-
-    @projectiontype.setter  # setter for sessiontitle State attribute
-    def projectiontype(self, data):
-        self._projectiontype = data
-        for callback in self._observers_projectiontype:
-            callback(self._projectiontype)
-
-    @property  # getter for sessiontitle State attribute
-    def view(self):  # new getter property for every variable that is observed
-        return self._view
-
-    @view.setter  # setter for sessiontitle State attribute
-    def view(self, data):
-        self._view = data
-        for callback in self._observers_view:
-            callback(self._view)
-
-    @property  # getter for sessiontitle State attribute
-    def clippingregion(self):  # new getter property for every variable that is observed
-        return self._clippingregion
-
-    @clippingregion.setter  # setter for sessiontitle State attribute
-    def clippingregion(self, data):
-        self._clippingregion = data
-        for callback in self._observers_clippingregion:
-            callback(self._clippingregion)
-
-    def bind_to_lightinfo(self, callback):  # Bind property to Template method
-        self._observers_lightinfo.append(callback)
-
-    def bind_to_rotationangle(self, callback):  # Bind property to Template method
-        self._observers_rotationangle.append(callback)
-
-    def bind_to_savedview(self, callback):  # Bind property to Template method
-        self._observers_savedview.append(callback)
-
-    def bind_to_projectiontype(self, callback):  # Bind property to Template method
-        self._observers_projectiontype.append(callback)
-
-    def bind_to_view(self, callback):  # Bind property to Template method
-        self._observers_view.append(callback)
-
-    def bind_to_clippingregion(self, callback):  # Bind property to Template method
-        self._observers_clippingregion.append(callback)
+
+class GraphicAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None)]
+    LightInfo = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    RotationAngle = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    SavedView = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ProjectionType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    View = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ClippingRegion = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Graphic(object):
@@ -955,18 +1857,10 @@ class Graphic(object):
     def add_graphics(self, num_graphics, window, **kwargs):
         self.Window_i = window
         self.root = window.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'lightinfo', 'rotationangle', 'savedview', 'projectiontype', 'view', 'clippingregion'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class GraphicAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None)]
-            LightInfo = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            RotationAngle = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            SavedView = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ProjectionType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            View = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ClippingRegion = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Graphic = [GraphicAttributes() for i in range(num_graphics)]
 
         for i in range(num_graphics):  # add all pages
@@ -974,198 +1868,94 @@ class Graphic(object):
 
             type = 'graphic'
             name = type + graphic_i
-            Graphic[i].Root = AnyNode(id=name, type=type, parent=self.Window_i,
-                                      level=None, graphic_num=graphic_i)
-            Graphic[i].Root.level = len(Graphic[i].Root.ancestors) - 1
-            Graphic[i].Root.N = len(self.root.leaves)
+            Graphic[i].Root = self.nodeclass(id=name, type=type, parent=self.Window_i,
+                                             level=None, graphic_num=graphic_i)
+            _attach(Graphic[i].Root, self.root)
 
             type = 'lightinfo'
             name = type + graphic_i
-            Graphic[i].LightInfo = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].Root,
-                                           level=None, graphic_num=graphic_i, N=None, data=self.lightinfo)
-            Graphic[i].LightInfo.level = len(Graphic[i].Root.ancestors)
-            Graphic[i].LightInfo.N = len(self.root.leaves)
+            Graphic[i].LightInfo = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].Root,
+                                                  level=None, graphic_num=graphic_i, N=None, data=self.lightinfo)
+            _attach(Graphic[i].LightInfo, self.root)
 
             type = 'rotationangle'
             name = type + graphic_i
-            Graphic[i].RotationAngle = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].Root,
-                                               level=None, graphic_num=graphic_i, N=None, data=self.rotationangle)
-            Graphic[i].RotationAngle.level = len(Graphic[i].Root.ancestors)
-            Graphic[i].RotationAngle.N = len(self.root.leaves)
+            Graphic[i].RotationAngle = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].Root,
+                                                      level=None, graphic_num=graphic_i, N=None,
+                                                      data=self.rotationangle)
+            _attach(Graphic[i].RotationAngle, self.root)
 
             type = 'savedview'
             name = type + graphic_i
-            Graphic[i].SavedView = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].Root,
-                                               level=None, graphic_num=graphic_i, N=None, data=self.savedview)
-            Graphic[i].SavedView.level = len(Graphic[i].Root.ancestors)
-            Graphic[i].SavedView.N = len(self.root.leaves)
+            Graphic[i].SavedView = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].Root,
+                                                      level=None, graphic_num=graphic_i, N=None, data=self.savedview)
+            _attach(Graphic[i].SavedView, self.root)
 
             type = 'projectiontype'
             name = type + graphic_i
-            Graphic[i].ProjectionType = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
-                                           level=None, graphic_num=graphic_i, N=None, data=self.projectiontype)
-            Graphic[i].ProjectionType.level = len(Graphic[i].SavedView.ancestors)
-            Graphic[i].ProjectionType.N = len(self.root.leaves)
+            Graphic[i].ProjectionType = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
+                                                  level=None, graphic_num=graphic_i, N=None, data=self.projectiontype)
+            _attach(Graphic[i].ProjectionType, self.root)
 
             type = 'view'
             name = type + graphic_i
-            Graphic[i].View = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
-                                           level=None, graphic_num=graphic_i, N=None, data=self.view)
-            Graphic[i].View.level = len(Graphic[i].SavedView.ancestors)
-            Graphic[i].View.N = len(self.root.leaves)
+            Graphic[i].View = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
+                                                  level=None, graphic_num=graphic_i, N=None, data=self.view)
+            _attach(Graphic[i].View, self.root)
 
             type = 'clippingregion'
             name = type + graphic_i
-            Graphic[i].ClippingRegion = AnyNode(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
-                                      level=None, graphic_num=graphic_i, N=None, data=self.clippingregion)
-            Graphic[i].ClippingRegion.level = len(Graphic[i].SavedView.ancestors)
-            Graphic[i].ClippingRegion.N = len(self.root.leaves)
+            Graphic[i].ClippingRegion = self.nodeclass(id=name, type=type, oc=1, parent=Graphic[i].SavedView,
+                                             level=None, graphic_num=graphic_i, N=None, data=self.clippingregion)
+            _attach(Graphic[i].ClippingRegion, self.root)
 
         return Graphic
 
+    @_stateless
     def modify_lightinfo(self, graphic_mod):
         _global_callback('lightinfo', graphic_mod)
 
+    @_stateless
     def modify_rotationangle(self, graphic_mod):
         _global_callback('rotationangle', graphic_mod)
 
+    @_stateless
     def modify_savedview(self, graphic_mod):
         _global_callback('savedview', graphic_mod)
 
+    @_stateless
     def modify_projectiontype(self, graphic_mod):
         _global_callback('projectiontype', graphic_mod)
 
+    @_stateless
     def modify_view(self, graphic_mod):
         _global_callback('view', graphic_mod)
 
+    @_stateless
     def modify_clippingregion(self, graphic_mod):
         _global_callback('clippingregion', graphic_mod)
 
 
-class ModelState(object):
+class ModelState(ObservableState):
+    _fields = (('colorby', 'Part'),
+               ('color', '255 0  0'),
+               ('graphic', '0'),
+               ('deformed', ''),
+               ('scalemode', 'ScaleFactor'),
+               ('scale', '1.000000 1.000000 1.000000'),
+               ('resolvedinsystem', '0'),
+               ('resulttype', 'Displacement'))
 
-    def __init__(self, **kwargs):
-        self._colorby = 'Part'
-        self._color = '255 0  0'
-        self._graphic = '0'
-        self._deformed = ''
-        self._scalemode = 'ScaleFactor'
-        self._scale = '1.000000 1.000000 1.000000'
-        self._resolvedinsystem = '0'
-        self._resulttype = 'Displacement'
-
-        self._observers_colorby = []
-        self._observers_color = []
-        self._observers_graphic = []
-        self._observers_deformed = []
-        self._observers_scalemode = []
-        self._observers_scale = []
-        self._observers_resolvedinsystem = []
-        self._observers_resulttype = []
-
-    @property  # getter for sessiontitle State attribute
-    def colorby(self):  # new getter property for every variable that is observed
-        return self._colorby
-
-    @colorby.setter  # setter for sessiontitle State attribute
-    def colorby(self, data):
-        self._colorby = data
-        for callback in self._observers_colorby:
-            callback(self._colorby)
-
-    @property  # getter for sessiontitle State attribute
-    def color(self):  # new getter property for every variable that is observed
-        return self._color
-
-    @color.setter  # setter for sessiontitle State attribute
-    def color(self, data):
-        self._color = data
-        for callback in self._observers_color:
-            callback(self._color)
-
-    @property  # getter for sessiontitle State attribute
-    def graphic(self):  # new getter property for every variable that is observed
-        return self._graphic
-
-    @graphic.setter  # setter for sessiontitle State attribute
-    def graphic(self, data):
-        self._graphic = data
-        for callback in self._observers_graphic:
-            callback(self._graphic)
-
-    @property  # getter for sessiontitle State attribute
-    def deformed(self):  # new getter property for every variable that is observed
-        return self._deformed
-
-    @deformed.setter  # setter for sessiontitle State attribute
-    def deformed(self, data):
-        self._deformed = data
-        for callback in self._observers_deformed:
-            callback(self._deformed)
-
-    @property  # getter for sessiontitle State attribute
-    def scalemode(self):  # new getter property for every variable that is observed
-        return self._scalemode
-
-    @scalemode.setter  # setter for sessiontitle State attribute
-    def scalemode(self, data):
-        self._scalemode = data
-        for callback in self._observers_scalemode:
-            callback(self._scalemode)
-
-    @property  # getter for sessiontitle State attribute
-    def scale(self):  # new getter property for every variable that is observed
-        return self._scale
-
-    @scale.setter  # setter for sessiontitle State attribute
-    def scale(self, data):
-        self._scale = data
-        for callback in self._observers_scale:
-            callback(self._scale)
-
-    @property  # getter for sessiontitle State attribute
-    def resolvedinsystem(self):  # new getter property for every variable that is observed
-        return self._resolvedinsystem
-
-    @resolvedinsystem.setter  # setter for sessiontitle State attribute
-    def resolvedinsystem(self, data):
-        self._resolvedinsystem = data
-        for callback in self._observers_resolvedinsystem:
-            callback(self._resolvedinsystem)
-
-    @property  # getter for sessiontitle State attribute
-    def resulttype(self):  # new getter property for every variable that is observed
-        return self._resulttype
-
-    @resulttype.setter  # setter for sessiontitle State attribute
-    def resulttype(self, data):
-        self._resulttype = data
-        for callback in self._observers_resulttype:
-            callback(self._resulttype)
-
-    def bind_to_colorby(self, callback):  # Bind property to Template method
-        self._observers_colorby.append(callback)
-
-    def bind_to_color(self, callback):  # Bind property to Template method
-        self._observers_color.append(callback)
-
-    def bind_to_graphic(self, callback):  # Bind property to Template method
-        self._observers_graphic.append(callback)
-    
-    def bind_to_deformed(self, callback):  # Bind property to Template method
-        self._observers_deformed.append(callback)
-    
-    def bind_to_scalemode(self, callback):  # Bind property to Template method
-        self._observers_scalemode.append(callback)
-    
-    def bind_to_scale(self, callback):  # Bind property to Template method
-        self._observers_scale.append(callback)
-    
-    def bind_to_resolvedinsystem(self, callback):  # Bind property to Template method
-        self._observers_resolvedinsystem.append(callback)
-    
-    def bind_to_resulttype(self, callback):  # Bind property to Template method
-        self._observers_resulttype.append(callback)
+
+class ModelAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ColorBy = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Color = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Deformed = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ScaleMode = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Scale = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ResolvedInSystem = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ResultType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Model(object):
@@ -1193,19 +1983,10 @@ class Model(object):
     def add_model(self, num_models, graphic, **kwargs):
         self.Graphic_i = graphic
         self.root = graphic.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'color', 'colorby', 'scalemode', 'scale', 'resolvedinsystem', 'resulttype'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class ModelAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ColorBy = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Color = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Deformed = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ScaleMode = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Scale = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ResolvedInSystem = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ResultType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Model = [ModelAttributes() for i in range(num_models)]
 
         for i in range(num_models):  # add all pages
@@ -1213,121 +1994,95 @@ class Model(object):
 
             type = 'model'
             name = type + model_i
-            Model[i].Root = AnyNode(id=name, type=type, parent=self.Graphic_i,
-                                    level=None, model_num=model_i, data=self.graphic)
-            Model[i].Root.level = len(Model[i].Root.ancestors) - 1
-            Model[i].Root.N = len(self.root.leaves)
+            Model[i].Root = self.nodeclass(id=name, type=type, parent=self.Graphic_i,
+                                           level=None, model_num=model_i, data=self.graphic)
+            _attach(Model[i].Root, self.root)
 
             type = 'colorby'
             name = type + model_i
-            Model[i].ColorBy = AnyNode(id=name, type=type, oc=1, parent=Model[i].Root,
-                                       level=None, model_num=model_i, N=None, data=self.colorby)
-            Model[i].ColorBy.level = len(Model[i].Root.ancestors)
-            Model[i].ColorBy.N = len(self.root.leaves)
+            Model[i].ColorBy = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Root,
+                                              level=None, model_num=model_i, N=None, data=self.colorby)
+            _attach(Model[i].ColorBy, self.root)
 
             type = 'color'
             name = type + model_i
-            Model[i].Color = AnyNode(id=name, type=type, oc=1, parent=Model[i].Root,
-                                     level=None, model_num=model_i, N=None, data=self.color)
-            Model[i].Color.level = len(Model[i].Root.ancestors)
-            Model[i].Color.N = len(self.root.leaves)
+            Model[i].Color = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Root,
+                                            level=None, model_num=model_i, N=None, data=self.color)
+            _attach(Model[i].Color, self.root)
 
             type = 'deformed'
             name = type + model_i
-            Model[i].Deformed = AnyNode(id=name, type=type, oc=1, parent=Model[i].Root,
-                                     level=None, model_num=model_i, N=None, data=self.deformed)
-            Model[i].Deformed.level = len(Model[i].Root.ancestors)
-            Model[i].Deformed.N = len(self.root.leaves)
+            Model[i].Deformed = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Root,
+                                            level=None, model_num=model_i, N=None, data=self.deformed)
+            _attach(Model[i].Deformed, self.root)
 
             type = 'scalemode'
             name = type + model_i
-            Model[i].ScaleMode = AnyNode(id=name, type=type, oc=1, parent=Model[i].Deformed,
-                                        level=None, model_num=model_i, N=None, data=self.scalemode)
-            Model[i].ScaleMode.level = len(Model[i].Deformed.ancestors)
-            Model[i].ScaleMode.N = len(self.root.leaves)
+            Model[i].ScaleMode = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Deformed,
+                                               level=None, model_num=model_i, N=None, data=self.scalemode)
+            _attach(Model[i].ScaleMode, self.root)
 
             type = 'scale'
             name = type + model_i
-            Model[i].Scale = AnyNode(id=name, type=type, oc=1, parent=Model[i].Deformed,
-                                         level=None, model_num=model_i, N=None, data=self.scale)
-            Model[i].Scale.level = len(Model[i].Deformed.ancestors)
-            Model[i].Scale.N = len(self.root.leaves)
+            Model[i].Scale = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Deformed,
+                                                level=None, model_num=model_i, N=None, data=self.scale)
+            _attach(Model[i].Scale, self.root)
 
             type = 'resolvedinsystem'
             name = type + model_i
-            Model[i].ResolvedInSystem = AnyNode(id=name, type=type, oc=1, parent=Model[i].Deformed,
-                                     level=None, model_num=model_i, N=None, data=self.resolvedinsystem)
-            Model[i].ResolvedInSystem.level = len(Model[i].Deformed.ancestors)
-            Model[i].ResolvedInSystem.N = len(self.root.leaves)
+            Model[i].ResolvedInSystem = self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Deformed,
+                                            level=None, model_num=model_i, N=None, data=self.resolvedinsystem)
+            _attach(Model[i].ResolvedInSystem, self.root)
 
             type = 'resulttype'
             name = type + model_i
-            Model[i].ResultType= AnyNode(id=name, type=type, oc=1, parent=Model[i].Deformed,
-                                                level=None, model_num=model_i, N=None, data=self.resulttype)
-            Model[i].ResultType.level = len(Model[i].Deformed.ancestors)
-            Model[i].ResultType.N = len(self.root.leaves)
+            Model[i].ResultType= self.nodeclass(id=name, type=type, oc=1, parent=Model[i].Deformed,
+                                                       level=None, model_num=model_i, N=None, data=self.resulttype)
+            _attach(Model[i].ResultType, self.root)
 
         return Model
 
+    @_stateless
     def modify_graphic(self, model_mod):
         _global_callback('graphic', model_mod)
 
+    @_stateless
     def modify_colorby(self, model_mod):
         _global_callback('colorby', model_mod)
 
+    @_stateless
     def modify_color(self, model_mod):
         _global_callback('color', model_mod)
     
+    @_stateless
     def modify_deformed(self, model_mod):
         _global_callback('deformed', model_mod)
     
+    @_stateless
     def modify_scalemode(self, model_mod):
         _global_callback('scalemode', model_mod)
     
+    @_stateless
     def modify_scale(self, model_mod):
         _global_callback('scale', model_mod)
         
+    @_stateless
     def modify_resolvedinsystem(self, model_mod):
         _global_callback('resolvedinsystem', model_mod)
     
+    @_stateless
     def modify_resulttype(self, model_mod):
         _global_callback('resulttype', model_mod)
 
 
-class ResultState(object):
-
-    def __init__(self, **kwargs):
-        self._result = '0'
-        self._currentsubcase = '1, 0'
-
-        self._observers_result = []
-        self._observers_currentsubcase = []
-
-    @property
-    def result(self):
-        return self._result
-
-    @result.setter
-    def result(self, data):
-        self._result = data
-        for callback in self._observers_result:
-            callback(self._result)
-
-    @property
-    def currentsubcase(self):
-        return self._currentsubcase
-
-    @currentsubcase.setter
-    def currentsubcase(self, data):
-        self._currentsubcase = data
-        for callback in self._observers_currentsubcase:
-            callback(self._currentsubcase)
+class ResultState(ObservableState):
+    _fields = (('result', '0'),
+               ('currentsubcase', '1, 0'))
 
-    def bind_to_result(self, callback):
-        self._observers_result.append(callback)
 
-    def bind_to_currentsubcase(self, callback):
-        self._observers_currentsubcase.append(callback)
+class ResultAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    CurrentSubcase = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Result(object):
@@ -1343,13 +2098,10 @@ class Result(object):
     def add_result(self, num_results, model, **kwargs):
         self.Model_i = model
         self.root = model.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'currentsubcase'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class ResultAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            CurrentSubcase = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Result = [ResultAttributes() for i in range(num_results)]
 
         for i in range(num_results):  # add all pages
@@ -1357,61 +2109,35 @@ class Result(object):
 
             type = 'result'
             name = type + result_i
-            Result[i].Root = AnyNode(id=name, type=type, parent=self.Model_i,
-                                     level=None, result_num=result_i, data=self.result)
-            Result[i].Root.level = len(Result[i].Root.ancestors) - 1
-            Result[i].Root.N = len(self.root.leaves)
+            Result[i].Root = self.nodeclass(id=name, type=type, parent=self.Model_i,
+                                            level=None, result_num=result_i, data=self.result)
+            _attach(Result[i].Root, self.root)
 
             type = 'currentsubcase'
             name = type + result_i
-            Result[i].CurrentSubcase = AnyNode(id=name, type=type, oc=1, parent=Result[i].Root,
-                                               level=None, result_num=result_i, N=None, data=self.currentsubcase)
-            Result[i].CurrentSubcase.level = len(Result[i].Root.ancestors)
-            Result[i].CurrentSubcase.N = len(self.root.leaves)
+            Result[i].CurrentSubcase = self.nodeclass(id=name, type=type, oc=1, parent=Result[i].Root,
+                                                      level=None, result_num=result_i, N=None, data=self.currentsubcase)
+            _attach(Result[i].CurrentSubcase, self.root)
 
         return Result
 
+    @_stateless
     def modify_result(self, result_mod):
         _global_callback('result', result_mod)
 
+    @_stateless
     def modify_currentsubcase(self, result_mod):
         _global_callback('currentsubcase', result_mod)
 
 
-class PartState(object):
-
-    def __init__(self, **kwargs):
-        self._part = ', "Global", "PART", 0'
-        self._attribute = 'On, IdOff, 6, Opa, Sha, Msh, InFit, InCut, InIso'
-
-        self._observers_part = []
-        self._observers_attribute = []
-
-    @property
-    def part(self):
-        return self._part
+class PartState(ObservableState):
+    _fields = (('part', ', "Global", "PART", 0'),
+               ('attribute', 'On, IdOff, 6, Opa, Sha, Msh, InFit, InCut, InIso'))
 
-    @part.setter
-    def part(self, data):
-        self._part = data
-        for callback in self._observers_part:
-            callback(self._part)
 
-    @property
-    def attribute(self):
-        return self._attribute
-
-    @attribute.setter
-    def attribute(self, data):
-        self._attribute = data
-        for callback in self._observers_attribute:
-            callback(self._attribute)
-
-    def bind_to_part(self, callback):
-        self._observers_part.append(callback)
-
-    def bind_to_attribute(self, callback):
-        self._observers_attribute.append(callback)
+class PartAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Attribute = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Part(object):
@@ -1427,13 +2153,10 @@ class Part(object):
     def add_part(self, num_parts, model, **kwargs):
         self.Model_i = model
         self.root = model.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'attribute'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class PartAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Attribute = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Part = [PartAttributes() for i in range(num_parts)]
 
         for i in range(num_parts):  # add all pages
@@ -1441,61 +2164,36 @@ class Part(object):
 
             type = 'part'
             name = type + part_i
-            Part[i].Root = AnyNode(id=name, type=type, parent=self.Model_i,
-                                   level=None, part_num=part_i, data=str(int(part_i) + 1) + self.part)
-            Part[i].Root.level = len(Part[i].Root.ancestors) - 1
-            Part[i].Root.N = len(self.root.leaves)
+            Part[i].Root = self.nodeclass(id=name, type=type, parent=self.Model_i,
+                                          level=None, part_num=part_i, data=str(int(part_i) + 1) + self.part)
+            _attach(Part[i].Root, self.root)
 
             type = 'attribute'
             name = type + part_i
-            Part[i].Attribute = AnyNode(id=name, type=type, oc=1, parent=Part[i].Root,
-                                        level=None, part_num=part_i, N=None, data=self.attribute)
-            Part[i].Attribute.level = len(Part[i].Root.ancestors)
-            Part[i].Attribute.N = len(self.root.leaves)
+            Part[i].Attribute = self.nodeclass(id=name, type=type, oc=1, parent=Part[i].Root,
+                                               level=None, part_num=part_i, N=None, data=self.attribute)
+            _attach(Part[i].Attribute, self.root)
 
         return Part
 
+    @_stateless
     def modify_part(self, part_mod):
         _global_callback('part', part_mod)
 
+    @_stateless
     def modify_attribute(self, part_mod):
         _global_callback('attribute', part_mod)
 
 
-class GroupState(object):
-
-    def __init__(self, **kwargs):
-        self._group = 'D Set", "Off", "Off", "  0   0 255", 1, "wire"'
-        self._selection = 'Part, SelectAll, "User_Set", '
-
-        self._observers_group = []
-        self._observers_selection = []
-
-    @property
-    def group(self):
-        return self._group
-
-    @group.setter
-    def group(self, data):
-        self._group = data
-        for callback in self._observers_group:
-            callback(self._group)
-
-    @property
-    def selection(self):
-        return self._selection
-
-    @selection.setter
-    def selection(self, data):
-        self._selection = data
-        for callback in self._observers_selection:
-            callback(self._selection)
+class GroupState(ObservableState):
+    _fields = (('group', 'D Set", "Off", "Off", "  0   0 255", 1, "wire"'),
+               ('selection', 'Part, SelectAll, "User_Set", '))
 
-    def bind_to_group(self, callback):
-        self._observers_group.append(callback)
 
-    def bind_to_selection(self, callback):
-        self._observers_selection.append(callback)
+class GroupAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Selection = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Add = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Group(object):
@@ -1511,14 +2209,10 @@ class Group(object):
     def add_group(self, num_groups, dimension, model, **kwargs):
         self.Model_i = model
         self.root = model.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'selection'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class GroupAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Selection = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Add = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Group = [GroupAttributes() for i in range(num_groups)]
 
         for i in range(num_groups):  # add all pages
@@ -1526,293 +2220,72 @@ class Group(object):
 
             type = 'group'
             name = type + group_i
-            Group[i].Root = AnyNode(id=name, type=type, parent=self.Model_i,
-                                   level=None, group_num=group_i, data='"'+str(dimension) + self.group)
-            Group[i].Root.level = len(Group[i].Root.ancestors) - 1
-            Group[i].Root.N = len(self.root.leaves)
+            Group[i].Root = self.nodeclass(id=name, type=type, parent=self.Model_i,
+                                          level=None, group_num=group_i, data='"'+str(dimension) + self.group)
+            _attach(Group[i].Root, self.root)
 
             type = 'groupselection'
             name = type + group_i
-            Group[i].Selection = AnyNode(id=name, type=type, oc=1, parent=Group[i].Root,
-                                        level=None, group_num=group_i, N=None, data=self.selection + str(i+1))
-            Group[i].Selection.level = len(Group[i].Root.ancestors)
-            Group[i].Selection.N = len(self.root.leaves)
+            Group[i].Selection = self.nodeclass(id=name, type=type, oc=1, parent=Group[i].Root,
+                                               level=None, group_num=group_i, N=None, data=self.selection + str(i+1))
+            _attach(Group[i].Selection, self.root)
 
             type = 'groupselectionadd'
             name = type + group_i
-            Group[i].Add = AnyNode(id=name, type=type, oc=1, parent=Group[i].Selection,
-                                         level=None, group_num=group_i, N=None, data='dimension == ' + str(dimension))
-            Group[i].Add.level = len(Group[i].Selection.ancestors)
-            Group[i].Add.N = len(self.root.leaves)
+            Group[i].Add = self.nodeclass(id=name, type=type, oc=1, parent=Group[i].Selection,
+                                                level=None, group_num=group_i, N=None,
+                                                data='dimension == ' + str(dimension))
+            _attach(Group[i].Add, self.root)
 
         return Group
 
+    @_stateless
     def modify_group(self, group_mod):
         _global_callback('group', group_mod)
 
+    @_stateless
     def modify_selection(self, group_mod):
         _global_callback('selection', group_mod)
 
 
-class ContourState(object):
-
-    def __init__(self, **kwargs):
-        self._contour = ''
-        self._selection = 'Part, SelectAll, "User_Set", '
-        self._add = 'Displayed'
-        self._resulttype = 'Displacement'
-        self._displayoptions = '"ContourOn", "LegendOn", "MeasuresOn", "NotesOn"'
-        self._datacomponent = 'Mag'
-        self._multiplelayers = 'false'
-        self._layer = 'Max'
-        self._layerfilter = '0'
-        self._complexfilter = 'mag'
-        self._resolvedinsystem = '-1'
-        self._averagingmethod = '"Simple", -0.01'
-        self._averageacrossparts = 'Off'
-        self._showmidsidenoderesults = 'On'
-        self._featureangleaverage = 'Off, 50, On'
-        self._averagecolor = 'yes'
-        self._discretecolor = 'yes'
-
-        self._observers_contour = []
-        self._observers_selection = []
-        self._observers_add = []
-        self._observers_resulttype = []
-        self._observers_displayoptions = []
-        self._observers_datacomponent = []
-        self._observers_multiplelayers = []
-        self._observers_layer = []
-        self._observers_layerfilter = []
-        self._observers_complexfilter = []
-        self._observers_resolvedinsystem = []
-        self._observers_averagingmethod = []
-        self._observers_averageacrossparts = []
-        self._observers_showmidsidenoderesults = []
-        self._observers_featureangleaverage = []
-        self._observers_averagecolor = []
-        self._observers_discretecolor = []
-
-    @property
-    def contour(self):
-        return self._contour
-
-    @contour.setter
-    def contour(self, data):
-        self._contour = data
-        for callback in self._observers_contour:
-            callback(self._contour)
-
-    @property
-    def selection(self):
-        return self._selection
-
-    @selection.setter
-    def selection(self, data):
-        self._selection = data
-        for callback in self._observers_selection:
-            callback(self._selection)
-
-    @property
-    def add(self):
-        return self._add
-
-    @add.setter
-    def add(self, data):
-        self._add = data
-        for callback in self._observers_add:
-            callback(self._add)
-
-    @property
-    def resulttype(self):
-        return self._resulttype
-
-    @resulttype.setter
-    def resulttype(self, data):
-        self._resulttype = data
-        for callback in self._observers_resulttype:
-            callback(self._resulttype)
-
-    @property
-    def displayoptions(self):
-        return self._displayoptions
-
-    @displayoptions.setter
-    def displayoptions(self, data):
-        self._displayoptions = data
-        for callback in self._observers_displayoptions:
-            callback(self._displayoptions)
-
-    @property
-    def datacomponent(self):
-        return self._datacomponent
-
-    @datacomponent.setter
-    def datacomponent(self, data):
-        self._datacomponent = data
-        for callback in self._observers_datacomponent:
-            callback(self._datacomponent)
-
-    @property
-    def multiplelayers(self):
-        return self._multiplelayers
-
-    @multiplelayers.setter
-    def multiplelayers(self, data):
-        self._multiplelayers = data
-        for callback in self._observers_multiplelayers:
-            callback(self._multiplelayers)
-
-    @property
-    def layer(self):
-        return self._layer
-
-    @layer.setter
-    def layer(self, data):
-        self._layer = data
-        for callback in self._observers_layer:
-            callback(self._layer)
-
-    @property
-    def layerfilter(self):
-        return self._layerfilter
-
-    @layerfilter.setter
-    def layerfilter(self, data):
-        self._layerfilter = data
-        for callback in self._observers_layerfilter:
-            callback(self._layerfilter)
-
-    @property
-    def complexfilter(self):
-        return self._complexfilter
-
-    @complexfilter.setter
-    def complexfilter(self, data):
-        self._complexfilter = data
-        for callback in self._observers_complexfilter:
-            callback(self._complexfilter)
-
-    @property
-    def resolvedinsystem(self):
-        return self._resolvedinsystem
-
-    @resolvedinsystem.setter
-    def resolvedinsystem(self, data):
-        self._resolvedinsystem = data
-        for callback in self._observers_resolvedinsystem:
-            callback(self._resolvedinsystem)
-
-    @property
-    def averagingmethod(self):
-        return self._averagingmethod
-
-    @averagingmethod.setter
-    def averagingmethod(self, data):
-        self._averagingmethod = data
-        for callback in self._observers_averagingmethod:
-            callback(self._averagingmethod)
-
-    @property
-    def averageacrossparts(self):
-        return self._averageacrossparts
-
-    @averageacrossparts.setter
-    def averageacrossparts(self, data):
-        self._averageacrossparts = data
-        for callback in self._observers_averageacrossparts:
-            callback(self._averageacrossparts)
-
-    @property
-    def showmidsidenoderesults(self):
-        return self._showmidsidenoderesults
-
-    @showmidsidenoderesults.setter
-    def showmidsidenoderesults(self, data):
-        self._showmidsidenoderesults = data
-        for callback in self._observers_showmidsidenoderesults:
-            callback(self._showmidsidenoderesults)
-
-    @property
-    def featureangleaverage(self):
-        return self._featureangleaverage
-
-    @featureangleaverage.setter
-    def featureangleaverage(self, data):
-        self._featureangleaverage = data
-        for callback in self._observers_featureangleaverage:
-            callback(self._featureangleaverage)
-
-    @property
-    def averagecolor(self):
-        return self._averagecolor
-
-    @averagecolor.setter
-    def averagecolor(self, data):
-        self._averagecolor = data
-        for callback in self._observers_averagecolor:
-            callback(self._averagecolor)
-    
-    @property
-    def discretecolor(self):
-        return self._discretecolor
-
-    @discretecolor.setter
-    def discretecolor(self, data):
-        self._discretecolor = data
-        for callback in self._observers_discretecolor:
-            callback(self._discretecolor)
-
-    def bind_to_contour(self, callback):
-        self._observers_contour.append(callback)
-
-    def bind_to_selection(self, callback):
-        self._observers_selection.append(callback)
-
-    def bind_to_add(self, callback):
-        self._observers_add.append(callback)
-
-    def bind_to_resulttype(self, callback):
-        self._observers_resulttype.append(callback)
-
-    def bind_to_displayoptions(self, callback):
-        self._observers_displayoptions.append(callback)
-
-    def bind_to_datacomponent(self, callback):
-        self._observers_datacomponent.append(callback)
-
-    def bind_to_multiplelayers(self, callback):
-        self._observers_multiplelayers.append(callback)
-
-    def bind_to_layer(self, callback):
-        self._observers_layer.append(callback)
-
-    def bind_to_layerfilter(self, callback):
-        self._observers_layerfilter.append(callback)
-
-    def bind_to_complexfilter(self, callback):
-        self._observers_complexfilter.append(callback)
-
-    def bind_to_resolvedinsystem(self, callback):
-        self._observers_resolvedinsystem.append(callback)
-
-    def bind_to_averagingmethod(self, callback):
-        self._observers_averagingmethod.append(callback)
-
-    def bind_to_averageacrossparts(self, callback):
-        self._observers_averageacrossparts.append(callback)
-    
-    def bind_to_showmidsidenoderesults(self, callback):
-        self._observers_showmidsidenoderesults.append(callback)
-    
-    def bind_to_featureangleaverage(self, callback):
-        self._observers_featureangleaverage.append(callback)
-        
-    def bind_to_averagecolor(self, callback):
-        self._observers_averagecolor.append(callback)
-    
-    def bind_to_discretecolor(self, callback):
-        self._observers_discretecolor.append(callback)
+class ContourState(ObservableState):
+    _fields = (('contour', ''),
+               ('selection', 'Part, SelectAll, "User_Set", '),
+               ('add', 'Displayed'),
+               ('resulttype', 'Displacement'),
+               ('displayoptions', '"ContourOn", "LegendOn", "MeasuresOn", "NotesOn"'),
+               ('datacomponent', 'Mag'),
+               ('multiplelayers', 'false'),
+               ('layer', 'Max'),
+               ('layerfilter', '0'),
+               ('complexfilter', 'mag'),
+               ('resolvedinsystem', '-1'),
+               ('averagingmethod', '"Simple", -0.01'),
+               ('averageacrossparts', 'Off'),
+               ('showmidsidenoderesults', 'On'),
+               ('featureangleaverage', 'Off, 50, On'),
+               ('averagecolor', 'yes'),
+               ('discretecolor', 'yes'))
+
+
+class ContourAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Selection = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Add = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ResultType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    DisplayOptions = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    DataComponent = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    MultipleLayers = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Layer = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    LayerFilter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ComplexFilter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ResolvedInSystem = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AveragingMethod = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AverageAcrossParts = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowMidsideNodeResults = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    FeatureAngleAverage = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AverageColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    DiscreteColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Contour(object):
@@ -1859,30 +2332,12 @@ class Contour(object):
         self.Model_i = model
         self.Graphic_i = _get_parent(model, 'Graphic')
         self.root = model.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'selection', 'resulttype', 'displayoptions', 'datacomponent', 'layer', 'layerfilter',
                         'complexfilter', 'resolvedinsystem', 'averagingsystem', 'averagingmethod', 'averageacrossparts',
                         'showmidsidenoderesults', 'featureangleaverage', 'averagecolor', 'discretecolor'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class ContourAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Selection = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Add = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ResultType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            DisplayOptions = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            DataComponent = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            MultipleLayers = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Layer = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            LayerFilter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ComplexFilter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ResolvedInSystem = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AveragingMethod = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AverageAcrossParts = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowMidsideNodeResults = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            FeatureAngleAverage = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AverageColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            DiscreteColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-
         Contour = [ContourAttributes() for i in range(num_contours)]
 
         if _is_valid_contour(self.resulttype, self.datacomponent):
@@ -1891,132 +2346,119 @@ class Contour(object):
 
                 type = 'contour'
                 name = type + contour_i
-                Contour[i].Root = AnyNode(id=name, type=type, parent=self.Model_i,
-                                        level=None, contour_num=contour_i, data='')
-                Contour[i].Root.level = len(Contour[i].Root.ancestors) - 1
-                Contour[i].Root.N = len(self.root.leaves)
+                Contour[i].Root = self.nodeclass(id=name, type=type, parent=self.Model_i,
+                                               level=None, contour_num=contour_i, data='')
+                _attach(Contour[i].Root, self.root)
 
                 type = 'contourselection'
                 name = type + contour_i
-                Contour[i].Selection = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                             level=None, contour_num=contour_i, N=None, data=self.selection + str(i + 1))
-                Contour[i].Selection.level = len(Contour[i].Root.ancestors)
-                Contour[i].Selection.N = len(self.root.leaves)
+                Contour[i].Selection = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                    level=None, contour_num=contour_i, N=None,
+                                                    data=self.selection + str(i + 1))
+                _attach(Contour[i].Selection, self.root)
 
                 type = 'contourselectionadd'
                 name = type + contour_i
-                Contour[i].Add = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Selection,
-                                       level=None, contour_num=contour_i, N=None, data=self.add)
-                Contour[i].Add.level = len(Contour[i].Selection.ancestors)
-                Contour[i].Add.N = len(self.root.leaves)
+                Contour[i].Add = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Selection,
+                                              level=None, contour_num=contour_i, N=None, data=self.add)
+                _attach(Contour[i].Add, self.root)
 
                 type = 'resulttype'
                 name = type + contour_i
-                Contour[i].ResultType = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                         level=None, contour_num=contour_i, N=None, data=self.resulttype)
-                Contour[i].ResultType.level = len(Contour[i].Root.ancestors)
-                Contour[i].ResultType.N = len(self.root.leaves)
+                Contour[i].ResultType = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                level=None, contour_num=contour_i, N=None, data=self.resulttype)
+                _attach(Contour[i].ResultType, self.root)
 
                 type = 'displayoptions'
                 name = type + contour_i
-                Contour[i].DisplayOptions = AnyNode(id=name, type=type, oc=1, parent=self.Graphic_i,
-                                                level=None, contour_num=contour_i, N=None, data=self.displayoptions)
-                Contour[i].DisplayOptions.level = len(self.Graphic_i.ancestors)
-                Contour[i].DisplayOptions.N = len(self.root.leaves)
+                Contour[i].DisplayOptions = self.nodeclass(id=name, type=type, oc=1, parent=self.Graphic_i,
+                                                       level=None, contour_num=contour_i, N=None,
+                                                       data=self.displayoptions)
+                _attach(Contour[i].DisplayOptions, self.root)
 
                 type = 'datacomponent'
                 name = type + contour_i
-                Contour[i].DataComponent = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                    level=None, contour_num=contour_i, N=None, data=self.datacomponent)
-                Contour[i].DataComponent.level = len(Contour[i].Root.ancestors)
-                Contour[i].DataComponent.N = len(self.root.leaves)
+                Contour[i].DataComponent = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                           level=None, contour_num=contour_i, N=None,
+                                                           data=self.datacomponent)
+                _attach(Contour[i].DataComponent, self.root)
 
                 type = 'multiplelayers'
                 name = type + contour_i
-                Contour[i].MultipleLayers = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                   level=None, contour_num=contour_i, N=None, data=self.multiplelayers)
-                Contour[i].MultipleLayers.level = len(Contour[i].Root.ancestors)
-                Contour[i].MultipleLayers.N = len(self.root.leaves)
+                Contour[i].MultipleLayers = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                          level=None, contour_num=contour_i, N=None,
+                                                          data=self.multiplelayers)
+                _attach(Contour[i].MultipleLayers, self.root)
 
                 type = 'layer'
                 name = type + contour_i
-                Contour[i].Layer = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                    level=None, contour_num=contour_i, N=None,
-                                                    data=self.layer)
-                Contour[i].Layer.level = len(Contour[i].Root.ancestors)
-                Contour[i].Layer.N = len(self.root.leaves)
+                Contour[i].Layer = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                           level=None, contour_num=contour_i, N=None,
+                                                           data=self.layer)
+                _attach(Contour[i].Layer, self.root)
 
                 type = 'layerfilter'
                 name = type + contour_i
-                Contour[i].LayerFilter = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                           level=None, contour_num=contour_i, N=None,
-                                           data=self.layerfilter)
-                Contour[i].LayerFilter.level = len(Contour[i].Root.ancestors)
-                Contour[i].LayerFilter.N = len(self.root.leaves)
+                Contour[i].LayerFilter = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                  level=None, contour_num=contour_i, N=None,
+                                                  data=self.layerfilter)
+                _attach(Contour[i].LayerFilter, self.root)
 
                 type = 'complexfilter'
                 name = type + contour_i
-                Contour[i].ComplexFilter = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                 level=None, contour_num=contour_i, N=None,
-                                                 data=self.complexfilter)
-                Contour[i].ComplexFilter.level = len(Contour[i].Root.ancestors)
-                Contour[i].ComplexFilter.N = len(self.root.leaves)
+                Contour[i].ComplexFilter = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                        level=None, contour_num=contour_i, N=None,
+                                                        data=self.complexfilter)
+                _attach(Contour[i].ComplexFilter, self.root)
 
                 type = 'resolvedinsystem'
                 name = type + contour_i
-                Contour[i].ResolvedInSystem = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                   level=None, contour_num=contour_i, N=None,
-                                                   data=self.resolvedinsystem)
-                Contour[i].ResolvedInSystem.level = len(Contour[i].Root.ancestors)
-                Contour[i].ResolvedInSystem.N = len(self.root.leaves)
+                Contour[i].ResolvedInSystem = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                          level=None, contour_num=contour_i, N=None,
+                                                          data=self.resolvedinsystem)
+                _attach(Contour[i].ResolvedInSystem, self.root)
 
                 type = 'averagingmethod'
                 name = type + contour_i
-                Contour[i].AveragingMethod = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                      level=None, contour_num=contour_i, N=None,
-                                                      data=self.averagingmethod)
-                Contour[i].AveragingMethod.level = len(Contour[i].Root.ancestors)
-                Contour[i].AveragingMethod.N = len(self.root.leaves)
+                Contour[i].AveragingMethod = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                             level=None, contour_num=contour_i, N=None,
+                                                             data=self.averagingmethod)
+                _attach(Contour[i].AveragingMethod, self.root)
 
                 type = 'averageacrossparts'
                 name = type + contour_i
-                Contour[i].AverageAcrossParts = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                     level=None, contour_num=contour_i, N=None,
-                                                     data =self.averageacrossparts)
-                Contour[i].AverageAcrossParts.level = len(Contour[i].Root.ancestors)
-                Contour[i].AverageAcrossParts.N = len(self.root.leaves)
+                Contour[i].AverageAcrossParts = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                            level=None, contour_num=contour_i, N=None,
+                                                            data =self.averageacrossparts)
+                _attach(Contour[i].AverageAcrossParts, self.root)
 
                 type = 'showmidsidenoderesults'
                 name = type + contour_i
-                Contour[i].ShowMidsideNodeResults = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                        level=None, contour_num=contour_i, N=None,
-                                                        data=self.showmidsidenoderesults)
-                Contour[i].ShowMidsideNodeResults.level = len(Contour[i].Root.ancestors)
-                Contour[i].ShowMidsideNodeResults.N = len(self.root.leaves)
+                Contour[i].ShowMidsideNodeResults = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                               level=None, contour_num=contour_i, N=None,
+                                                               data=self.showmidsidenoderesults)
+                _attach(Contour[i].ShowMidsideNodeResults, self.root)
 
                 type = 'featureangleaverage'
                 name = type + contour_i
-                Contour[i].FeatureAngleAverage = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                            level=None, contour_num=contour_i, N=None,
-                                                            data=self.featureangleaverage)
-                Contour[i].FeatureAngleAverage.level = len(Contour[i].Root.ancestors)
-                Contour[i].FeatureAngleAverage.N = len(self.root.leaves)
+                Contour[i].FeatureAngleAverage = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                                   level=None, contour_num=contour_i, N=None,
+                                                                   data=self.featureangleaverage)
+                _attach(Contour[i].FeatureAngleAverage, self.root)
 
                 type = 'averagecolor'
                 name = type + contour_i
-                Contour[i].AverageColor = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                   level=None, contour_num=contour_i, N=None,
-                                                   data=self.averagecolor)
-                Contour[i].AverageColor.level = len(Contour[i].Root.ancestors)
-                Contour[i].AverageColor.N = len(self.root.leaves)
+                Contour[i].AverageColor = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                          level=None, contour_num=contour_i, N=None,
+                                                          data=self.averagecolor)
+                _attach(Contour[i].AverageColor, self.root)
                 
                 type = 'discretecolor'
                 name = type + contour_i
-                Contour[i].DiscreteColor = AnyNode(id=name, type=type, oc=1, parent=Contour[i].Root,
-                                                            level=None, contour_num=contour_i, N=None,
-                                                            data=self.discretecolor)
-                Contour[i].DiscreteColor.level = len(Contour[i].Root.ancestors)
-                Contour[i].DiscreteColor.N = len(self.root.leaves)
+                Contour[i].DiscreteColor = self.nodeclass(id=name, type=type, oc=1, parent=Contour[i].Root,
+                                                                   level=None, contour_num=contour_i, N=None,
+                                                                   data=self.discretecolor)
+                _attach(Contour[i].DiscreteColor, self.root)
 
         else:
             print('\n :: Error :: Invalid contour specified.\n')
@@ -2024,333 +2466,116 @@ class Contour(object):
 
         return Contour
 
+    @_stateless
     def modify_contour(self, contour_mod):
         _global_callback('contour', contour_mod)
 
+    @_stateless
     def modify_selection(self, contour_mod):
         _global_callback('selection', contour_mod)
 
+    @_stateless
     def modify_add(self, contour_mod):
         _global_callback('add', contour_mod)
 
+    @_stateless
     def modify_resulttype(self, contour_mod):
         _global_callback('resulttype', contour_mod)
 
+    @_stateless
     def modify_displayoptions(self, contour_mod):
         _global_callback('displayoptions', contour_mod)
 
+    @_stateless
     def modify_datacomponent(self, contour_mod):
         _global_callback('datacomponent', contour_mod)
 
+    @_stateless
     def modify_multiplelayers(self, contour_mod):
         _global_callback('multiplelayers', contour_mod)
 
+    @_stateless
     def modify_layer(self, contour_mod):
         _global_callback('layer', contour_mod)
 
+    @_stateless
     def modify_layerfilter(self, contour_mod):
         _global_callback('layerfilter', contour_mod)
 
+    @_stateless
     def modify_complexfilter(self, contour_mod):
         _global_callback('complexfilter', contour_mod)
 
+    @_stateless
     def modify_resolvedinsystem(self, contour_mod):
         _global_callback('resolvedinsystem', contour_mod)
 
+    @_stateless
     def modify_averagingmethod(self, contour_mod):
         _global_callback('averagingmethod', contour_mod)
 
+    @_stateless
     def modify_averageacrossparts(self, contour_mod):
         _global_callback('averageacrossparts', contour_mod)
     
+    @_stateless
     def modify_showmidsidenoderesults(self, contour_mod):
         _global_callback('showmidsidenoderesults', contour_mod)
 
+    @_stateless
     def modify_featureangleaverage(self, contour_mod):
         _global_callback('featureangleaverage', contour_mod)
 
+    @_stateless
     def modify_averagecolor(self, contour_mod):
         _global_callback('averagecolor', contour_mod)
 
+    @_stateless
     def modify_discretecolor(self, contour_mod):
         _global_callback('discretecolor', contour_mod)
 
 
-class LegendState(object):
-
-    def __init__(self, **kwargs):
-        self._legend = ''
-        self._legendtype = 'Static'
-        self._numcols = '9'
-        self._legendmaxthreshold = '"Off", 1'
-        self._legendminthreshold = 'Off, 0'
-        self._colorrgb = '"0 0 200", "21 121 255", "0 199 221", "40 255 185", "57 255 0", ' \
-                         '"170 255 0", "255 227 0", "255 113 0", "255 0 0"'
-        self._noresultcolor = '192 192 192'
-        self._numbers = '"show", "scientific", 3'
-        self._showmax = 'show'
-        self._showmaxlocal = 'hide'
-        self._showmin = 'show'
-        self._showminlocal = 'hide'
-        self._entitylabel = 'show'
-        self._showbymodel = 'hide'
-        self._legendposition = 'UpperLeft'
-        self._backgroundcolor = ' 44  85 126'
-        self._transparency = 'On'
-        self._filter = 'LINEAR'
-
-        self._observers_legend = []
-        self._observers_legendtype = []
-        self._observers_numcols = []
-        self._observers_legendmaxthreshold = []
-        self._observers_legendminthreshold = []
-        self._observers_colorrgb = []
-        self._observers_noresultcolor = []
-        self._observers_numbers = []
-        self._observers_showmax = []
-        self._observers_showmaxlocal = []
-        self._observers_showmin = []
-        self._observers_showminlocal = []
-        self._observers_entitylabel = []
-        self._observers_showbymodel = []
-        self._observers_legendposition = []
-        self._observers_backgroundcolor = []
-        self._observers_transparency = []
-        self._observers_filter = []
-
-    @property
-    def legend(self):
-        return self._legend
-
-    @legend.setter
-    def legend(self, data):
-        self._legend = data
-        for callback in self._observers_legend:
-            callback(self._legend)
-
-    @property
-    def legendtype(self):
-        return self._legendtype
-
-    @legendtype.setter
-    def legendtype(self, data):
-        self._legendtype = data
-        for callback in self._observers_legendtype:
-            callback(self._legendtype)
-
-    @property
-    def numcols(self):
-        return self._numcols
-
-    @numcols.setter
-    def numcols(self, data):
-        self._numcols = data
-        for callback in self._observers_numcols:
-            callback(self._numcols)
-
-    @property
-    def legendmaxthreshold(self):
-        return self._legendmaxthreshold
-
-    @legendmaxthreshold.setter
-    def legendmaxthreshold(self, data):
-        self._legendmaxthreshold = data
-        for callback in self._observers_legendmaxthreshold:
-            callback(self._legendmaxthreshold)
-
-    @property
-    def legendminthreshold(self):
-        return self._legendminthreshold
-
-    @legendminthreshold.setter
-    def legendminthreshold(self, data):
-        self._legendminthreshold = data
-        for callback in self._observers_legendminthreshold:
-            callback(self._legendminthreshold)
-
-    @property
-    def colorrgb(self):
-        return self._colorrgb
-
-    @colorrgb.setter
-    def colorrgb(self, data):
-        self._colorrgb = data
-        for callback in self._observers_colorrgb:
-            callback(self._colorrgb)
-
-    @property
-    def noresultcolor(self):
-        return self._noresultcolor
-
-    @noresultcolor.setter
-    def noresultcolor(self, data):
-        self._noresultcolor = data
-        for callback in self._observers_noresultcolor:
-            callback(self._noresultcolor)
-
-    @property
-    def numbers(self):
-        return self._numbers
-
-    @numbers.setter
-    def numbers(self, data):
-        self._numbers = data
-        for callback in self._observers_numbers:
-            callback(self._numbers)
-
-    @property
-    def showmax(self):
-        return self._showmax
-
-    @showmax.setter
-    def showmax(self, data):
-        self._showmax = data
-        for callback in self._observers_showmax:
-            callback(self._showmax)
-
-    @property
-    def showmaxlocal(self):
-        return self._showmaxlocal
-
-    @showmaxlocal.setter
-    def showmaxlocal(self, data):
-        self._showmaxlocal = data
-        for callback in self._observers_showmaxlocal:
-            callback(self._showmaxlocal)
-
-    @property
-    def showmin(self):
-        return self._showmin
-
-    @showmin.setter
-    def showmin(self, data):
-        self._showmin = data
-        for callback in self._observers_showmin:
-            callback(self._showmin)
-
-    @property
-    def showminlocal(self):
-        return self._showminlocal
-
-    @showminlocal.setter
-    def showminlocal(self, data):
-        self._showminlocal = data
-        for callback in self._observers_showminlocal:
-            callback(self._showminlocal)
-
-    @property
-    def entitylabel(self):
-        return self._entitylabel
-
-    @entitylabel.setter
-    def entitylabel(self, data):
-        self._entitylabel = data
-        for callback in self._observers_entitylabel:
-            callback(self._entitylabel)
-
-    @property
-    def showbymodel(self):
-        return self._showbymodel
-
-    @showbymodel.setter
-    def showbymodel(self, data):
-        self._showbymodel = data
-        for callback in self._observers_showbymodel:
-            callback(self._showbymodel)
-
-    @property
-    def legendposition(self):
-        return self._legendposition
-
-    @legendposition.setter
-    def legendposition(self, data):
-        self._legendposition = data
-        for callback in self._observers_legendposition:
-            callback(self._legendposition)
-
-    @property
-    def backgroundcolor(self):
-        return self._backgroundcolor
-
-    @backgroundcolor.setter
-    def backgroundcolor(self, data):
-        self._backgroundcolor = data
-        for callback in self._observers_backgroundcolor:
-            callback(self._backgroundcolor)
-
-    @property
-    def transparency(self):
-        return self._transparency
-
-    @transparency.setter
-    def transparency(self, data):
-        self._transparency = data
-        for callback in self._observers_transparency:
-            callback(self._transparency)
-
-    @property
-    def filter(self):
-        return self._filter
-
-    @filter.setter
-    def filter(self, data):
-        self._filter = data
-        for callback in self._observers_filter:
-            callback(self._filter)
-            
-    def bind_to_legend(self, callback):
-        self._observers_legend.append(callback)
-
-    def bind_to_legendtype(self, callback):
-        self._observers_legendtype.append(callback)
-    
-    def bind_to_numcols(self, callback):
-        self._observers_numcols.append(callback)
-    
-    def bind_to_legendmaxthreshold(self, callback):
-        self._observers_legendmaxthreshold.append(callback)
-    
-    def bind_to_legendminthreshold(self, callback):
-        self._observers_legendminthreshold.append(callback)
-        
-    def bind_to_colorrgb(self, callback):
-        self._observers_colorrgb.append(callback)
-    
-    def bind_to_noresultcolor(self, callback):
-        self._observers_noresultcolor.append(callback)
-    
-    def bind_to_numbers(self, callback):
-        self._observers_numbers.append(callback)
-        
-    def bind_to_showmax(self, callback):
-        self._observers_showmax.append(callback)
-    
-    def bind_to_showmaxlocal(self, callback):
-        self._observers_showmaxlocal.append(callback)
-
-    def bind_to_showmin(self, callback):
-        self._observers_showmin.append(callback)
-
-    def bind_to_showminlocal(self, callback):
-        self._observers_showminlocal.append(callback)
-
-    def bind_to_entitylabel(self, callback):
-        self._observers_entitylabel.append(callback)
-    
-    def bind_to_showbymodel(self, callback):
-        self._observers_showbymodel.append(callback)
-    
-    def bind_to_legendposition(self, callback):
-        self._observers_legendposition.append(callback)
-    
-    def bind_to_backgroundcolor(self, callback):
-        self._observers_backgroundcolor.append(callback)
-    
-    def bind_to_transparency(self, callback):
-        self._observers_transparency.append(callback)
-    
-    def bind_to_filter(self, callback):
-        self._observers_filter.append(callback)
+class LegendState(ObservableState):
+    _fields = (('legend', ''),
+               ('legendtype', 'Static'),
+               ('numcols', '9'),
+               ('legendmaxthreshold', '"Off", 1'),
+               ('legendminthreshold', 'Off, 0'),
+               ('colorrgb', '"0 0 200", "21 121 255", "0 199 221", "40 255 185", "57 255 0", '
+                             '"170 255 0", "255 227 0", "255 113 0", "255 0 0"'),
+               ('noresultcolor', '192 192 192'),
+               ('numbers', '"show", "scientific", 3'),
+               ('showmax', 'show'),
+               ('showmaxlocal', 'hide'),
+               ('showmin', 'show'),
+               ('showminlocal', 'hide'),
+               ('entitylabel', 'show'),
+               ('showbymodel', 'hide'),
+               ('legendposition', 'UpperLeft'),
+               ('backgroundcolor', ' 44  85 126'),
+               ('transparency', 'On'),
+               ('filter', 'LINEAR'))
+
+
+class LegendAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    LegendType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    NumCols = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    LegendMaxThreshold = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    LegendMinThreshold = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ColorRgb = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    NoResultColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Numbers = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowMax = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowMaxLocal = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowMin = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowMinLocal = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    EntityLabel = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    ShowByModel = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    LegendPosition = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    BackGroundColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Transparency = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Filter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Legend(object):
@@ -2398,31 +2623,12 @@ class Legend(object):
     def add_legend(self, num_legends, contour, **kwargs):
         self.Contour_i = contour
         self.root = contour.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'legendtype', 'nulcols', 'legendmaxthreshold', 'legendminthreshold',
                         'colorrgb', 'noresultcolor', 'numbers', 'showmax', 'showmaxlocal', 'showmin', 'showminlocal',
                         'entitylabel', 'showbymodel', 'legendposition', 'backgroundcolor', 'transparency', 'filter'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class LegendAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            LegendType = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            NumCols = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            LegendMaxThreshold = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            LegendMinThreshold = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ColorRgb = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            NoResultColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Numbers = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowMax = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowMaxLocal = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowMin = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowMinLocal = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            EntityLabel = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            ShowByModel = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            LegendPosition = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            BackGroundColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Transparency = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Filter = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            
         Legend = [LegendAttributes() for i in range(num_legends)]
 
         for i in range(num_legends):  # add all pages
@@ -2430,433 +2636,226 @@ class Legend(object):
 
             type = 'legend'
             name = type + legend_i
-            Legend[i].Root = AnyNode(id=name, type=type, parent=self.Contour_i,
-                                   level=None, legend_num=legend_i, data=self.legend)
-            Legend[i].Root.level = len(self.Contour_i.ancestors)
-            Legend[i].Root.N = len(self.root.leaves)
+            Legend[i].Root = self.nodeclass(id=name, type=type, parent=self.Contour_i,
+                                          level=None, legend_num=legend_i, data=self.legend)
+            _attach(Legend[i].Root, self.root)
 
             type = 'legendtype'
             name = type + legend_i
-            Legend[i].LegendType = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                        level=None, legend_num=legend_i, N=None, data=self.legendtype)
-            Legend[i].LegendType.level = len(Legend[i].Root.ancestors)
-            Legend[i].LegendType.N = len(self.root.leaves)
+            Legend[i].LegendType = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                               level=None, legend_num=legend_i, N=None, data=self.legendtype)
+            _attach(Legend[i].LegendType, self.root)
 
             type = 'numcols'
             name = type + legend_i
-            Legend[i].NumCols = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                           level=None, legend_num=legend_i, N=None, data=self.numcols)
-            Legend[i].NumCols.level = len(Legend[i].Root.ancestors)
-            Legend[i].NumCols.N = len(self.root.leaves)
+            Legend[i].NumCols = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                  level=None, legend_num=legend_i, N=None, data=self.numcols)
+            _attach(Legend[i].NumCols, self.root)
 
             type = 'legendmaxthreshold'
             name = type + legend_i
-            Legend[i].LegendMaxThreshold = AnyNode(id=name, type=type, oc=1, parent=self.Contour_i,
-                                        level=None, legend_num=legend_i, N=None, data=self.legendmaxthreshold)
-            Legend[i].LegendMaxThreshold.level = len(self.Contour_i.ancestors)
-            Legend[i].LegendMaxThreshold.N = len(self.root.leaves)
+            Legend[i].LegendMaxThreshold = self.nodeclass(id=name, type=type, oc=1, parent=self.Contour_i,
+                                               level=None, legend_num=legend_i, N=None, data=self.legendmaxthreshold)
+            _attach(Legend[i].LegendMaxThreshold, self.root)
 
             type = 'legendminthreshold'
             name = type + legend_i
-            Legend[i].LegendMinThreshold = AnyNode(id=name, type=type, oc=1, parent=self.Contour_i,
-                                                   level=None, legend_num=legend_i, N=None,
-                                                   data=self.legendminthreshold)
-            Legend[i].LegendMinThreshold.level = len(self.Contour_i.ancestors)
-            Legend[i].LegendMinThreshold.N = len(self.root.leaves)
+            Legend[i].LegendMinThreshold = self.nodeclass(id=name, type=type, oc=1, parent=self.Contour_i,
+                                                          level=None, legend_num=legend_i, N=None,
+                                                          data=self.legendminthreshold)
+            _attach(Legend[i].LegendMinThreshold, self.root)
 
             type = 'colorrgb'
             name = type + legend_i
-            Legend[i].ColorRgb = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                        level=None, legend_num=legend_i, N=None, data=self.colorrgb)
-            Legend[i].ColorRgb.level = len(Legend[i].Root.ancestors)
-            Legend[i].ColorRgb.N = len(self.root.leaves)
+            Legend[i].ColorRgb = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                               level=None, legend_num=legend_i, N=None, data=self.colorrgb)
+            _attach(Legend[i].ColorRgb, self.root)
 
             type = 'noresultcolor'
             name = type + legend_i
-            Legend[i].NoResultColor = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                         level=None, legend_num=legend_i, N=None, data=self.noresultcolor)
-            Legend[i].NoResultColor.level = len(Legend[i].Root.ancestors)
-            Legend[i].NoResultColor.N = len(self.root.leaves)
+            Legend[i].NoResultColor = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                level=None, legend_num=legend_i, N=None, data=self.noresultcolor)
+            _attach(Legend[i].NoResultColor, self.root)
 
             type = 'numbers'
             name = type + legend_i
-            Legend[i].Numbers = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                              level=None, legend_num=legend_i, N=None, data=self.numbers)
-            Legend[i].Numbers.level = len(Legend[i].Root.ancestors)
-            Legend[i].Numbers.N = len(self.root.leaves)
+            Legend[i].Numbers = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                     level=None, legend_num=legend_i, N=None, data=self.numbers)
+            _attach(Legend[i].Numbers, self.root)
 
             type = 'showmax'
             name = type + legend_i
-            Legend[i].ShowMax = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                        level=None, legend_num=legend_i, N=None, data=self.showmax)
-            Legend[i].ShowMax.level = len(Legend[i].Root.ancestors)
-            Legend[i].ShowMax.N = len(self.root.leaves)
+            Legend[i].ShowMax = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                               level=None, legend_num=legend_i, N=None, data=self.showmax)
+            _attach(Legend[i].ShowMax, self.root)
 
             type = 'showmaxlocal'
             name = type + legend_i
-            Legend[i].ShowMaxLocal = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                        level=None, legend_num=legend_i, N=None, data=self.showmaxlocal)
-            Legend[i].ShowMaxLocal.level = len(Legend[i].Root.ancestors)
-            Legend[i].ShowMaxLocal.N = len(self.root.leaves)
+            Legend[i].ShowMaxLocal = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                               level=None, legend_num=legend_i, N=None, data=self.showmaxlocal)
+            _attach(Legend[i].ShowMaxLocal, self.root)
 
             type = 'showmin'
             name = type + legend_i
-            Legend[i].ShowMin = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                        level=None, legend_num=legend_i, N=None, data=self.showmin)
-            Legend[i].ShowMin.level = len(Legend[i].Root.ancestors)
-            Legend[i].ShowMin.N = len(self.root.leaves)
+            Legend[i].ShowMin = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                               level=None, legend_num=legend_i, N=None, data=self.showmin)
+            _attach(Legend[i].ShowMin, self.root)
 
             type = 'showminlocal'
             name = type + legend_i
-            Legend[i].ShowMinLocal = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                             level=None, legend_num=legend_i, N=None, data=self.showminlocal)
-            Legend[i].ShowMinLocal.level = len(Legend[i].Root.ancestors)
-            Legend[i].ShowMinLocal.N = len(self.root.leaves)
+            Legend[i].ShowMinLocal = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                    level=None, legend_num=legend_i, N=None, data=self.showminlocal)
+            _attach(Legend[i].ShowMinLocal, self.root)
 
             type = 'entitylabel'
             name = type + legend_i
-            Legend[i].EntityLabel = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                             level=None, legend_num=legend_i, N=None, data=self.entitylabel)
-            Legend[i].EntityLabel.level = len(Legend[i].Root.ancestors)
-            Legend[i].EntityLabel.N = len(self.root.leaves)
+            Legend[i].EntityLabel = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                    level=None, legend_num=legend_i, N=None, data=self.entitylabel)
+            _attach(Legend[i].EntityLabel, self.root)
 
             type = 'showbymodel'
             name = type + legend_i
-            Legend[i].ShowByModel = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                            level=None, legend_num=legend_i, N=None, data=self.showbymodel)
-            Legend[i].ShowByModel.level = len(Legend[i].Root.ancestors)
-            Legend[i].ShowByModel.N = len(self.root.leaves)
+            Legend[i].ShowByModel = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                   level=None, legend_num=legend_i, N=None, data=self.showbymodel)
+            _attach(Legend[i].ShowByModel, self.root)
 
             type = 'legendposition'
             name = type + legend_i
-            Legend[i].LegendPosition = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                            level=None, legend_num=legend_i, N=None, data=self.legendposition)
-            Legend[i].LegendPosition.level = len(Legend[i].Root.ancestors)
-            Legend[i].LegendPosition.N = len(self.root.leaves)
+            Legend[i].LegendPosition = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                   level=None, legend_num=legend_i, N=None, data=self.legendposition)
+            _attach(Legend[i].LegendPosition, self.root)
 
             type = 'backgroundcolor'
             name = type + legend_i
-            Legend[i].BackGroundColor = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                               level=None, legend_num=legend_i, N=None, data=self.backgroundcolor)
-            Legend[i].BackGroundColor.level = len(Legend[i].Root.ancestors)
-            Legend[i].BackGroundColor.N = len(self.root.leaves)
+            Legend[i].BackGroundColor = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                      level=None, legend_num=legend_i, N=None,
+                                                      data=self.backgroundcolor)
+            _attach(Legend[i].BackGroundColor, self.root)
 
             type = 'transparency'
             name = type + legend_i
-            Legend[i].Transparency = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                                level=None, legend_num=legend_i, N=None, data=self.transparency)
-            Legend[i].Transparency.level = len(Legend[i].Root.ancestors)
-            Legend[i].Transparency.N = len(self.root.leaves)
+            Legend[i].Transparency = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                       level=None, legend_num=legend_i, N=None, data=self.transparency)
+            _attach(Legend[i].Transparency, self.root)
 
             type = 'filter'
             name = type + legend_i
-            Legend[i].Filter = AnyNode(id=name, type=type, oc=1, parent=Legend[i].Root,
-                                             level=None, legend_num=legend_i, N=None, data=self.filter)
-            Legend[i].Filter.level = len(Legend[i].Root.ancestors)
-            Legend[i].Filter.N = len(self.root.leaves)
+            Legend[i].Filter = self.nodeclass(id=name, type=type, oc=1, parent=Legend[i].Root,
+                                                    level=None, legend_num=legend_i, N=None, data=self.filter)
+            _attach(Legend[i].Filter, self.root)
 
 
         return Legend
 
+    @_stateless
     def modify_legend(self, legend_mod):
         _global_callback('legend', legend_mod)
 
+    @_stateless
     def modify_legendtype(self, legend_mod):
         _global_callback('legendtype', legend_mod)
     
+    @_stateless
     def modify_numcols(self, legend_mod):
         _global_callback('numcols', legend_mod)
     
+    @_stateless
     def modify_legendmaxthreshold(self, legend_mod):
         _global_callback('legendmaxthreshold', legend_mod)
     
+    @_stateless
     def modify_legendminthreshold(self, legend_mod):
         _global_callback('legendminthreshold', legend_mod)
     
+    @_stateless
     def modify_colorrgb(self, colorrgb_mod):
         _global_callback('colorrgb', colorrgb_mod)
         
+    @_stateless
     def modify_noresultcolor(self, noresultcolor_mod):
         _global_callback('noresultcolor', noresultcolor_mod)
         
+    @_stateless
     def modify_numbers(self, numbers_mod):
         _global_callback('numbers', numbers_mod)
     
+    @_stateless
     def modify_showmax(self, showmax_mod):
         _global_callback('showmax', showmax_mod)
     
+    @_stateless
     def modify_showmaxlocal(self, showmaxlocal_mod):
         _global_callback('showmaxlocal', showmaxlocal_mod)
 
+    @_stateless
     def modify_showmin(self, showmin_mod):
         _global_callback('showmin', showmin_mod)
 
+    @_stateless
     def modify_showminlocal(self, showminlocal_mod):
         _global_callback('showminlocal', showminlocal_mod)
     
+    @_stateless
     def modify_entitylabel(self, entitylabel_mod):
         _global_callback('entitylabel', entitylabel_mod)
     
+    @_stateless
     def modify_showbymodel(self, showbymodel_mod):
         _global_callback('showbymodel', showbymodel_mod)
     
+    @_stateless
     def modify_legendposition(self, legendposition_mod):
         _global_callback('legendposition', legendposition_mod)
     
+    @_stateless
     def modify_backgroundcolor(self, backgroundcolor_mod):
         _global_callback('backgroundcolor', backgroundcolor_mod)
     
+    @_stateless
     def modify_transparency(self, transparency_mod):
         _global_callback('transparency', transparency_mod)
     
+    @_stateless
     def modify_filter(self, filter_mod):
         _global_callback('filter', filter_mod)
         
 
-class NoteState(object):
-
-    def __init__(self, **kwargs):
-        self._note = '"On", "Model Info"'
-        self._transparent = 'On'
-        self._autohide = 'Off'
-        self._anchortoscreen = 'On'
-        self._fillcolor = '31'
-        self._textcolor = '1'
-        self._attach = 'WINDOW'
-        self._position = '0.5, 0.5'
-        self._text = '{for (i = 0; i != numpts(window.modeltitlelist); ++i) }\\n{window.modelidlist[i]}: {window.modeltitlelist[i]}\\n{window.loadcaselist[i]} : {window.simulationsteplist[i]} : {window.framelist[i]}\\n{endloop}'
-        self._font = '"noto sans", "regular", "regular", 10'
-        self._color = '1'
-        self._borderwidth = '0'
-        self._shape = 'Rectangle'
-        self._notealignment = 'Right'
-        self._noteanchor = '"Right", "Top"'
-        self._titleflag = 'Yes'
-        
-        self._observers_note = []
-        self._observers_transparent = []
-        self._observers_autohide = []
-        self._observers_anchortoscreen = []
-        self._observers_fillcolor = []
-        self._observers_textcolor = []
-        self._observers_attach = []
-        self._observers_position = []
-        self._observers_text = []
-        self._observers_font = []
-        self._observers_color = []
-        self._observers_borderwidth = []
-        self._observers_shape = []
-        self._observers_notealignment = []
-        self._observers_noteanchor = []
-        self._observers_titleflag = []
-
-    @property
-    def note(self):
-        return self._note
-
-    @note.setter
-    def note(self, data):
-        self._note = data
-        for callback in self._observers_note:
-            callback(self._note)
-
-    @property
-    def transparent(self):
-        return self._transparent
-
-    @transparent.setter
-    def transparent(self, data):
-        self._transparent = data
-        for callback in self._observers_transparent:
-            callback(self._transparent)
-
-    @property
-    def autohide(self):
-        return self._autohide
-
-    @autohide.setter
-    def autohide(self, data):
-        self._autohide = data
-        for callback in self._observers_autohide:
-            callback(self._autohide)
-
-    @property
-    def anchortoscreen(self):
-        return self._anchortoscreen
-
-    @anchortoscreen.setter
-    def anchortoscreen(self, data):
-        self._anchortoscreen = data
-        for callback in self._observers_anchortoscreen:
-            callback(self._anchortoscreen)
-
-    @property
-    def fillcolor(self):
-        return self._fillcolor
-
-    @fillcolor.setter
-    def fillcolor(self, data):
-        self._fillcolor = data
-        for callback in self._observers_fillcolor:
-            callback(self._fillcolor)
-
-    @property
-    def textcolor(self):
-        return self._textcolor
-
-    @textcolor.setter
-    def textcolor(self, data):
-        self._textcolor = data
-        for callback in self._observers_textcolor:
-            callback(self._textcolor)
-
-    @property
-    def attach(self):
-        return self._attach
-
-    @attach.setter
-    def attach(self, data):
-        self._attach = data
-        for callback in self._observers_attach:
-            callback(self._attach)
-
-    @property
-    def position(self):
-        return self._position
-
-    @position.setter
-    def position(self, data):
-        self._position = data
-        for callback in self._observers_position:
-            callback(self._position)
-
-    @property
-    def text(self):
-        return self._text
-
-    @text.setter
-    def text(self, data):
-        self._text = data
-        for callback in self._observers_text:
-            callback(self._text)
-
-    @property
-    def font(self):
-        return self._font
-
-    @font.setter
-    def font(self, data):
-        self._font = data
-        for callback in self._observers_font:
-            callback(self._font)
-
-    @property
-    def color(self):
-        return self._color
-
-    @color.setter
-    def color(self, data):
-        self._color = data
-        for callback in self._observers_color:
-            callback(self._color)
-
-    @property
-    def borderwidth(self):
-        return self._borderwidth
-
-    @borderwidth.setter
-    def borderwidth(self, data):
-        self._borderwidth = data
-        for callback in self._observers_borderwidth:
-            callback(self._borderwidth)
-
-    @property
-    def shape(self):
-        return self._shape
-
-    @shape.setter
-    def shape(self, data):
-        self._shape = data
-        for callback in self._observers_shape:
-            callback(self._shape)
-
-    @property
-    def notealignment(self):
-        return self._notealignment
-
-    @notealignment.setter
-    def notealignment(self, data):
-        self._notealignment = data
-        for callback in self._observers_notealignment:
-            callback(self._notealignment)
-
-    @property
-    def noteanchor(self):
-        return self._noteanchor
-
-    @noteanchor.setter
-    def noteanchor(self, data):
-        self._noteanchor = data
-        for callback in self._observers_noteanchor:
-            callback(self._noteanchor)
-
-    @property
-    def titleflag(self):
-        return self._titleflag
-
-    @titleflag.setter
-    def titleflag(self, data):
-        self._titleflag = data
-        for callback in self._observers_titleflag:
-            callback(self._titleflag)
-
-    def bind_to_note(self, callback):
-        self._observers_note.append(callback)
-
-    def bind_to_transparent(self, callback):
-        self._observers_transparent.append(callback)
-    
-    def bind_to_autohide(self, callback):
-        self._observers_autohide.append(callback)
-    
-    def bind_to_anchortoscreen(self, callback):
-        self._observers_anchortoscreen.append(callback)
-    
-    def bind_to_fillcolor(self, callback):
-        self._observers_fillcolor.append(callback)
-    
-    def bind_to_textcolor(self, callback):
-        self._observers_textcolor.append(callback)
-    
-    def bind_to_attach(self, callback):
-        self._observers_attach.append(callback)
-    
-    def bind_to_position(self, callback):
-        self._observers_position.append(callback)
-    
-    def bind_to_text(self, callback):
-        self._observers_text.append(callback)
-    
-    def bind_to_font(self, callback):
-        self._observers_font.append(callback)
-    
-    def bind_to_color(self, callback):
-        self._observers_color.append(callback)
-    
-    def bind_to_borderwidth(self, callback):
-        self._observers_borderwidth.append(callback)
-
-    def bind_to_shape(self, callback):
-        self._observers_shape.append(callback)
-    
-    def bind_to_notealignment(self, callback):
-        self._observers_notealignment.append(callback)
-    
-    def bind_to_noteanchor(self, callback):
-        self._observers_noteanchor.append(callback)
-    
-    def bind_to_titleflag(self, callback):
-        self._observers_titleflag.append(callback)
+class NoteState(ObservableState):
+    _fields = (('note', '"On", "Model Info"'),
+               ('transparent', 'On'),
+               ('autohide', 'Off'),
+               ('anchortoscreen', 'On'),
+               ('fillcolor', '31'),
+               ('textcolor', '1'),
+               ('attach', 'WINDOW'),
+               ('position', '0.5, 0.5'),
+               ('text', '{for (i = 0; i != numpts(window.modeltitlelist); ++i) }\\n{window.modelidlist[i]}: {window.modeltitlelist[i]}\\n{window.loadcaselist[i]} : {window.simulationsteplist[i]} : {window.framelist[i]}\\n{endloop}'),
+               ('font', '"noto sans", "regular", "regular", 10'),
+               ('color', '1'),
+               ('borderwidth', '0'),
+               ('shape', 'Rectangle'),
+               ('notealignment', 'Right'),
+               ('noteanchor', '"Right", "Top"'),
+               ('titleflag', 'Yes'))
+
+
+class NoteAttributes(object):
+    Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Transparent = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AutoHide = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    AnchorToScreen = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    FillColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    TextColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Attach = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Position = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Text = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Font = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Color = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    BorderWidth = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    Shape = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    NoteAlignment = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    NoteAnchor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
+    TitleFlag = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
 
 
 class Note(object):
@@ -2900,29 +2899,12 @@ class Note(object):
     def add_note(self, num_notes, graphic, **kwargs):
         self.Graphic_i = graphic
         self.root = graphic.root
+        self.nodeclass = self.root.__class__
         allowed_keys = {'transparent', 'note', 'autohide', 'anchortoscreen', 'fillcolor', 'textcolor', 'attach', 
                         'position', 'text', 'font', 'color', 'borderwidth', 'shape', 'notealignment', 'noteanchor',
                         'titleflag'}
         self.__dict__.update((k, v) for k, v in kwargs.items() if k in allowed_keys)
 
-        class NoteAttributes(object):
-            Root = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Transparent = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AutoHide = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            AnchorToScreen = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            FillColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            TextColor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Attach = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Position = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Text = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Font = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Color = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            BorderWidth = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            Shape = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            NoteAlignment = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            NoteAnchor = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            TitleFlag = [AnyNode(id=None, N=None, type=None, parent=None, level=None, window_num=None, data=None)]
-            
         Note = [NoteAttributes() for i in range(num_notes)]
 
         for i in range(num_notes):  # add all pages
@@ -2930,216 +2912,1344 @@ class Note(object):
 
             type = 'note'
             name = type + note_i
-            Note[i].Root = AnyNode(id=name, type=type, parent=self.Graphic_i,
-                                   level=None, note_num=note_i, data=self.note)
-            Note[i].Root.level = len(self.Graphic_i.ancestors)
-            Note[i].Root.N = len(self.root.leaves)
+            Note[i].Root = self.nodeclass(id=name, type=type, parent=self.Graphic_i,
+                                          level=None, note_num=note_i, data=self.note)
+            _attach(Note[i].Root, self.root)
 
             type = 'transparent'
             name = type + note_i
-            Note[i].Transparent = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                        level=None, note_num=note_i, N=None, data=self.transparent)
-            Note[i].Transparent.level = len(Note[i].Root.ancestors)
-            Note[i].Transparent.N = len(self.root.leaves)
+            Note[i].Transparent = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                               level=None, note_num=note_i, N=None, data=self.transparent)
+            _attach(Note[i].Transparent, self.root)
 
             type = 'autohide'
             name = type + note_i
-            Note[i].AutoHide = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                          level=None, note_num=note_i, N=None, data=self.autohide)
-            Note[i].AutoHide.level = len(Note[i].Root.ancestors)
-            Note[i].AutoHide.N = len(self.root.leaves)
+            Note[i].AutoHide = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                                 level=None, note_num=note_i, N=None, data=self.autohide)
+            _attach(Note[i].AutoHide, self.root)
 
             type = 'anchortoscreen'
             name = type + note_i
-            Note[i].AnchorToScreen = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                       level=None, note_num=note_i, N=None, data=self.anchortoscreen)
-            Note[i].AnchorToScreen.level = len(Note[i].Root.ancestors)
-            Note[i].AnchorToScreen.N = len(self.root.leaves)
+            Note[i].AnchorToScreen = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                              level=None, note_num=note_i, N=None, data=self.anchortoscreen)
+            _attach(Note[i].AnchorToScreen, self.root)
 
             type = 'fillcolor'
             name = type + note_i
-            Note[i].FillColor = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                             level=None, note_num=note_i, N=None, data=self.fillcolor)
-            Note[i].FillColor.level = len(Note[i].Root.ancestors)
-            Note[i].FillColor.N = len(self.root.leaves)
+            Note[i].FillColor = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                                    level=None, note_num=note_i, N=None, data=self.fillcolor)
+            _attach(Note[i].FillColor, self.root)
 
             type = 'textcolor'
             name = type + note_i
-            Note[i].TextColor = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                        level=None, note_num=note_i, N=None, data=self.textcolor)
-            Note[i].TextColor.level = len(Note[i].Root.ancestors)
-            Note[i].TextColor.N = len(self.root.leaves)
+            Note[i].TextColor = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                               level=None, note_num=note_i, N=None, data=self.textcolor)
+            _attach(Note[i].TextColor, self.root)
 
             type = 'attach'
             name = type + note_i
-            Note[i].Attach = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                        level=None, note_num=note_i, N=None, data=self.attach)
-            Note[i].Attach.level = len(Note[i].Root.ancestors)
-            Note[i].Attach.N = len(self.root.leaves)
+            Note[i].Attach = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                               level=None, note_num=note_i, N=None, data=self.attach)
+            _attach(Note[i].Attach, self.root)
 
             type = 'position'
             name = type + note_i
-            Note[i].Position = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                     level=None, note_num=note_i, N=None, data=self.position)
-            Note[i].Position.level = len(Note[i].Root.ancestors)
-            Note[i].Position.N = len(self.root.leaves)
+            Note[i].Position = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                            level=None, note_num=note_i, N=None, data=self.position)
+            _attach(Note[i].Position, self.root)
 
             type = 'text'
             name = type + note_i
-            Note[i].Text = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                       level=None, note_num=note_i, N=None, data=self.text)
-            Note[i].Text.level = len(Note[i].Root.ancestors)
-            Note[i].Text.N = len(self.root.leaves)
+            Note[i].Text = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                              level=None, note_num=note_i, N=None, data=self.text)
+            _attach(Note[i].Text, self.root)
 
             type = 'font'
             name = type + note_i
-            Note[i].Font = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                   level=None, note_num=note_i, N=None, data=self.font)
-            Note[i].Font.level = len(Note[i].Root.ancestors)
-            Note[i].Font.N = len(self.root.leaves)
+            Note[i].Font = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                          level=None, note_num=note_i, N=None, data=self.font)
+            _attach(Note[i].Font, self.root)
 
             type = 'color'
             name = type + note_i
-            Note[i].Color = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                   level=None, note_num=note_i, N=None, data=self.color)
-            Note[i].Color.level = len(Note[i].Root.ancestors)
-            Note[i].Color.N = len(self.root.leaves)
+            Note[i].Color = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                          level=None, note_num=note_i, N=None, data=self.color)
+            _attach(Note[i].Color, self.root)
 
             type = 'borderwidth'
             name = type + note_i
-            Note[i].BorderWidth = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                    level=None, note_num=note_i, N=None, data=self.borderwidth)
-            Note[i].BorderWidth.level = len(Note[i].Root.ancestors)
-            Note[i].BorderWidth.N = len(self.root.leaves)
+            Note[i].BorderWidth = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                           level=None, note_num=note_i, N=None, data=self.borderwidth)
+            _attach(Note[i].BorderWidth, self.root)
 
             type = 'shape'
             name = type + note_i
-            Note[i].Shape = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                          level=None, note_num=note_i, N=None, data=self.shape)
-            Note[i].Shape.level = len(Note[i].Root.ancestors)
-            Note[i].Shape.N = len(self.root.leaves)
+            Note[i].Shape = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                                 level=None, note_num=note_i, N=None, data=self.shape)
+            _attach(Note[i].Shape, self.root)
 
             type = 'notealignment'
             name = type + note_i
-            Note[i].NoteAlignment = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                    level=None, note_num=note_i, N=None, data=self.notealignment)
-            Note[i].NoteAlignment.level = len(Note[i].Root.ancestors)
-            Note[i].NoteAlignment.N = len(self.root.leaves)
+            Note[i].NoteAlignment = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                           level=None, note_num=note_i, N=None, data=self.notealignment)
+            _attach(Note[i].NoteAlignment, self.root)
 
             type = 'noteanchor'
             name = type + note_i
-            Note[i].NoteAnchor = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                            level=None, note_num=note_i, N=None, data=self.noteanchor)
-            Note[i].NoteAnchor.level = len(Note[i].Root.ancestors)
-            Note[i].NoteAnchor.N = len(self.root.leaves)
+            Note[i].NoteAnchor = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                                   level=None, note_num=note_i, N=None, data=self.noteanchor)
+            _attach(Note[i].NoteAnchor, self.root)
 
             type = 'titleflag'
             name = type + note_i
-            Note[i].TitleFlag = AnyNode(id=name, type=type, oc=1, parent=Note[i].Root,
-                                         level=None, note_num=note_i, N=None, data=self.titleflag)
-            Note[i].TitleFlag.level = len(Note[i].Root.ancestors)
-            Note[i].TitleFlag.N = len(self.root.leaves)
+            Note[i].TitleFlag = self.nodeclass(id=name, type=type, oc=1, parent=Note[i].Root,
+                                                level=None, note_num=note_i, N=None, data=self.titleflag)
+            _attach(Note[i].TitleFlag, self.root)
 
         return Note
 
+    @_stateless
     def modify_note(self, note_mod):
         _global_callback('note', note_mod)
         
+    @_stateless
     def modify_transparent(self, note_mod):
         _global_callback('transparent', note_mod)
     
+    @_stateless
     def modify_autohide(self, note_mod):
         _global_callback('autohide', note_mod)
     
+    @_stateless
     def modify_anchortoscreen(self, note_mod):
         _global_callback('anchortoscreen', note_mod)
     
+    @_stateless
     def modify_fillcolor(self, note_mod):
         _global_callback('fillcolor', note_mod)
     
+    @_stateless
     def modify_textcolor(self, note_mod):
         _global_callback('textcolor', note_mod)
     
+    @_stateless
     def modify_attach(self, note_mod):
         _global_callback('attach', note_mod)
     
+    @_stateless
     def modify_position(self, note_mod):
         _global_callback('position', note_mod)
     
+    @_stateless
     def modify_text(self, note_mod):
         _global_callback('text', note_mod)
     
+    @_stateless
     def modify_font(self, note_mod):
         _global_callback('font', note_mod)
     
+    @_stateless
     def modify_color(self, note_mod):
         _global_callback('color', note_mod)
     
+    @_stateless
     def modify_borderwidth(self, note_mod):
         _global_callback('borderwidth', note_mod)
     
+    @_stateless
     def modify_shape(self, note_mod):
         _global_callback('shape', note_mod)
     
+    @_stateless
     def modify_notealignment(self, note_mod):
         _global_callback('notealignment', note_mod)
     
+    @_stateless
     def modify_noteanchor(self, note_mod):
         _global_callback('noteanchor', note_mod)
     
+    @_stateless
     def modify_titleflag(self, note_mod):
         _global_callback('titleflag', note_mod)
 
 
 class Write(object):
 
-    def __init__(self, hvsession):
+    def __init__(self, hvsession, **kwargs):
+        # kwargs: cache (number of subtrees kept rendered by the RenderCache, default 4096, 0 to switch it off; off
+        # by default for a SessionStore, whose arrays are walked faster than its subtrees can be keyed). A RenderCache
+        # instance may be passed instead to share it between writers.
         self.writeroot = hvsession.root
+        # _pages: page node -> (revision, text) from the last write; keep the Write to reuse it. Revisions only move
+        # on edits made through the State setters and the builders (see _touch): after setting node.data directly,
+        # or detaching or moving nodes with anytree, write with a new Write.
+        self._pages = {}
+        self.rendered = 0  # pages rendered by the last write
+        cache = kwargs.get('cache', 0 if isinstance(self.writeroot, StoreNode) else 4096)
+        if isinstance(cache, RenderCache):  # shared between writers
+            self.cache = cache
+        else:
+            self.cache = RenderCache(cache) if cache else None
         # print(RenderTree(self.writeroot))
 
-    def mvw(self, name, writedir, **kwargs):
-        session_list = []
-        mysession = open(writedir+'/'+name, 'w')
-        line_no = 0
-        for node in PreOrderIter(self.writeroot):
-            if not _is_rightest_child(node) and not _has_children(node):
-                for line in _get_block(node):
-                    print line
-                    mysession.write('\n'+line)
-            elif not _is_rightest_child(node) and _has_children(node):
-                print _get_block(node)[0]
-                if line_no == 0:
-                    mysession.write(_get_block(node)[0])
-                else:
-                    mysession.write('\n'+_get_block(node)[0])
-            elif _is_rightest_child(node) and not _has_children(node):  # extend this block to close all ancestors too
-                for line in _get_block(node):
-                    print line
-                    mysession.write('\n'+line)
-                print _get_block(node.parent)[1]
-                mysession.write('\n'+_get_block(node.parent)[1])
-                ancestors = list(node.ancestors)
-                ancestors.reverse()
-                for i in range(len(ancestors)):
-                    if _is_rightest_child(ancestors[i]) and ancestors[i].id != 'root':
-                        print _get_block(ancestors[i].parent)[1]
-                        mysession.write('\n'+_get_block(ancestors[i].parent)[1])
+    def iter_lines(self):
+        # session lines in document order, generated lazily; '\n'.join(lines) is the .mvw file content
+        return _subtree_lines(self.writeroot)
+
+    def iter_pages(self, workers=1):
+        # like iter_lines, but every page comes as one block of text. The text of each page is kept between calls and
+        # only pages whose revision moved since (see _touch) are rendered again, by a pool of workers processes when
+        # workers > 1. The header, file table and palette are always rendered, first; pages follow in page order.
+        root = self.writeroot
+        children = root.children
+        cached = self._pages
+        self._pages = {}
+        self.rendered = 0
+        stale = [child for child in children
+                 if child.type == 'page' and cached.get(child, (None,))[0] != getattr(child, 'rev', 0)]
+        rendered = None
+        if workers > 1 and len(stale) > 1:
+            token = next(_render_tokens)
+            _RENDER_JOBS[token] = (stale, None if _RENDER_THREADS else self.cache)
+            pool = _render_pool(workers)
+            rendered = pool.imap(_render_page, [(token, i) for i in range(len(stale))],
+                                 max(1, len(stale) // (4 * workers)))
+        try:
+            block = _get_block(root)
+            yield block[0]
+            for child in children:
+                if child.type != 'page':
+                    for line in _subtree_lines(child):
+                        yield line
+                    continue
+                rev = getattr(child, 'rev', 0)
+                page = cached.get(child)
+                if page is None or page[0] != rev:
+                    if rendered is not None:
+                        text, hits, misses = next(rendered)
+                        if self.cache is not None:
+                            self.cache.hits = self.cache.hits + hits
+                            self.cache.misses = self.cache.misses + misses
+                        page = (rev, text)
                     else:
-                        break
-            elif _is_rightest_child(node) and _has_children(node):
-                print _get_block(node)[0]
-                if line_no == 0:
-                    mysession.write(_get_block(node)[0])
+                        page = (rev, self._render(child))
+                    self.rendered = self.rendered + 1
+                self._pages[child] = page
+                yield page[1]
+            yield block[1]
+        finally:
+            if rendered is not None:
+                pool.terminate()
+                pool.join()
+                del _RENDER_JOBS[token]
+
+    def _render(self, page):
+        if self.cache is not None:
+            return self.cache.render(page)
+        return '\n'.join(_subtree_lines(page))
+
+    def size(self):
+        # exact length of the session text, computed from the fields of the nodes without rendering them
+        return _subtree_size(self.writeroot) - 1
+
+    def _write_mmap(self, path, workers):
+        # render the session into a file preallocated to its exact size. The size of each page is computed from its
+        # fields, or taken from the text kept by the last write, and every piece is written at its offset in an mmap
+        # of the file. With workers > 1 the worker processes render the pages and write them into disjoint regions of
+        # the same shared mapping; their text is not sent back, so the next write renders those pages again. Returns
+        # the number of lines.
+        root = self.writeroot
+        block = _get_block(root)
+        cached = self._pages
+        self._pages = {}
+        self.rendered = 0
+        pieces = [(0, block[0] + '\n')]  # (offset, text) written here
+        jobs = []  # (page, offset, size) still to render
+        offset = len(pieces[0][1])
+        for child in root.children:
+            if child.type != 'page':
+                text = '\n'.join(_subtree_lines(child)) + '\n'
+            else:
+                page = cached.get(child)
+                if page is None or page[0] != getattr(child, 'rev', 0):
+                    size = _subtree_size(child)
+                    jobs.append((child, offset, size))
+                    offset = offset + size
+                    continue
+                self._pages[child] = page
+                text = page[1] + '\n'
+            pieces.append((offset, text))
+            offset = offset + len(text)
+        pieces.append((offset, block[1]))
+        total = offset + len(block[1])
+
+        lines = 1
+        session = open(path, 'w+b')
+        try:
+            session.truncate(total)
+            mapped = mmap.mmap(session.fileno(), total)
+            try:
+                for offset, text in pieces:
+                    mapped[offset:offset + len(text)] = text
+                    lines = lines + text.count('\n')
+                if workers > 1 and len(jobs) > 1:
+                    token = next(_render_tokens)
+                    # the workers inherit the shared mapping and write into it directly
+                    _RENDER_JOBS[token] = (jobs, None if _RENDER_THREADS else self.cache, mapped)
+                    pool = _render_pool(workers)
+                    try:
+                        for page_lines, hits, misses in pool.imap_unordered(
+                                _render_into, [(token, i) for i in range(len(jobs))],
+                                max(1, len(jobs) // (4 * workers))):
+                            lines = lines + page_lines
+                            if self.cache is not None:
+                                self.cache.hits = self.cache.hits + hits
+                                self.cache.misses = self.cache.misses + misses
+                    finally:
+                        pool.terminate()
+                        pool.join()
+                        del _RENDER_JOBS[token]
                 else:
-                    mysession.write('\n'+_get_block(node)[0])
-
-            line_no = line_no + 1
-        # file = open(writedir+'/'+name,'w')
-        # print(RenderTree(self.writeroot))
+                    for page, offset, size in jobs:
+                        text = self._render(page)
+                        self._pages[page] = (getattr(page, 'rev', 0), text)
+                        text = _fit(page, text + '\n', size)
+                        mapped[offset:offset + size] = text
+                        lines = lines + text.count('\n')
+                self.rendered = len(jobs)
+                mapped.flush()
+            finally:
+                mapped.close()
+        finally:
+            session.close()
+        return lines
+
+    def offsets(self, path=None):
+        # SessionOffsets of the session as mvw writes it now, for patch_mvw: where the opening line of every node
+        # starts in the file and how long it is. Take them right after mvw (or pass offsets=True to mvw), before the
+        # tree is edited again; path, the file written, lets patch_mvw tell when it changed since.
+        root = self.writeroot
+        if isinstance(root, StoreNode):
+            offsets = SessionOffsets(*root.store.spans(root.index))
+            if path is not None:
+                offsets.stamp(path)
+            return offsets
+        keys = []
+        starts = array('l')
+        lengths = array('l')
+        offset = 0
+        stack = [self.writeroot]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is str:  # closing line of a block whose children are done
+                offset = offset + len(node) + 1
+                continue
+            block = _get_block(node)
+            keys.append(node.N)
+            starts.append(offset)
+            lengths.append(len(block[0]))
+            offset = offset + len(block[0]) + 1
+            if len(block) > 1:
+                children = node.children
+                if children:
+                    stack.append(block[1])
+                    stack.extend(reversed(children))
+                else:
+                    offset = offset + len(block[1]) + 1
+        offsets = SessionOffsets(keys, starts, lengths)
+        if path is not None:
+            offsets.stamp(path)
+        return offsets
+
+    def iter_chunks(self, size=65536, workers=1):
+        # session text regrouped into chunks of roughly size characters; ''.join(chunks) is the .mvw file content.
+        # Pages come from iter_pages, so only the pages edited since the last call are rendered.
+        lines = self.iter_pages(workers)
+        chunk = []
+        length = 0
+        first = True
+        for line in lines:
+            chunk.append(line)
+            length = length + len(line) + 1
+            if length >= size:
+                if first:
+                    yield '\n'.join(chunk)
+                    first = False
+                else:
+                    yield '\n' + '\n'.join(chunk)
+                chunk = []
+                length = 0
+        if chunk:
+            if first:
+                yield '\n'.join(chunk)
+            else:
+                yield '\n' + '\n'.join(chunk)
 
-        mysession.close()
-        print('Session successfully written to '+writedir+name+'.\n')
-        return
+    def mvw(self, name, writedir, **kwargs):
+        # kwargs: verbose (echo the session to stdout, default False), progress (called with a status dict after
+        # every write and once more when done), buffersize (characters collected per write, default 64 KiB),
+        # compress ('gz', 'bz2' or 'xz' to stream the session through that codec; the extension is appended to name
+        # if missing), compresslevel (default 6) and fsync ('none', 'file' or 'dir', default 'none'). The session is
+        # written to a temp file in writedir and renamed into place, so readers never see a partial file. workers > 1
+        # renders the pages in that many worker processes (default 1, render in this process). Calling mvw again on
+        # the same Write renders only the pages edited since; status['pages'] is the number of pages rendered.
+        # mmap=True preallocates the file to the exact session size and writes the pages at their offsets through an
+        # mmap, from the workers when workers > 1; it cannot be combined with compress. offsets=True adds the
+        # SessionOffsets of the written file for patch_mvw as status['offsets'].
+        verbose = kwargs.get('verbose', False)
+        progress = kwargs.get('progress')
+        buffersize = kwargs.get('buffersize', 65536)
+        compress = kwargs.get('compress')
+        compresslevel = kwargs.get('compresslevel', 6)
+        fsync = kwargs.get('fsync', 'none')
+        workers = kwargs.get('workers', 1)
+        mapped = kwargs.get('mmap', False)
+        offsets = kwargs.get('offsets', False)
+        if fsync not in ('none', 'file', 'dir'):
+            raise ValueError('fsync must be one of none, file, dir, not ' + repr(fsync))
+        if mapped and compress is not None:
+            raise ValueError('mmap output cannot be compressed')
+        if offsets and compress is not None:
+            raise ValueError('compressed output cannot be patched, so it has no offsets')
+        if compress is not None and not name.endswith('.' + compress):
+            name = name + '.' + compress
+
+        start = time.time()
+        status = {'path': writedir+'/'+name, 'lines': 0, 'bytes': 0, 'seconds': 0.0, 'done': False}
+
+        def chunks():
+            for chunk in self.iter_chunks(buffersize, workers):
+                yield chunk
+                if verbose:
+                    sys.stdout.write(chunk)
+                status['lines'] = status['lines'] + chunk.count('\n')
+                status['bytes'] = status['bytes'] + len(chunk)
+                if progress is not None:
+                    status['seconds'] = time.time() - start
+                    progress(dict(status))
+
+        if mapped:
+            status['lines'] = _replace_atomic(status['path'], lambda temp: self._write_mmap(temp, workers), fsync)
+            status['written'] = status['bytes'] = os.path.getsize(status['path'])
+            if verbose:
+                with open(status['path']) as session:
+                    shutil.copyfileobj(session, sys.stdout, buffersize)
+        else:
+            status['written'] = _write_atomic(status['path'], chunks(), compress, compresslevel, fsync)  # on disk
+            status['lines'] = status['lines'] + 1
+        status['pages'] = self.rendered
+        if offsets:
+            status['offsets'] = self.offsets(status['path'])
+        status['ratio'] = float(status['bytes']) / max(status['written'], 1)
+        status['seconds'] = time.time() - start
+        status['done'] = True
+        if progress is not None:
+            progress(dict(status))
+        if verbose:
+            print('\nSession successfully written to '+writedir+name+'.\n')
+            if compress is not None:
+                print('%d bytes written, compression ratio %.1f.\n' % (status['written'], status['ratio']))
+        return status
+
+    @staticmethod
+    def mvw_many(jobs, **kwargs):
+        # Write a batch of sessions, jobs = [(session, name, writedir), ...]. Sessions are rendered by a pool of
+        # render_workers processes (default one per CPU, 1 renders in this process) while io_workers threads
+        # (default 4; 0 writes each session in this process as soon as it is rendered) write them out. At most
+        # queuesize rendered sessions (default 2 per render worker) wait for a writer, so memory stays bounded however
+        # long the batch. compress, compresslevel, fsync, buffersize and cache are as for mvw and Write; the cache is
+        # shared by the sessions a worker renders.
+        # Returns one report per job, in job order: path, render and write seconds, bytes, written, done and error
+        # (None, or 'Type: message' of the exception that failed this session; the rest of the batch is still
+        # written).
+        render_workers = kwargs.get('render_workers', multiprocessing.cpu_count())
+        io_workers = kwargs.get('io_workers', 4)
+        queuesize = kwargs.get('queuesize', 2 * render_workers)
+        buffersize = kwargs.get('buffersize', 65536)
+        compress = kwargs.get('compress')
+        compresslevel = kwargs.get('compresslevel', 6)
+        fsync = kwargs.get('fsync', 'none')
+        cache = kwargs.get('cache', 4096)
+        if fsync not in ('none', 'file', 'dir'):
+            raise ValueError('fsync must be one of none, file, dir, not ' + repr(fsync))
+        if io_workers < 0:
+            raise ValueError('io_workers must be 0 or more, not ' + repr(io_workers))
+
+        jobs = list(jobs)
+        reports = []
+        for session, name, writedir in jobs:
+            if compress is not None and not name.endswith('.' + compress):
+                name = name + '.' + compress
+            reports.append({'path': writedir+'/'+name, 'render': 0.0, 'write': 0.0, 'bytes': 0, 'written': 0,
+                            'done': False, 'error': None})
+
+        written = Queue(queuesize)
+
+        def write(report, text):
+            start = time.time()
+            try:
+                report['written'] = _write_atomic(report['path'], [text], compress, compresslevel, fsync)
+                report['done'] = True
+            except Exception as error:
+                report['error'] = _describe_error(error)
+            report['write'] = time.time() - start
+
+        def write_loop():
+            while True:
+                item = written.get()
+                if item is None:
+                    return
+                write(*item)
+
+        def hand_over(index, result):
+            text, seconds, error = result
+            reports[index]['render'] = seconds
+            if error is not None:
+                reports[index]['error'] = error
+                return
+            reports[index]['bytes'] = len(text)
+            if io_workers:
+                written.put((reports[index], text))  # blocks while queuesize sessions wait
+            else:
+                write(reports[index], text)
+
+        def collect(index, result):
+            try:
+                result = result.get()
+            except Exception as error:  # the worker died with this session, e.g. out of memory
+                result = None, 0.0, _describe_error(error)
+            hand_over(index, result)
+
+        token = next(_render_tokens)
+        shared = RenderCache(cache) if cache and not (_RENDER_THREADS and render_workers > 1) else None
+        _RENDER_JOBS[token] = (jobs, shared, buffersize)
+        pool = None
+        writers = []
+        try:
+            # fork the render workers before any writer thread runs, so none inherits a lock held by a thread
+            pool = _render_pool(render_workers) if render_workers > 1 else None
+            writers = [threading.Thread(target=write_loop) for _ in range(io_workers)]
+            for writer in writers:
+                writer.daemon = True
+                writer.start()
+            if pool is None:
+                for index in range(len(jobs)):
+                    hand_over(index, _render_session((token, index)))
+            else:
+                rendering = deque()  # at most two sessions per worker in flight
+                for index in range(len(jobs)):
+                    rendering.append((index, pool.apply_async(_render_session, ((token, index),))))
+                    if len(rendering) >= 2 * render_workers:
+                        collect(*rendering.popleft())
+                while rendering:
+                    collect(*rendering.popleft())
+        finally:
+            for writer in writers:
+                written.put(None)
+            for writer in writers:
+                writer.join()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            del _RENDER_JOBS[token]
+        return reports
+
+
+_SNAPSHOT_MAGIC = 'DOTMVW SNAPSHOT\n'
+_SNAPSHOT_FORMAT = 1
+_STRING_FIELDS = ('id', 'type', 'data', 'page_num', 'window_num', 'graphic_num', 'model_num', 'result_num', 'part_num',
+                  'group_num', 'contour_num', 'legend_num', 'note_num')
+_INT_FIELDS = ('oc', 'level', 'N', 'instance', 'rev')
+_STRUCTURE_FIELDS = ('parent', 'first_child', 'last_child', 'next_sibling', 'num')  # for loading into a SessionStore
+_HANDLES = {'page': PageAttributes, 'window': WindowAttributes, 'graphic': GraphicAttributes, 'model': ModelAttributes,
+            'result': ResultAttributes, 'part': PartAttributes, 'group': GroupAttributes,
+            'contour': ContourAttributes, 'legend': LegendAttributes, 'note': NoteAttributes}
+_HANDLE_NAMES = {'groupselection': 'Selection', 'groupselectionadd': 'Add', 'contourselection': 'Selection',
+                 'contourselectionadd': 'Add'}  # handle attributes not named after their node type
+
+
+class Snapshot(object):
+    # What load_snapshot returns: the session root, and the handles of every page, window, graphic, ... in document
+    # order, as the builders return them
+    def __init__(self, root):
+        self.root = root
+        for type in _HANDLES:
+            setattr(self, type + 's', [])
+
+    def select(self, path):
+        # nodes of the session matching path, see select
+        return select(self.root, path)
+
+
+def _preorder(root):
+    # nodes in document order, each with the position of its parent in that order
+    stack = [(root, -1)]
+    index = 0
+    while stack:
+        node, parent = stack.pop()
+        yield node, parent
+        stack.extend((child, index) for child in reversed(node.children))
+        index = index + 1
+
+
+def save_snapshot(session, path):
+    # Save the built tree of session (a builder such as Page, or any node of the tree) to a binary snapshot for
+    # load_snapshot. Every distinct string and data value is stored once in a table, and the nodes are stored in
+    # document order as columns of table indices and small ints. The table is marshalled, so a snapshot is read back
+    # by the same Python version that wrote it. Written atomically like a session.
+    root = session.root
+    table = []
+    indices = {}
+    columns = dict((name, array('i')) for name in _STRUCTURE_FIELDS + _STRING_FIELDS + _INT_FIELDS)
+    first_child = columns['first_child']
+    last_child = columns['last_child']
+    next_sibling = columns['next_sibling']
+    for index, (node, parent) in enumerate(_preorder(root)):
+        columns['parent'].append(parent)
+        first_child.append(-1)
+        last_child.append(-1)
+        next_sibling.append(-1)
+        if parent >= 0:
+            if last_child[parent] < 0:
+                first_child[parent] = index
+            else:
+                next_sibling[last_child[parent]] = index
+            last_child[parent] = index
+        num = _entity_num(node.id, node.type)
+        columns['num'].append(-1 if num is None else num)
+        for name in _STRING_FIELDS:
+            value = getattr(node, name, None)
+            if value is None:
+                columns[name].append(-1)
+                continue
+            key = marshal.dumps(value)
+            index = indices.get(key)
+            if index is None:
+                index = indices[key] = len(table)
+                table.append(value)
+            columns[name].append(index)
+        for name in _INT_FIELDS:
+            value = getattr(node, name, None)
+            columns[name].append(-1 if value is None else value)
+
+    payload = (_SNAPSHOT_FORMAT, root.gui, root.version, root.order, table,
+               [(name, zlib.compress(column.tostring())) for name, column in columns.items()])
+
+    def write(temp):
+        snapshot = open(temp, 'wb')
+        try:
+            snapshot.write(_SNAPSHOT_MAGIC)
+            marshal.dump(payload, snapshot)
+        finally:
+            snapshot.close()
+
+    _replace_atomic(path, write)
+    return path
+
+
+def load_snapshot(path, nodeclass=AnyNode):
+    # Rebuild the tree saved by save_snapshot, of AnyNode nodes as Page builds by default. nodeclass=StoreNode is the
+    # fast one: its SessionStore arrays are read straight from the snapshot instead of making a Python object per
+    # node; SessionNode and AnyNode take about as long as building the tree. Returns a Snapshot; its handles
+    # (Snapshot.pages, .windows, ...) work with the State setters and the builders as the ones the builders returned.
+    snapshot = open(path, 'rb')
+    try:
+        if snapshot.read(len(_SNAPSHOT_MAGIC)) != _SNAPSHOT_MAGIC:
+            raise ValueError(path + ' is not a dotmvw snapshot')
+        payload = marshal.load(snapshot)
+    finally:
+        snapshot.close()
+    format, gui, version, order, table, columns = payload
+    if format != _SNAPSHOT_FORMAT:
+        raise ValueError('unsupported snapshot format ' + repr(format))
+    columns = dict((name, array('i', zlib.decompress(column))) for name, column in columns)
+    table.append(None)  # index -1
+    fields = {}
+
+    def field(name):  # column of values, None for -1
+        if name not in fields:
+            if name in _STRING_FIELDS:
+                fields[name] = map(table.__getitem__, columns[name])
+                if name == 'data':  # the table shares values between nodes
+                    fields[name] = [list(data) if data.__class__ is list else data for data in fields[name]]
+            else:
+                fields[name] = [None if value < 0 else value for value in columns[name]]
+        return fields[name]
+
+    return _build_tree(gui, version, order, field, columns, nodeclass)
+
+
+def _build_tree(gui, version, order, field, columns, nodeclass):
+    # the tree and handles of load_snapshot and read_mvw, from per-node columns in document order: field(name) is the
+    # list of values of a node attribute (None where unset), columns the int arrays parent, first_child, last_child,
+    # next_sibling, level, N, num and rev (-1 where unset). Returns a Snapshot.
+    parents = columns['parent']
+    count = len(parents)
+    if nodeclass is StoreNode:  # straight into the arrays
+        store = SessionStore.from_columns(gui, version, field('id'), field('type'), field('data'), parents=parents,
+                                          first_child=columns['first_child'], last_child=columns['last_child'],
+                                          next_sibling=columns['next_sibling'], levels=columns['level'],
+                                          orders=columns['N'], nums=columns['num'])
+        store.order = order
+        store.revs = dict((index, rev) for index, rev in enumerate(columns['rev']) if rev > 0)
+        nodes = [StoreNode.handle(store, index) for index in range(count)]
+    elif nodeclass is SessionNode:  # positional arguments in the order of SessionNode.__init__, parents linked after
+        none = itertools.repeat(None, count)
+        nodes = map(SessionNode, field('id'), field('type'), none, field('oc'), field('level'), field('N'),
+                    field('data'), none, none, field('instance'), none, *[field(name) for name in _STRING_FIELDS[3:]])
+        for node, parent in zip(nodes[1:], parents[1:]):
+            node.parent = nodes[parent]
+        for node, rev in zip(nodes, columns['rev']):
+            if rev > 0:
+                node.rev = rev
+        nodes[0].gui = gui
+        nodes[0].version = version
+        nodes[0].order = order
+    else:
+        names = _STRING_FIELDS + _INT_FIELDS[:-1]
+        nodes = []
+        for parent, args in zip(parents, zip(*[field(name) for name in names])):
+            kwargs = dict(zip(names, args))
+            if parent < 0:
+                nodes.append(nodeclass(parent=None, gui=gui, version=version, order=order, **kwargs))
+            else:
+                nodes.append(nodeclass(parent=nodes[parent], **kwargs))
+        for node, rev in zip(nodes, columns['rev']):
+            if rev > 0:
+                node.rev = rev
+
+    # the handles: every page, window, ... node starts one, and the nodes below it up to the next one fill it in
+    loaded = Snapshot(None)
+    names = dict((type, dict((name.lower(), name) for name in vars(handle) if not name.startswith('_')))
+                 for type, handle in _HANDLES.items())
+    owners = []  # (handle, its attribute names) each node belongs to
+    for index, type in enumerate(field('type')):
+        node = nodes[index]
+        parent = parents[index]
+        owner = owners[parent] if parent >= 0 else None
+        handle = _HANDLES.get(type)
+        if handle is not None:
+            owner = (handle(), names[type])
+            owner[0].Root = node
+            getattr(loaded, type + 's').append(owner[0])
+        elif owner is not None:
+            name = _HANDLE_NAMES.get(type) or owner[1].get(type)
+            if name is not None:
+                setattr(owner[0], name, node)
+        owners.append(owner)
+    loaded.root = nodes[0]
+    return loaded
+
+
+_ID_LINE = re.compile(r'\*Id\("(.*)", "(.*)\.\*"\)$')
+_FILE_LINE = re.compile(r'\{ (GRAPHIC|RESULT)_FILE_(\d+) = "(.*)"\}$')
+_FILE_TYPES = {'GRAPHIC': 'graphics_files', 'RESULT': 'results_files'}
+
+
+def _session_lines(path, blocksize=1 << 20):
+    # the lines of a session file without line ends, read in blocks through an mmap (or through the codec for .gz,
+    # .bz2 and .xz files). The empty line after the last newline is not yielded.
+    ext = os.path.splitext(path)[1][1:]
+    mapped = None
+    if ext in _COMPRESSIONS:
+        session = _open_session(path, 'r', ext)
+        read = session.read
+    else:
+        session = open(path, 'rb')
+        size = os.fstat(session.fileno()).st_size
+        if size:
+            mapped = mmap.mmap(session.fileno(), size, access=mmap.ACCESS_READ)
+            read = mapped.read
+        else:
+            read = lambda size: ''
+    try:
+        rest = ''
+        while True:
+            block = read(blocksize)
+            if not block:
+                break
+            if '\r' in block:
+                block = block.replace('\r', '')
+            lines = (rest + block).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+    finally:
+        if mapped is not None:
+            mapped.close()
+        session.close()
+
+
+def _parse_line(candidates, text, parent_type, sibling_types):
+    # (type, block, data, num) of a line the registered templates render, or None. When several templates render
+    # alike (*BeginSelection, *Add, *FillColor) the one the builders use under this parent wins (groupselection under
+    # group), else the first not used by a sibling yet (fillcolor, then textcolor), else the first that matches.
+    matching = []
+    for type, block, fields, match in candidates:
+        values = match(text)
+        if values is not None:
+            matching.append((type, block, fields, values))
+    if not matching:
+        return None
+    found = matching[0]
+    if len(matching) > 1:
+        for candidate in matching:
+            if candidate[0].startswith(parent_type):
+                found = candidate
+                break
+        else:
+            for candidate in matching:
+                if candidate[0] not in sibling_types:
+                    found = candidate
+                    break
+
+    type, block, fields, values = found
+    if values.__class__ is not list:
+        values = [values]
+    data = None
+    num = None
+    indexed = []
+    for field, value in zip(fields, values):
+        if field == 'data':
+            data = value
+        elif field[:5] == 'data[':
+            indexed.append(value)
+        elif value.isdigit():  # page_num or window_num
+            num = int(value)
+    if indexed:
+        data = tuple(indexed)
+    return type, block, data, num
+
+
+_END = ('end', False, None, None)
+
+
+def read_mvw(path, nodeclass=AnyNode):
+    # Load a .mvw session (plain, or .gz/.bz2/.xz) into a dotmvw tree in one streaming pass: *Begin lines open a
+    # block, *End lines close it, every other line is a leaf. Lines are matched against the registered templates, so
+    # they get the node types, levels and order the builders give them and Write.mvw writes the session back as it
+    # was read. Lines no template matches are kept verbatim as raw nodes, unknown *Begin/*End pairs as rawblock
+    # nodes. Entity numbers come from the // Page and // Window comments, or count the entities of a type under
+    # the same parent. The nodes are AnyNode unless nodeclass says otherwise; StoreNode reads fastest. Returns a
+    # Snapshot, with the handles of every page, window, ... as load_snapshot does.
+    lines = _session_lines(path)
+    header = next(lines, None)
+    found = _ID_LINE.match(next(lines, ''))
+    if header != '{ safe_quotes_on }' or found is None:
+        raise ValueError(path + ' is not a HyperView session')
+    gui, version = found.groups()
+
+    types = ['root']
+    datas = [None]
+    parents = [-1]
+    levels = [0]
+    nums = [-1]  # entity number, from the templates or counted
+    owners = [-1]  # the page, window, ... each node belongs to
+    first_child = [-1]
+    last_child = [-1]
+    next_sibling = [-1]
+    instances = {}  # index -> instance of the file nodes
+    counts = {}  # (parent, type) -> entities of type under parent so far
+    files = {}
+    known = {}  # line -> (type, block, data, num) of the lines that parse alike wherever they are
+    stack = [0]
+
+    for line in lines:
+        parent = stack[-1]
+        parsed = known.get(line)
+        if parsed is None:
+            text = line.lstrip('\t')
+            if text[:4] == '*End':
+                parsed = known[line] = _END
+            else:
+                if text[:1] == '*':
+                    candidates = _PARSERS.get(text[:text.find('(') + 1])
+                else:
+                    candidates = _PARSERS.get(text[:1])
+                if candidates is None:
+                    parsed = None
+                elif len(candidates) == 1:
+                    parsed = known[line] = _parse_line(candidates, text, None, None)
+                else:
+                    siblings = []
+                    child = first_child[parent]
+                    while child >= 0:
+                        siblings.append(types[child])
+                        child = next_sibling[child]
+                    parsed = _parse_line(candidates, text, types[parent], siblings)
+                if parsed is None:
+                    found = _FILE_LINE.match(text) if parent == 0 else None
+                    if found is not None:
+                        label, instance, name = found.groups()
+                        data = files.setdefault(label, [])
+                        instance = int(instance)
+                        data.extend([None] * (instance + 1 - len(data)))
+                        data[instance] = name
+                        instances[len(types)] = instance
+                        parsed = (_FILE_TYPES[label], False, data, instance)
+                    else:
+                        parsed = known[line] = ('rawblock' if text[:6] == '*Begin' else 'raw', text[:6] == '*Begin',
+                                                line, None)
+        if parsed is _END:
+            if parent:
+                stack.pop()
+                if types[parent] == 'rawblock':
+                    datas[parent] = (datas[parent], line)
+                continue
+            parsed = ('raw', False, line, None)
+
+        type, block, data, num = parsed
+        index = len(types)
+        types.append(type)
+        datas.append(data)
+        parents.append(parent)
+        levels.append(levels[parent] + 1 if parent else 0)
+        first_child.append(-1)
+        last_child.append(-1)
+        next_sibling.append(-1)
+        if last_child[parent] < 0:
+            first_child[parent] = index
+        else:
+            next_sibling[last_child[parent]] = index
+        last_child[parent] = index
+        if type in _HANDLES:
+            if num is None:
+                num = counts.get((parent, type), 0)
+                counts[(parent, type)] = num + 1
+            nums.append(num)
+            owners.append(index)
+        else:
+            owner = owners[parent]
+            if num is None:
+                num = -1 if owner < 0 else nums[owner]
+            nums.append(num)
+            owners.append(owner)
+        if block:
+            stack.append(index)
+    if len(stack) > 1:
+        raise ValueError('%s ends inside %d unclosed blocks' % (path, len(stack) - 1))
+
+    count = len(types)
+    ids = [type if num < 0 else type + str(num) for type, num in zip(types, nums)]
+    numfields = [None if owner < 0 else types[owner] + '_num' for owner in owners]
+    for index in instances:
+        numfields[index] = None
+    fields = {'id': ids, 'type': types, 'data': datas, 'level': levels, 'N': range(count),
+              'instance': [instances.get(index) for index in range(count)]}
+
+    def field(name):
+        if name not in fields:
+            if name.endswith('_num'):
+                fields[name] = [str(num) if numfield == name else None for num, numfield in zip(nums, numfields)]
+            else:
+                fields[name] = [None] * count
+        return fields[name]
+
+    columns = {'parent': parents, 'first_child': first_child, 'last_child': last_child, 'next_sibling': next_sibling,
+               'level': levels, 'N': range(count), 'num': nums, 'rev': [-1] * count}
+    return _build_tree(gui, version, count - 1, field, columns, nodeclass)
+
+
+_INDEX_MAGIC = 'DOTMVW INDEX\n'
+_INDEX_FORMAT = 1
+_PAGE_START = '\n*BeginPage('
+_PAGE_END = '\n*EndPage()'
+_FILE_TABLE = re.compile(r'^\{ (GRAPHIC|RESULT)_FILE_(\d+) = "(.*)"\}\r?$\n?', re.M)
+
+
+class SessionIndex(object):
+    # What index_mvw returns: where things are in a written session. pages holds the (offset, length) of every
+    # *BeginPage() ... *EndPage() span, line ends included, files that of the GRAPHIC_FILE/RESULT_FILE table (None if
+    # the session has none) and graphics_files and results_files the paths in it. size and mtime are those of the
+    # session the index was built from, to tell a stale sidecar.
+    def __init__(self, size, mtime, files, graphics_files, results_files, pages):
+        self.size = size
+        self.mtime = mtime
+        self.files = files
+        self.graphics_files = graphics_files
+        self.results_files = results_files
+        self.pages = pages
+
+    def fresh(self, path):
+        stat = os.stat(path)
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+
+def _index_session(path):
+    # scan a plain session for its page spans and file table. Only the lines before the first page are parsed, the
+    # pages are found with mmap.find.
+    if os.path.splitext(path)[1][1:] in _COMPRESSIONS:
+        raise ValueError(path + ' is compressed; only plain sessions can be indexed')
+    session = open(path, 'rb')
+    try:
+        stat = os.fstat(session.fileno())
+        if not stat.st_size:
+            raise ValueError(path + ' is not a HyperView session')
+        mapped = mmap.mmap(session.fileno(), stat.st_size, access=mmap.ACCESS_READ)
+        try:
+            if mapped[:18] != '{ safe_quotes_on }':
+                raise ValueError(path + ' is not a HyperView session')
+            start = mapped.find(_PAGE_START)
+            header = mapped[:stat.st_size if start < 0 else start + 1]
+            pages = []
+            while start >= 0:
+                end = mapped.find(_PAGE_END, start + 1)
+                if end < 0:
+                    raise ValueError('%s: page %d is not closed' % (path, len(pages)))
+                end = mapped.find('\n', end + 1)
+                end = stat.st_size if end < 0 else end + 1
+                pages.append((start + 1, end - start - 1))
+                start = mapped.find(_PAGE_START, end - 1)
+        finally:
+            mapped.close()
+    finally:
+        session.close()
+
+    table = list(_FILE_TABLE.finditer(header))
+    files = (table[0].start(), table[-1].end() - table[0].start()) if table else None
+    paths = {'GRAPHIC': [], 'RESULT': []}
+    for found in table:
+        label, num, name = found.groups()
+        num = int(num)
+        paths[label].extend([None] * (num + 1 - len(paths[label])))
+        paths[label][num] = name
+    return SessionIndex(stat.st_size, stat.st_mtime, files, paths['GRAPHIC'], paths['RESULT'], pages)
+
+
+def _save_index(path, index):
+    payload = (_INDEX_FORMAT, index.size, index.mtime, index.files, index.graphics_files, index.results_files,
+               index.pages)
+
+    def write(temp):
+        sidecar = open(temp, 'wb')
+        try:
+            sidecar.write(_INDEX_MAGIC)
+            marshal.dump(payload, sidecar)
+        finally:
+            sidecar.close()
+
+    _replace_atomic(path + '.index', write)
+
+
+def index_mvw(path):
+    # Index the pages of a written plain .mvw session for read_page, extract_pages and replace_page, which then seek
+    # to a page instead of parsing the session. The index is saved next to the session as path + '.index'. Returns
+    # the SessionIndex.
+    index = _index_session(path)
+    _save_index(path, index)
+    return index
+
+
+def _read_index(path):
+    # the SessionIndex of path from its sidecar, None if there is none or the session changed since it was saved
+    try:
+        sidecar = open(path + '.index', 'rb')
+    except IOError:
+        return None
+    try:
+        if sidecar.read(len(_INDEX_MAGIC)) != _INDEX_MAGIC:
+            raise ValueError(path + '.index is not a dotmvw index')
+        payload = marshal.load(sidecar)
+    finally:
+        sidecar.close()
+    if payload[0] != _INDEX_FORMAT:
+        return None
+    index = SessionIndex(*payload[1:])
+    return index if index.fresh(path) else None
+
+
+def load_index(path):
+    # The SessionIndex of path from its sidecar, or from index_mvw(path) if there is none or the session changed
+    # since it was saved
+    return _read_index(path) or index_mvw(path)
+
+
+def _copy_range(source, target, offset, length, blocksize=1 << 20):
+    # copy length bytes from offset in the open file source to the open file target
+    source.seek(offset)
+    while length > 0:
+        block = source.read(min(length, blocksize))
+        if not block:
+            break
+        target.write(block)
+        length = length - len(block)
+
+
+def read_page(path, num, index=None):
+    # The text of page num (its position in the session, from 0) of a written session, line ends included, read by
+    # seek and read through the index (load_index(path) if not given)
+    if index is None:
+        index = load_index(path)
+    offset, length = index.pages[num]
+    session = open(path, 'rb')
+    try:
+        session.seek(offset)
+        return session.read(length)
+    finally:
+        session.close()
+
+
+def extract_pages(path, nums, name, writedir, index=None, fsync='none'):
+    # Write pages nums of a written session into a smaller session writedir/name: the lines before the first page
+    # (file table, session title and palette), the pages in the order given and the lines after the last page. The
+    # pages are copied by seek and read through the index (load_index(path) if not given). Returns the new path.
+    if index is None:
+        index = load_index(path)
+    spans = [index.pages[num] for num in nums]
+    head = index.pages[0][0] if index.pages else index.size
+    tail = sum(index.pages[-1]) if index.pages else index.size
+    target = os.path.join(writedir, name)
+
+    def write(temp):
+        session = open(path, 'rb')
+        extracted = open(temp, 'wb')
+        try:
+            _copy_range(session, extracted, 0, head)
+            for offset, length in spans:
+                _copy_range(session, extracted, offset, length)
+            _copy_range(session, extracted, tail, index.size - tail)
+        finally:
+            extracted.close()
+            session.close()
+
+    _replace_atomic(target, write, fsync)
+    return target
+
+
+def replace_page(path, num, page, index=None, fsync='none'):
+    # Replace page num of a written session with page, its text or a page node to render. A page of the same length
+    # is overwritten in place; otherwise the session is rewritten atomically, the bytes around the page copied in
+    # blocks. The index (load_index(path) if not given) is updated and saved. Returns the new SessionIndex.
+    if index is None:
+        index = load_index(path)
+    if not isinstance(page, basestring):
+        page = '\n'.join(_subtree_lines(page))
+    if not page.endswith('\n'):
+        page = page + '\n'
+    offset, length = index.pages[num]
+
+    if len(page) == length:
+        session = open(path, 'r+b')
+        try:
+            session.seek(offset)
+            session.write(page)
+            if fsync != 'none':
+                session.flush()
+                os.fsync(session.fileno())
+        finally:
+            session.close()
+        pages = index.pages
+    else:
+        def write(temp):
+            session = open(path, 'rb')
+            replaced = open(temp, 'wb')
+            try:
+                _copy_range(session, replaced, 0, offset)
+                replaced.write(page)
+                _copy_range(session, replaced, offset + length, index.size - offset - length)
+            finally:
+                replaced.close()
+                session.close()
+
+        _replace_atomic(path, write, fsync)
+        shift = len(page) - length
+        pages = index.pages[:num] + [(offset, len(page))] + [(start + shift, size) for start, size in
+                                                             index.pages[num + 1:]]
+    stat = os.stat(path)
+    index = SessionIndex(stat.st_size, stat.st_mtime, index.files, index.graphics_files, index.results_files, pages)
+    _save_index(path, index)
+    return index
+
+
+class SessionOffsets(object):
+    # What Write.offsets returns: the offset and length of the opening line of every node of a written session, in
+    # document order and looked up by node N. size and mtime are those of the file they were taken for, if given.
+    def __init__(self, keys, starts, lengths):
+        self.positions = dict((key, index) for index, key in enumerate(keys))
+        self.starts = starts
+        self.lengths = lengths
+        self.size = None
+        self.mtime = None
+
+    def stamp(self, path):
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+    def fresh(self, path):
+        stat = os.stat(path)
+        return stat.st_size == self.size and stat.st_mtime == self.mtime
+
+    def span(self, node):
+        index = self.positions[node.N]
+        return self.starts[index], self.lengths[index]
+
+
+def patch_mvw(path, offsets, edits, fsync='none'):
+    # Apply edits, (node, value) pairs as the State setters take them or a {node: value} mapping, to the tree and to
+    # the session written at path without rendering it again: only the opening lines of the edited nodes are
+    # rewritten, at the offsets Write recorded (mvw with offsets=True, or Write.offsets). If every line keeps its
+    # length they are overwritten in place; otherwise the file is rewritten atomically around them and the offsets
+    # after them are shifted. Returns offsets, updated for the patched file.
+    if offsets.size is not None and not offsets.fresh(path):
+        raise ValueError(path + ' changed since its offsets were taken')
+    if hasattr(edits, 'items'):
+        edits = edits.items()
+    edited = {}  # document position -> (node, value); the last edit of a node wins
+    for node, value in edits:
+        index = offsets.positions.get(node.N)
+        if index is None:
+            raise KeyError('%s is not in the offsets of %s' % (node.id, path))
+        edited[index] = (node, value)
+    patches = []
+    for index in sorted(edited):
+        node, value = edited[index]
+        _global_callback(node.type, (node, value))
+        patches.append((index, _get_block(node)[0]))
+
+    starts = offsets.starts
+    lengths = offsets.lengths
+    if all(len(line) == lengths[index] for index, line in patches):
+        session = open(path, 'r+b')
+        try:
+            for index, line in patches:
+                session.seek(starts[index])
+                session.write(line)
+            if fsync != 'none':
+                session.flush()
+                os.fsync(session.fileno())
+        finally:
+            session.close()
+    else:
+        size = os.path.getsize(path)
+
+        def write(temp):
+            session = open(path, 'rb')
+            patched = open(temp, 'wb')
+            try:
+                position = 0
+                for index, line in patches:
+                    _copy_range(session, patched, position, starts[index] - position)
+                    patched.write(line)
+                    position = starts[index] + lengths[index]
+                _copy_range(session, patched, position, size - position)
+            finally:
+                patched.close()
+                session.close()
+
+        _replace_atomic(path, write, fsync)
+        shift = 0
+        for k, (index, line) in enumerate(patches):
+            shift = shift + len(line) - lengths[index]
+            lengths[index] = len(line)
+            end = patches[k + 1][0] + 1 if k + 1 < len(patches) else len(starts)
+            if shift:
+                for i in range(index + 1, end):
+                    starts[i] = starts[i] + shift
+    if offsets.size is not None:
+        offsets.stamp(path)
+    return offsets
+
+
+_FILE_REFERENCE = re.compile(r'^([ \t]*\*Begin(?:Model|Result)\(\{)(GRAPHIC|RESULT)_FILE_(\d+)\}', re.M)
+
+
+def _copy_renumbered(source, target, offset, length, numbers, blocksize=1 << 20):
+    # _copy_range, with the {GRAPHIC_FILE_n} and {RESULT_FILE_n} references of *BeginModel and *BeginResult lines
+    # renumbered by numbers, {label: {n: new n}}; the same text anywhere else (a note, say) is left alone. Blocks are
+    # cut after their last newline, so every block starts a line and no reference is split between two.
+    def renumber(found):
+        start, label, num = found.groups()
+        num = numbers[label].get(num)
+        return found.group(0) if num is None else '%s%s_FILE_%s}' % (start, label, num)
+
+    source.seek(offset)
+    rest = ''
+    while length > 0:
+        block = source.read(min(length, blocksize))
+        if not block:
+            break
+        length = length - len(block)
+        block = rest + block
+        cut = block.rfind('\n') + 1 if length > 0 else len(block)
+        rest = block[cut:]
+        target.write(_FILE_REFERENCE.sub(renumber, block[:cut]))
+    if rest:
+        target.write(_FILE_REFERENCE.sub(renumber, rest))
+
+
+def merge_mvw(sources, name, writedir, fsync='none'):
+    # Merge the pages of written sessions into one session writedir/name without building their trees. sources are
+    # paths, or (path, page numbers) pairs to take only those pages, in that order. The header, palette and tail come
+    # from the first source. The GRAPHIC_FILE and RESULT_FILE tables of all sources become one table listing each
+    # path once, and the {GRAPHIC_FILE_n} and {RESULT_FILE_n} references in *BeginModel and *BeginResult lines are
+    # renumbered to it as the pages stream through in blocks; pages of a source whose numbers do not change are
+    # copied as they are. Pages are found through the page offset index (a fresh sidecar if there is one, otherwise
+    # the source is scanned), so the merge is one linear pass over the bytes. Returns a status dict: path, pages,
+    # bytes, graphics_files and results_files (the merged table).
+    jobs = []
+    tables = {'GRAPHIC': [], 'RESULT': []}
+    positions = {'GRAPHIC': {}, 'RESULT': {}}  # path -> its number in the merged table
+    for source in sources:
+        path, nums = (source, None) if isinstance(source, basestring) else source
+        index = _read_index(path) or _index_session(path)
+        spans = index.pages if nums is None else [index.pages[num] for num in nums]
+        numbers = {}
+        for label, files in (('GRAPHIC', index.graphics_files), ('RESULT', index.results_files)):
+            numbers[label] = {}
+            for num, file in enumerate(files):
+                if file is None:
+                    continue
+                if file not in positions[label]:
+                    positions[label][file] = len(tables[label])
+                    tables[label].append(file)
+                numbers[label][str(num)] = str(positions[label][file])
+        renumbered = any(num != new for label in numbers for num, new in numbers[label].items())
+        ranges = []  # the spans, neighbouring ones joined
+        for offset, length in spans:
+            if ranges and sum(ranges[-1]) == offset:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((offset, length))
+        jobs.append((path, index, ranges, numbers if renumbered else None, len(spans)))
+    if not jobs:
+        raise ValueError('no sessions to merge')
+
+    first = jobs[0][1]
+    start = first.pages[0][0] if first.pages else first.size  # of the first page
+    tail = sum(first.pages[-1]) if first.pages else first.size  # after the last page
+    head, middle = (first.files[0], sum(first.files)) if first.files else (start, start)
+    table = ''.join('{ %s_FILE_%d = "%s"}\n' % (label, num, file) for label in ('GRAPHIC', 'RESULT')
+                    for num, file in enumerate(tables[label]))
+    target = os.path.join(writedir, name)
+
+    def write(temp):
+        merged = open(temp, 'wb')
+        header = open(jobs[0][0], 'rb')
+        try:
+            _copy_range(header, merged, 0, head)
+            merged.write(table)
+            _copy_range(header, merged, middle, start - middle)
+            for path, _, ranges, numbers, _ in jobs:
+                session = open(path, 'rb')
+                try:
+                    for offset, length in ranges:
+                        if numbers is None:
+                            _copy_range(session, merged, offset, length)
+                        else:
+                            _copy_renumbered(session, merged, offset, length, numbers)
+                finally:
+                    session.close()
+            _copy_range(header, merged, tail, first.size - tail)
+        finally:
+            header.close()
+            merged.close()
+
+    _replace_atomic(target, write, fsync)
+    return {'path': target, 'pages': sum(job[4] for job in jobs), 'bytes': os.path.getsize(target),
+            'graphics_files': tables['GRAPHIC'], 'results_files': tables['RESULT']}
 
 
 if __name__ == '__main__':
@@ -12,7 +12,7 @@ setuptools.setup(
 	long_description=long_description,
 	long_description_content_type="text/markdown",
 	url="https://github.com/yaonuma/dotmvw",
-	packages=setuptools.find_packages(),
+	packages=setuptools.find_packages(exclude=["tests"]),
 	classifiers=[
 		"Programming Language :: Python :: 2.7",
 		"License :: OSI Approved :: Apache Software License",
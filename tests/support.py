@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dotmvw import dotmvw as dm
+
+NODE_CLASSES = (dm.AnyNode, dm.SessionNode, dm.StoreNode)
+
+
+class Session(object):
+    # a small session and the States and handles to edit it
+    def __init__(self, nodeclass=dm.SessionNode, graphics=('model.h3d',), results=('model.op2',)):
+        self.pages_state = dm.PageState('HyperWorks', '19', list(graphics), list(results))
+        self.pages_root = dm.Page(self.pages_state, nodeclass=nodeclass)
+        self.model_state = dm.ModelState()
+        self.result_state = dm.ResultState()
+        self.legend_state = dm.LegendState()
+        self.note_state = dm.NoteState()
+        self.pages = []
+        self.models = []
+        self.legends = []
+
+    def add_pages(self, num_pages, file_num='0', note=None, models=1, parts=0):
+        windows_root = dm.Window(dm.WindowState())
+        graphics_root = dm.Graphic(dm.GraphicState())
+        models_root = dm.Model(self.model_state)
+        results_root = dm.Result(self.result_state)
+        parts_root = dm.Part(dm.PartState())
+        contours_root = dm.Contour(dm.ContourState())
+        legends_root = dm.Legend(self.legend_state)
+        notes_root = dm.Note(self.note_state)
+        for page in self.pages_root.add_pages(num_pages):
+            self.pages.append(page)
+            windows = windows_root.add_windows(1, page.Root, 1)
+            graphics = graphics_root.add_graphics(1, windows[0].Root)
+            for model in models_root.add_model(models, graphics[0].Root):
+                self.models.append(model)
+                self.model_state.graphic = (model.Root, file_num)
+                results = results_root.add_result(1, model.Root)
+                self.result_state.result = (results[0].Root, file_num)
+                if parts:
+                    parts_root.add_part(parts, model.Root)
+                contours = contours_root.add_contour(1, model.Root)
+                self.legends.extend(legends_root.add_legend(1, contours[0].Root))
+            if note is not None:
+                self.note_state.text = (notes_root.add_note(1, graphics[0].Root)[0].Text, note)
+        return self
+
+
+class SessionTestCase(unittest.TestCase):
+    # writes into a temporary directory that is removed after each test
+
+    def setUp(self):
+        self.writedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.writedir)
+
+    def write(self, session, name, cache=None, **kwargs):
+        writer = dm.Write(session) if cache is None else dm.Write(session, cache=cache)
+        return writer.mvw(name, self.writedir, **kwargs)
+
+    def text(self, path):
+        with open(path, 'rb') as session_file:
+            return session_file.read()
+
+    def leftovers(self):
+        return [name for name in os.listdir(self.writedir) if name.endswith('.tmp')]
+
+    def assertSameSession(self, path, session):
+        self.assertEqual(self.text(path), self.text(self.write(session, 'fresh.mvw')['path']))
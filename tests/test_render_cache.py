@@ -0,0 +1,30 @@
+import unittest
+
+from support import NODE_CLASSES, Session, SessionTestCase
+
+
+class RenderCacheTest(SessionTestCase):
+
+    def render(self, session, name, cache=4096, **kwargs):
+        return self.text(self.write(session, name, cache, **kwargs)['path'])
+
+    def test_cache_on_matches_cache_off(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(2, models=3)
+            for legend, value in zip(session.legends, (1, 1.0, True, '1', (1, 2), (1.0, 2), [1, 2])):
+                session.legend_state.legendmaxthreshold = (legend.LegendMaxThreshold, value)
+            expected = self.render(session.pages_root, 'off.mvw', cache=0)
+            self.assertEqual(self.render(session.pages_root, 'on.mvw'), expected)
+            self.assertEqual(self.render(session.pages_root, 'mmap.mvw', mmap=True), expected)
+
+    def test_equal_values_render_as_given(self):
+        session = Session().add_pages(1, models=3)
+        for legend, value in zip(session.legends, (1, 1.0, True)):
+            session.legend_state.legendmaxthreshold = (legend.LegendMaxThreshold, value)
+        lines = [line.strip() for line in self.render(session.pages_root, 'on.mvw').split('\n')
+                 if 'LegendMaxThreshold' in line]
+        self.assertEqual(lines, ['*LegendMaxThreshold(1)', '*LegendMaxThreshold(1.0)', '*LegendMaxThreshold(True)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
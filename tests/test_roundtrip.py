@@ -0,0 +1,66 @@
+import os
+import unittest
+
+from dotmvw import dotmvw as dm
+from support import NODE_CLASSES, Session, SessionTestCase
+
+
+class RoundTripTest(SessionTestCase):
+
+    def test_read_mvw(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(3)
+            for compress in (None, 'gz', 'bz2'):
+                path = self.write(session.pages_root, 'written.mvw', compress=compress)['path']
+                self.assertSameSession(self.write(dm.read_mvw(path, nodeclass), 'read.mvw')['path'],
+                                       session.pages_root)
+        self.assertIsInstance(dm.read_mvw(path).root, dm.AnyNode)
+
+    def test_patch_mvw(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(3)
+            status = self.write(session.pages_root, 'written.mvw', offsets=True)
+            offsets = status['offsets']
+            for value in ('5', '123456', '7'):  # same length, longer, shorter
+                edits = [(legend.NumCols, value) for legend in session.legends[1:]]
+                offsets = dm.patch_mvw(status['path'], offsets, edits)
+                self.assertSameSession(status['path'], session.pages_root)
+
+    def test_replace_page(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(3)
+            path = self.write(session.pages_root, 'written.mvw')['path']
+            index = dm.index_mvw(path)
+            for value in ('3', '4', '1234567'):
+                session.legend_state.numcols = (session.legends[1].NumCols, value)
+                index = dm.replace_page(path, 1, session.pages[1].Root, index)
+                self.assertSameSession(path, session.pages_root)
+                self.assertEqual(dm.load_index(path).pages, index.pages)
+
+    def test_extract_pages(self):
+        session = Session().add_pages(3)
+        path = self.write(session.pages_root, 'written.mvw')['path']
+        extracted = dm.extract_pages(path, [2], 'extracted.mvw', self.writedir)
+        self.assertEqual(self.text(extracted).count('*BeginPage()'), 1)
+        self.assertEqual(dm.read_page(extracted, 0), dm.read_page(path, 2))
+
+    def test_merge_mvw(self):
+        note = 'Model {GRAPHIC_FILE_0}, results {RESULT_FILE_0}'  # user text, not renumbered
+        first = Session(graphics=['a.h3d'], results=['a.op2']).add_pages(2)
+        second = Session(graphics=['b.h3d'], results=['b.op2']).add_pages(1, note=note)
+        status = dm.merge_mvw([self.write(first.pages_root, 'a.mvw')['path'],
+                               self.write(second.pages_root, 'b.mvw')['path']], 'merged.mvw', self.writedir)
+        self.assertEqual(status['pages'], 3)
+        expected = Session(graphics=['a.h3d', 'b.h3d'], results=['a.op2', 'b.op2']).add_pages(2)
+        self.assertSameSession(status['path'], expected.add_pages(1, '1', note).pages_root)
+
+    def test_merge_mvw_same_files(self):
+        path = self.write(Session().add_pages(2).pages_root, 'a.mvw')['path']
+        status = dm.merge_mvw([path, (path, [1, 0])], 'merged.mvw', self.writedir)
+        self.assertEqual(os.path.getsize(status['path']), status['bytes'])
+        pages = [dm.read_page(status['path'], num) for num in range(4)]
+        self.assertEqual(pages, [dm.read_page(path, num) for num in (0, 1, 1, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
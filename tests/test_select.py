@@ -0,0 +1,50 @@
+import unittest
+
+from dotmvw import dotmvw as dm
+from support import NODE_CLASSES, Session
+
+LEGENDS = 'page[*]/window[0]/graphic/model/contour/legend'
+
+
+class SelectTest(unittest.TestCase):
+
+    def test_paths(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(3, models=2)
+            root = session.pages_root.root
+            self.assertEqual(dm.select(root, 'page[1]'), [session.pages[1].Root])
+            self.assertEqual(dm.select(root, 'page'), [page.Root for page in session.pages])
+            self.assertEqual(dm.select(root, LEGENDS), [legend.Root for legend in session.legends])
+            self.assertEqual(dm.select(root, '*/window/graphic/model[1]'),
+                             [model.Root for model in session.models[1::2]])
+            self.assertEqual(dm.select(session.pages[2].Root, 'window/graphic/model[*]'),
+                             [model.Root for model in session.models[4:]])
+            self.assertEqual(dm.select(root, 'page[7]'), [])
+            with self.assertRaises(ValueError):
+                dm.select(root, 'page[-1]')
+
+    def test_index_follows_the_builders(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(1)
+            root = session.pages_root.root
+            self.assertEqual(len(dm.select(root, LEGENDS)), 1)  # indexes the path
+            session.add_pages(2)
+            contour = dm.select(root, 'page/window/graphic/model/contour')[0]
+            legends = dm.Legend(session.legend_state).add_legend(1, contour)
+            self.assertEqual(dm.select(root, LEGENDS),
+                             [legend.Root for legend in session.legends[:1] + legends + session.legends[1:]])
+
+    def test_ids_restart_with_each_builder_call(self):
+        # every add_* call numbers its entities from 0, so type[n] finds one from each call
+        session = Session().add_pages(2).add_pages(1)
+        root = session.pages_root.root
+        self.assertEqual(dm.select(root, 'page[0]'), [session.pages[0].Root, session.pages[2].Root])
+        model = session.models[0].Root
+        groups_root = dm.Group(dm.GroupState())
+        groups = groups_root.add_group(2, 1, model) + groups_root.add_group(1, 2, model)
+        self.assertEqual(dm.select(model, 'group[0]'), [groups[0].Root, groups[2].Root])
+        self.assertEqual(dm.select(model, 'group'), [group.Root for group in groups])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import marshal
+import os
+import unittest
+
+from dotmvw import dotmvw as dm
+from support import NODE_CLASSES, Session, SessionTestCase
+
+
+class SnapshotTest(SessionTestCase):
+
+    def test_round_trip(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(3, note='Note')
+            path = dm.save_snapshot(session.pages_root, os.path.join(self.writedir, 'session.snapshot'))
+            for loadclass in NODE_CLASSES:
+                loaded = dm.load_snapshot(path, loadclass)
+                self.assertIsInstance(loaded.root, loadclass)
+                self.assertEqual([len(loaded.pages), len(loaded.legends), len(loaded.notes)], [3, 3, 3])
+                self.assertSameSession(self.write(loaded, 'loaded.mvw')['path'], session.pages_root)
+                session.legend_state.numcols = (loaded.legends[1].NumCols, '7')  # the handles take edits
+                self.assertEqual(loaded.legends[1].NumCols.data, '7')
+            self.assertIsInstance(dm.load_snapshot(path).root, dm.AnyNode)
+
+    def test_unknown_format_is_rejected(self):
+        path = dm.save_snapshot(Session().add_pages(1).pages_root, os.path.join(self.writedir, 'session.snapshot'))
+        with open(path, 'rb') as snapshot:
+            magic = snapshot.read(len(dm._SNAPSHOT_MAGIC))
+            payload = marshal.load(snapshot)
+        with open(path, 'wb') as snapshot:
+            snapshot.write(magic)
+            marshal.dump((dm._SNAPSHOT_FORMAT + 1,) + payload[1:], snapshot)
+        with self.assertRaises(ValueError):
+            dm.load_snapshot(path)
+        with open(path, 'wb') as snapshot:
+            snapshot.write('{ safe_quotes_on }\n')
+        with self.assertRaises(ValueError):
+            dm.load_snapshot(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import gc
+import unittest
+import weakref
+
+from dotmvw import dotmvw as dm
+
+
+class BulkSetterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pages_state = dm.PageState('HyperWorks', '19', ['model.h3d'], ['model.h3d'])
+        self.pages_root = dm.Page(self.pages_state)
+        self.pages = self.pages_root.add_pages(4)
+
+    def test_same_value_on_every_node(self):
+        fonts = [page.TitleFont for page in self.pages]
+        self.pages_state.titlefont = (fonts, ('Noto Sans', 1, 0, 12))
+        self.assertEqual([font.data for font in fonts], [('Noto Sans', 1, 0, 12)] * 4)
+        self.pages_state.titlefont = dict.fromkeys(fonts, ['Arial', 1, 0, 10])
+        self.assertEqual([font.data for font in fonts], [['Arial', 1, 0, 10]] * 4)
+
+    def test_one_value_per_node(self):
+        titles = [page.Title for page in self.pages]
+        self.pages_state.title = (titles, dm.PerNode(['a', 'b', 'c', 'd']))
+        self.assertEqual([title.data for title in titles], ['a', 'b', 'c', 'd'])
+        with self.assertRaises(ValueError):
+            self.pages_state.title = (titles, dm.PerNode(['a']))
+
+    def test_list_value_is_refused(self):
+        fonts = [page.TitleFont for page in self.pages]
+        with self.assertRaises(ValueError):
+            self.pages_state.titlefont = (fonts, ['Arial', 1, 0, 12])
+        self.assertEqual([font.data for font in fonts], [('Arial', 1, 0, 12)] * 4)
+
+    def test_invalid_value_changes_nothing(self):
+        titles = [page.Title for page in self.pages]
+        self.pages_state.title = (titles[0], 'kept')
+        for mod in (([titles[1], 'notanode'], 'x'), ('notanode', 'x'), {titles[1]: 'x', 'notanode': 'y'}):
+            with self.assertRaises(ValueError):
+                self.pages_state.title = mod
+            self.assertEqual(self.pages_state.title, (titles[0], 'kept'))
+            self.assertEqual([title.data for title in titles], ['kept', 'Untitled', 'Untitled', 'Untitled'])
+
+    def test_batch(self):
+        titles = [page.Title for page in self.pages]
+        with self.pages_state.batch():
+            self.pages_state.title = (titles[0], 'x')
+            self.pages_state.title = (titles[2], 'y')
+            self.pages_state.title = (titles[0], 'z')
+        self.assertEqual([title.data for title in titles], ['z', 'Untitled', 'y', 'Untitled'])
+
+    def test_batch_rolls_back_on_error(self):
+        titles = [page.Title for page in self.pages]
+        fonts = [page.TitleFont for page in self.pages]
+        self.pages_state.title = (titles[0], 'kept')
+
+        def refuse(value):
+            raise RuntimeError('refused')
+
+        with self.assertRaises(RuntimeError):  # the block raises
+            with self.pages_state.batch():
+                self.pages_state.title = (titles[1], 'x')
+                raise RuntimeError('block')
+        self.pages_state.bind_to_titlefont(refuse)
+        with self.assertRaises(RuntimeError):  # titlefont fails after title is applied
+            with self.pages_state.batch():
+                self.pages_state.title = (titles[1], 'x')
+                self.pages_state.titlefont = (fonts[1], ('Noto Sans', 1, 0, 12))
+        self.assertEqual(self.pages_state.title, (titles[0], 'kept'))
+        self.assertEqual(self.pages_state.titlefont, ('Arial', 1, 0, 12))
+        self.assertEqual([title.data for title in titles], ['kept', 'Untitled', 'Untitled', 'Untitled'])
+        self.assertEqual([font.data for font in fonts], [('Arial', 1, 0, 12)] * 4)
+
+    def test_callbacks_bound_in_a_batch_see_the_applied_edits(self):
+        titles = [page.Title for page in self.pages]
+        seen = []
+        with self.pages_state.batch():
+            self.pages_state.bind_to_title(seen.append)
+            self.pages_state.title = (titles[0], 'x')
+            self.pages_state.title = (titles[1], 'y')
+            self.assertEqual(seen, [])
+        self.assertEqual(len(seen), 1)
+        nodes, values = seen[0]
+        self.assertEqual((nodes, values.values), ([titles[0], titles[1]], ['x', 'y']))
+        self.pages_state.title = (titles[2], 'z')
+        self.assertEqual(seen[1:], [(titles[2], 'z')])
+
+
+class ObserverTest(unittest.TestCase):
+
+    def test_edits_reach_the_tree_after_the_builders_are_gone(self):
+        pages_state = dm.PageState('HyperWorks', '19', ['model.h3d'], ['model.op2'])
+        pages_root = dm.Page(pages_state)
+        root = pages_root.root
+        page = pages_root.add_pages(1)[0]
+        windows = dm.Window(dm.WindowState()).add_windows(1, page.Root, 1)
+        graphics = dm.Graphic(dm.GraphicState()).add_graphics(1, windows[0].Root)
+        models = dm.Model(dm.ModelState()).add_model(1, graphics[0].Root)
+        contours = dm.Contour(dm.ContourState()).add_contour(1, models[0].Root)
+        legends_state = dm.LegendState()
+        legend = dm.Legend(legends_state).add_legend(1, contours[0].Root)[0]
+        del pages_root
+        gc.collect()
+        pages_state.sessiontitle = 'T2'
+        pages_state.results = ['other.op2']
+        legends_state.numcols = (legend.NumCols, '5')
+        self.assertEqual([node.data for node in root.children if node.type == 'sessiontitle'], ['T2'])
+        self.assertEqual([node.data for node in root.children if node.type == 'results_files'], [['other.op2']])
+        self.assertEqual(legend.NumCols.data, '5')
+
+    def test_builders_are_not_kept_alive(self):
+        legends_state = dm.LegendState()
+        builders = [dm.Legend(legends_state) for _ in range(10)]
+        self.assertEqual(len(legends_state._observers_numcols), 1)
+        builder = weakref.ref(builders[0])
+        del builders
+        gc.collect()
+        self.assertIsNone(builder())
+
+    def test_bound_methods_are_held_weakly(self):
+        class Listener(object):
+            def __init__(self):
+                self.values = []
+
+            def heard(self, value):
+                self.values.append(value)
+
+        legends_state = dm.LegendState()
+        listener = Listener()
+        legends_state.bind_to_legendtype(listener.heard)
+        legends_state.bind_to_legendtype(listener.heard)
+        legends_state.legendtype = 'Dynamic'
+        self.assertEqual(listener.values, ['Dynamic'])
+        values = listener.values
+        del listener
+        gc.collect()
+        legends_state.legendtype = 'Static'
+        self.assertEqual(values, ['Dynamic'])
+        legends_state.bind_to_legendtype(values.append)  # drops the collected one
+        self.assertEqual(len(legends_state._observers_legendtype), 1)
+
+    def test_builtin_methods_are_kept_once(self):
+        legends_state = dm.LegendState()
+        seen = []
+        legends_state.bind_to_legendtype(seen.append)
+        legends_state.bind_to_legendtype(seen.append)
+        legends_state.bind_to_legendtype([].append)
+        legends_state.legendtype = 'Dynamic'
+        self.assertEqual(seen, ['Dynamic'])
+        self.assertEqual(len(legends_state._observers_legendtype), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from dotmvw import dotmvw as dm
+from support import Session, SessionTestCase
+
+FIELDS = ('id', 'type', 'data', 'level', 'N')
+
+
+def nodes(node):
+    # (field values, number of children) of every node in document order
+    yield tuple(getattr(node, name, None) for name in FIELDS), len(node.children)
+    for child in node.children:
+        for entry in nodes(child):
+            yield entry
+
+
+class SessionStoreTest(SessionTestCase):
+
+    def build(self, nodeclass):
+        session = Session(nodeclass).add_pages(3, note='Note', models=2, parts=2)
+        dm.Group(dm.GroupState()).add_group(2, 1, session.models[0].Root)
+        legends = [legend.NumCols for legend in session.legends]
+        session.legend_state.numcols = (legends[0], '3')
+        session.legend_state.numcols = (legends[1:3], '4')
+        session.legend_state.numcols = (legends[3:], dm.PerNode(str(i) for i in range(len(legends) - 3)))
+        with session.legend_state.batch():
+            session.legend_state.legendtype = (session.legends[1].LegendType, 'Dynamic')
+            session.legend_state.numcols = (legends[0], '9')
+        session.pages_state.sessiontitle = 'Stored'
+        return session
+
+    def test_same_tree_and_output_as_anynode(self):
+        expected = self.build(dm.AnyNode)
+        stored = self.build(dm.StoreNode)
+        self.assertIsInstance(stored.pages_root.root.store, dm.SessionStore)
+        self.assertEqual(list(nodes(stored.pages_root.root)), list(nodes(expected.pages_root.root)))
+        self.assertSameSession(self.write(stored.pages_root, 'stored.mvw')['path'], expected.pages_root)
+
+    def test_handles_are_views_of_the_store(self):
+        stored = self.build(dm.StoreNode)
+        legend = stored.legends[0].NumCols
+        again = dm.select(stored.pages_root.root, 'page[0]/window/graphic/model[0]/contour/legend/numcols')
+        self.assertEqual(again, [legend])
+        self.assertEqual(hash(again[0]), hash(legend))
+        stored.legend_state.numcols = (again[0], '12')
+        self.assertEqual(legend.data, '12')
+        self.assertEqual(legend.parent, stored.legends[0].Root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import unittest
+
+from dotmvw import dotmvw as dm
+from support import NODE_CLASSES, Session, SessionTestCase
+
+
+class WriteTest(SessionTestCase):
+
+    def test_workers_and_mmap_match_a_serial_write(self):
+        for nodeclass in NODE_CLASSES:
+            built = Session(nodeclass).add_pages(5, models=2)
+            for i, legend in enumerate(built.legends):  # pages out of order would show
+                built.legend_state.numcols = (legend.NumCols, str(i))
+            session = built.pages_root
+            expected = self.text(self.write(session, 'serial.mvw', cache=0)['path'])
+            for workers in (2, 3):
+                self.assertEqual(self.text(self.write(session, 'workers.mvw', workers=workers)['path']), expected)
+                self.assertEqual(self.text(self.write(session, 'mmap.mvw', workers=workers, mmap=True)['path']),
+                                 expected)
+            self.assertEqual(self.text(self.write(session, 'mmap.mvw', mmap=True)['path']), expected)
+
+    def test_only_edited_pages_are_rendered_again(self):
+        for nodeclass in NODE_CLASSES:
+            session = Session(nodeclass).add_pages(4)
+            writer = dm.Write(session.pages_root)
+            for workers in (1, 2):
+                writer.mvw('reused.mvw', self.writedir, workers=workers)
+                self.assertEqual(writer.mvw('reused.mvw', self.writedir, workers=workers)['pages'], 0)
+                session.legend_state.numcols = (session.legends[2].NumCols, str(workers + 5))
+                graphic = dm.select(session.pages[1].Root, 'window/graphic')[0]
+                session.note_state.text = (dm.Note(session.note_state).add_note(1, graphic)[0].Text, 'new')
+                status = writer.mvw('reused.mvw', self.writedir, workers=workers)
+                self.assertEqual(status['pages'], 2)
+                self.assertSameSession(status['path'], session.pages_root)
+
+    def test_failed_write_keeps_the_old_file(self):
+        class Unprintable(object):
+            def __str__(self):
+                raise RuntimeError('cannot render')
+
+        session = Session().add_pages(3)
+        path = self.write(session.pages_root, 'kept.mvw')['path']
+        expected = self.text(path)
+        session.legend_state.numcols = (session.legends[2].NumCols, Unprintable())
+        for kwargs in ({}, {'compress': 'gz'}, {'mmap': True}, {'fsync': 'dir'}):
+            with self.assertRaises(RuntimeError):
+                self.write(session.pages_root, 'kept.mvw', **kwargs)
+            self.assertEqual(self.text(path), expected)
+            self.assertEqual(self.leftovers(), [])
+        self.assertFalse(os.path.exists(path + '.gz'))
+
+    def test_fsync_policies(self):
+        session = Session().add_pages(2).pages_root
+        expected = self.text(self.write(session, 'none.mvw')['path'])
+        for fsync in ('file', 'dir'):
+            self.assertEqual(self.text(self.write(session, fsync + '.mvw', fsync=fsync)['path']), expected)
+        with self.assertRaises(ValueError):
+            self.write(session, 'always.mvw', fsync='always')
+
+
+class MvwManyTest(SessionTestCase):
+
+    def setUp(self):
+        SessionTestCase.setUp(self)
+        self.sessions = [Session().add_pages(num_pages).pages_root for num_pages in (3, 1, 2)]
+
+    def check_batch(self, jobs, reports):
+        self.assertEqual([report['path'] for report in reports], [writedir + '/' + name for _, name, writedir in jobs])
+        for (session, name, writedir), report in zip(jobs, reports):
+            if report['done']:
+                self.assertIsNone(report['error'])
+                self.assertEqual(self.text(report['path']), self.text(self.write(session, 'serial.mvw')['path']))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_reports_in_job_order(self):
+        jobs = [(session, 'batch%d.mvw' % i, self.writedir) for i, session in enumerate(self.sessions)]
+        for render_workers in (1, 2):
+            for io_workers in (0, 1, 3):
+                reports = dm.Write.mvw_many(jobs, render_workers=render_workers, io_workers=io_workers, queuesize=1)
+                self.assertEqual([report['done'] for report in reports], [True] * 3)
+                self.check_batch(jobs, reports)
+
+    def test_failed_jobs_do_not_stop_the_batch(self):
+        missing = os.path.join(self.writedir, 'missing')
+        jobs = [(self.sessions[0], 'good0.mvw', self.writedir),
+                (object(), 'nosession.mvw', self.writedir),
+                (self.sessions[1], 'nodir.mvw', missing),
+                (self.sessions[2], 'good1.mvw', self.writedir)]
+        for render_workers in (1, 2):
+            reports = dm.Write.mvw_many(jobs, render_workers=render_workers, io_workers=2)
+            self.assertEqual([report['done'] for report in reports], [True, False, False, True])
+            self.assertEqual([report['error'] is None for report in reports], [True, False, False, True])
+            self.check_batch(jobs, reports)
+        self.assertFalse(os.path.exists(missing))
+
+    def test_io_workers_below_zero(self):
+        with self.assertRaises(ValueError):
+            dm.Write.mvw_many([(self.sessions[0], 'batch.mvw', self.writedir)], io_workers=-1)
+
+
+if __name__ == '__main__':
+    unittest.main()